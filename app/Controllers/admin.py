@@ -21,6 +21,8 @@ from app.Services.vector_db_context import PointNotFoundError
 from app.config import config
 from app.util.generate_uuid import generate_uuid_from_sha1
 from app.util.local_file_utility import VALID_IMAGE_EXTENSIONS
+from app.util.model_response import ModelResponse
+from app.util.storage_keys import stored_thumbnail_key
 
 admin_router = APIRouter(dependencies=[Depends(force_admin_token_verify)], tags=["Admin"])
 
@@ -41,8 +43,14 @@ async def delete_image(
 
     if config.storage.method.enabled:  # local image
         if point.local:
-            image_files = [itm[0] async for itm in
-                           services.storage_service.active_storage.list_files("", f"{point.id}.*")]
+            if point.storage_key is not None:
+                image_files = [PurePath(point.storage_key)] \
+                    if await services.storage_service.active_storage.is_exist(point.storage_key) else []
+            else:
+                # A point indexed before the storage keys were saved (see the v5 to v6 migration), which needs to
+                # list the storage to find its file
+                image_files = [itm[0] async for itm in
+                               services.storage_service.active_storage.list_files("", f"{point.id}.*")]
             assert len(image_files) <= 1
             if not image_files:
                 logger.warning("Image {} is a local image but not found in static folder.", point.id)
@@ -50,14 +58,14 @@ async def delete_image(
                 await services.storage_service.active_storage.move(image_files[0], f"_deleted/{image_files[0].name}")
                 logger.success("Image {} removed.", image_files[0].name)
         if point.thumbnail_url is not None and (point.local or point.local_thumbnail):
-            thumbnail_file = PurePath(f"thumbnails/{point.id}.webp")
+            thumbnail_file = PurePath(stored_thumbnail_key(point))
             if await services.storage_service.active_storage.is_exist(thumbnail_file):
                 await services.storage_service.active_storage.delete(thumbnail_file)
                 logger.success("Thumbnail {} removed.", thumbnail_file.name)
             else:
                 logger.warning("Thumbnail {} not found.", thumbnail_file.name)
 
-    return NekoProtocol(message="Image deleted.")
+    return ModelResponse(NekoProtocol(message="Image deleted."))
 
 
 @admin_router.put("/update_opt/{image_id}", description="Update a image's optional information")
@@ -88,7 +96,7 @@ async def update_image(image_id: Annotated[UUID, params.Path(description="The id
     await services.db_context.update_payload(point)
     logger.success("Image {} updated.", point.id)
 
-    return NekoProtocol(message="Image updated.")
+    return ModelResponse(NekoProtocol(message="Image updated."))
 
 
 IMAGE_MIMES = {
@@ -142,14 +150,15 @@ async def upload_image(image_file: Annotated[UploadFile, File(description="The i
                                index_date=datetime.now())
 
     await services.upload_service.queue_upload_image(mapped_image, img_bytes, model.skip_ocr, model.local_thumbnail)
-    return ImageUploadResponse(message="OK. Image added to upload queue.", image_id=img_id)
+    return ModelResponse(ImageUploadResponse(message="OK. Image added to upload queue.", image_id=img_id))
 
 
 @admin_router.get("/server_info", description="Get server information")
 async def server_info() -> ServerInfoResponse:
-    return ServerInfoResponse(message="Successfully get server information!",
-                              image_count=await services.db_context.get_counts(exact=True),
-                              index_queue_length=services.upload_service.get_queue_size())
+    return ModelResponse(ServerInfoResponse(message="Successfully get server information!",
+                                            image_count=await services.db_context.get_counts(exact=True),
+                                            index_queue_length=services.upload_service.get_queue_size(),
+                                            local_scan=getattr(services.search_service, 'scan_progress', None)))
 
 
 @admin_router.post("/duplication_validate",
@@ -161,7 +170,7 @@ async def duplication_validate(model: DuplicateValidationModel) -> DuplicateVali
     ids = [generate_uuid_from_sha1(t) for t in model.hashes]
     valid_ids = await services.db_context.validate_ids([str(t) for t in ids])
     exists_matrix = [str(t) in valid_ids or t in services.upload_service.uploading_ids for t in ids]
-    return DuplicateValidationResponse(
+    return ModelResponse(DuplicateValidationResponse(
         exists=exists_matrix,
         entity_ids=[(str(t) if exists else None) for (t, exists) in zip(ids, exists_matrix)],
-        message="Validation completed.")
+        message="Validation completed."))
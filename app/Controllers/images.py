@@ -1,21 +1,105 @@
-from fastapi import APIRouter, Depends, Query
-from fastapi.responses import JSONResponse
-from loguru import logger
 from typing import Optional
+from uuid import UUID
+
+from fastapi import APIRouter, Depends, Query, HTTPException, Path
+from fastapi.responses import JSONResponse, Response
+from loguru import logger
 
+from app.Models.api_models.images_api_model import SpriteSheetModel
+from app.Models.api_models.images_query_params import ScrollOrderEnum, VariantFormatEnum
 from app.Models.api_response.images_api_response import QueryImagesApiResponse
-from app.Models.query_params import FilterParams
-from app.Services.provider import ServiceProvider
+from app.Models.mapped_image import MappedImage
+from app.Models.query_params import FilterParams, PayloadProjectionParams, ResponseFormatParams, \
+    ConditionalRequestParams
+from app.Models.scroll_cursor import ScrollCursor
+from app.Services.image_variant_service import ImageVariantService, ImageNotStoredError
+from app.Services.provider import ServiceProvider, get_services
+from app.Services.storage.exception import RemoteFileNotFoundError, LocalFileNotFoundError
+from app.Services.vector_db_context import PointNotFoundError
 from app.config import config
+from app.util.http_cache import IMMUTABLE_CACHE_CONTROL, make_etag, etag_matches, not_modified_response
+from app.util.model_response import ModelResponse
+from app.util.ndjson_response import ndjson_response
+from app.util.response_projection import project_response
 
 images_router = APIRouter(tags=["Images"])
 
+
+@images_router.get("/resized/{image_id}", response_class=Response,
+                   responses={200: {"content": {f"image/{t.value}": {} for t in VariantFormatEnum}}},
+                   description="Get a resized variant of a stored image. It's generated on the first request, then "
+                               "served from a cache.")
+async def get_resized_image(
+    image_id: UUID = Path(description="The ID of the image."),
+    width: int = Query(ge=1, le=ImageVariantService.WIDTHS[-1],
+                       description="The width of the variant in pixels. It's rounded up to one of "
+                                   f"{', '.join(map(str, ImageVariantService.WIDTHS))}. "
+                                   "Images narrower than that are not upscaled."),
+    variant_format: VariantFormatEnum = Query(VariantFormatEnum.webp, alias="format",
+                                              description="The format of the variant."),
+    conditional: ConditionalRequestParams = Depends(),
+    services: ServiceProvider = Depends(get_services)
+):
+    if not services.image_variant_service.enabled:
+        raise HTTPException(501, "Image variants are disabled.")
+    width = ImageVariantService.snap_width(width)
+    # A variant never changes, since the image ID is derived from its content
+    etag = make_etag(image_id, width, variant_format)
+    if etag_matches(conditional.if_none_match, etag):
+        return not_modified_response(etag, IMMUTABLE_CACHE_CONTROL)
+    try:
+        image = await services.db_context.retrieve_by_id(str(image_id))
+        data = await services.image_variant_service.get_variant(image, width, variant_format)
+    except PointNotFoundError as ex:
+        raise HTTPException(404, "Cannot find the image with the given ID.") from ex
+    except (ImageNotStoredError, RemoteFileNotFoundError, LocalFileNotFoundError, FileNotFoundError) as ex:
+        raise HTTPException(404, "The original file of the image is not available.") from ex
+    return Response(data, media_type=f"image/{variant_format.value}",
+                    headers={'etag': etag, 'cache-control': IMMUTABLE_CACHE_CONTROL})
+
+
+@images_router.post("/sprites", description="Pack the thumbnails of a list of images into one sprite sheet. "
+                                             "Returns the URL of the sheet and the position of each image in it.")
+async def create_sprite_sheet(
+    model: SpriteSheetModel,
+    services: ServiceProvider = Depends(get_services)
+):
+    if not services.sprite_sheet_service.enabled:
+        raise HTTPException(501, "Sprite sheets are disabled.")
+    return ModelResponse(await services.sprite_sheet_service.get_sheet(model.ids, model.tile_height))
+
+
+@images_router.get("/sprites/{sprite_id}.webp", response_class=Response,
+                   responses={200: {"content": {"image/webp": {}}}},
+                   description="Get a sprite sheet image created by `POST /sprites`.")
+async def get_sprite_sheet(
+    sprite_id: str = Path(pattern=r'^[0-9a-f]{40}$', description="The ID of the sprite sheet."),
+    services: ServiceProvider = Depends(get_services)
+):
+    if not services.sprite_sheet_service.enabled:
+        raise HTTPException(501, "Sprite sheets are disabled.")
+    data = await services.sprite_sheet_service.get_sheet_image(sprite_id)
+    if data is None:
+        raise HTTPException(404, "Unknown sprite sheet, create it again with POST /sprites.")
+    # The content of a sheet is determined by its ID, which hashes the set of content-addressed images
+    return Response(data, media_type="image/webp", headers={'cache-control': IMMUTABLE_CACHE_CONTROL})
+
+
 @images_router.get("/scroll", response_model=QueryImagesApiResponse)
 async def scroll_images(
-    prev_offset_id: Optional[str] = Query(None, description="The last image ID from previous request"),
+    prev_offset_id: Optional[str] = Query(None, description="The `next_page_offset` of the previous request"),
     count: int = Query(10, description="Number of images to return", ge=1, le=100),
+    order: ScrollOrderEnum = Query(ScrollOrderEnum.id,
+                                   description="The order of the images: `id` (the engine's order), or by index date "
+                                               "from the `newest` or the `oldest`. The offsets of an order can't be "
+                                               "used with another."),
     filter_param: FilterParams = Depends(),
-    services: ServiceProvider = Depends(ServiceProvider)
+    projection: PayloadProjectionParams = Depends(),
+    response_format: ResponseFormatParams = Depends(),
+    limit: Optional[int] = Query(None, ge=1, description="Only for streamed (NDJSON) responses: the pages of `count` "
+                                                         "images are streamed one after another until `limit` images "
+                                                         "are sent. Stream to the last image if empty."),
+    services: ServiceProvider = Depends(get_services)
 ):
     """Scroll through images with pagination"""
     if config.local_search.enabled:
@@ -30,19 +114,80 @@ async def scroll_images(
             content={"message": "Database context not available"}
         )
 
+    if order != ScrollOrderEnum.id and prev_offset_id is not None:
+        try:
+            ScrollCursor.decode(prev_offset_id)
+        except ValueError:
+            raise HTTPException(400, "Invalid offset for this order.")
+
     try:
-        images, offset = await services.db_context.scroll_points(
-            str(prev_offset_id), 
-            count, 
-            filter_param=filter_param
-        )
-        return {
-            "images": images,
-            "next_page_offset": offset
-        }
+        if response_format.ndjson:
+            return await stream_images(services, order, prev_offset_id, count, limit, filter_param, projection)
+        images, offset = await scroll_page(services, order, prev_offset_id, count, filter_param, projection)
+        excluded = projection.excluded_fields
+        return project_response(
+            QueryImagesApiResponse(message=f"Successfully get {len(images)} images.",
+                                   images=images, next_page_offset=offset),
+            {'images': {'__all__': excluded}} if excluded is not None else None)
     except Exception as e:
         logger.error(f"Error scrolling images: {e}")
         return JSONResponse(
             status_code=500,
             content={"message": "Error scrolling images"}
         )
+
+
+async def scroll_page(services: ServiceProvider, order: ScrollOrderEnum, offset: str | None, count: int,
+                      filter_param: FilterParams, projection: PayloadProjectionParams) \
+        -> tuple[list[MappedImage], str | None]:
+    """
+    Scroll a page of images in the given order.
+    :param offset: The offset returned by the previous page, None to start from the first image.
+    :return: The images and the offset of the next page, None if there are no more images.
+    """
+    if order == ScrollOrderEnum.id:
+        return await services.db_context.scroll_points(offset, count, filter_param=filter_param,
+                                                       payload_fields=projection.fields)
+    images, cursor = await services.db_context.scroll_points_by_date(
+        ScrollCursor.decode(offset) if offset is not None else None,
+        count,
+        descending=order == ScrollOrderEnum.newest,
+        filter_param=filter_param,
+        payload_fields=projection.fields)
+    return images, cursor.encode() if cursor is not None else None
+
+
+async def stream_images(services: ServiceProvider, order: ScrollOrderEnum, offset: str | None, count: int,
+                        limit: int | None, filter_param: FilterParams, projection: PayloadProjectionParams):
+    """
+    Stream the scrolled images page by page, only one page is held in memory at a time.
+    The last page is shortened to stop at the limit, so that the offset sent continues from the first image left out.
+    """
+    state = {'sent': 0, 'offset': offset}
+
+    async def _next_page():
+        page, state['offset'] = await scroll_page(services, order, state['offset'],
+                                                  count if limit is None else min(count, limit - state['sent']),
+                                                  filter_param, projection)
+        state['sent'] += len(page)
+        return page
+
+    # The first page is fetched before the response starts, so that its errors get an error status
+    first_page = await _next_page()
+
+    async def _pages():
+        yield first_page
+        while state['offset'] is not None and (limit is None or state['sent'] < limit):
+            try:
+                yield await _next_page()
+            except Exception as e:
+                # The status has been sent, the stream is ended without the summary line
+                logger.error(f"Error scrolling images: {e}")
+                raise
+
+    return ndjson_response(
+        _pages(),
+        lambda: QueryImagesApiResponse(message=f"Successfully get {state['sent']} images.", images=[],
+                                       next_page_offset=state['offset']),
+        item_exclude=projection.excluded_fields,
+        summary_exclude={'images'})
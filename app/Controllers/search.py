@@ -1,27 +1,44 @@
+import random
 from io import BytesIO
 from typing import Annotated, List
 from uuid import uuid4, UUID
 
+import numpy
 from PIL import Image
 from fastapi import APIRouter, HTTPException
 from fastapi.params import File, Query, Path, Depends
 from loguru import logger
 
-from app.Models.api_models.search_api_model import AdvancedSearchModel, CombinedSearchModel, SearchBasisEnum
-from app.Models.api_response.search_api_response import SearchApiResponse
-from app.Models.query_params import SearchPagingParams, FilterParams
+from app.Models.api_models.search_api_model import AdvancedSearchModel, CombinedSearchModel, SearchBasisEnum, \
+    BatchSearchModel, VectorSearchModel
+from app.Models.api_response.search_api_response import SearchApiResponse, BatchSearchApiResponse
+from app.Models.errors import CursorMismatchError
+from app.Models.mapped_image import MappedImage
+from app.Models.query_params import SearchPagingParams, FilterParams, PayloadProjectionParams, ResponseFormatParams, \
+    ConditionalRequestParams
 from app.Models.search_result import SearchResult
+from app.Models.vector_query import VectorQuery
 from app.Services.authentication import force_access_token_verify
-from app.Services.provider import ServiceProvider
+from app.Services.provider import ServiceProvider, get_services
+from app.Services.search_cursor_service import PageQueryType
+from app.Services.vector_db_context import VectorDbContext
 from app.config import config
-from app.util.calculate_vectors_cosine import calculate_vectors_cosine
+from app.util.gather_bounded import gather_bounded
+from app.util.http_cache import make_etag, etag_matches, not_modified_response, REVALIDATE_CACHE_CONTROL
+from app.util.ndjson_response import ndjson_response
+from app.util.query_fingerprint import query_fingerprint
+from app.util.response_projection import project_response
+from app.util.storage_keys import image_storage_key, stored_image_key, stored_thumbnail_key
+from app.util.vector_rescoring import weighted_vector_query
+
+# The maximum number of presign requests sent to the storage at the same time
+PRESIGN_CONCURRENCY = 16
+# The number of results postprocessed and sent at a time in a streamed response
+STREAM_CHUNK_SIZE = 16
 
 search_router = APIRouter(dependencies=([Depends(force_access_token_verify)] if config.access_protected else None),
                           tags=["Search"])
 
-async def get_services():
-    from app.webapp import app
-    return app.state.services
 
 class SearchBasisParams:
     def __init__(self,
@@ -36,28 +53,118 @@ async def result_postprocessing(
         resp: SearchApiResponse,
         services: ServiceProvider = Depends(get_services)
     ) -> SearchApiResponse:
+    await postprocess_results(resp.result, services)
+    return resp
+
+
+async def postprocess_results(results: list[SearchResult], services: ServiceProvider):
     if not config.storage.method.enabled:
-        return resp
-    for item in resp.result:
-        # Handle local images
+        return
+    # The remote files to presign, each with the items (and the field of the item) using it
+    presign_targets: dict[str, list[tuple[MappedImage, str]]] = {}
+    storage = services.storage_service.active_storage
+    for item in results:
         if item.img.local:
-            # Use actual image filename from payload
-            filename = item.img.payload.get("filename")
-            if not filename:
-                logger.warning(f"Missing filename in payload for image {item.img.id}")
-                filename = f"{item.img.id}.{item.img.format or 'jpg'}"
-            item.img.url = f"/images/{filename}"
-            if item.img.local_thumbnail:
-                item.img.thumbnail_url = f"/images/thumbnails/{item.img.id}.webp"
-        else:
-            img_extension = item.img.format or item.img.url.split('.')[-1]
-            img_remote_filename = f"{item.img.id}.{img_extension}"
-            item.img.url = await services.storage_service.active_storage.presign_url(img_remote_filename)
-            if item.img.thumbnail_url is not None and item.img.local_thumbnail:
-                thumbnail_remote_filename = f"thumbnails/{item.img.id}.webp"
-                item.img.thumbnail_url = await services.storage_service.active_storage.presign_url(
-                    thumbnail_remote_filename)
-    return resp
+            # The files indexed from the local search directory are served under /images by their filename, the
+            # uploaded images from the storage, under the keys they were stored with
+            if filename := item.img.payload.get("filename"):
+                item.img.url = f"/images/{filename}"
+                if item.img.local_thumbnail:
+                    item.img.thumbnail_url = f"/images/thumbnails/{item.img.id}.webp"
+            else:
+                item.img.url = await storage.url(stored_image_key(item.img))
+                if item.img.local_thumbnail:
+                    item.img.thumbnail_url = await storage.url(stored_thumbnail_key(item.img))
+        elif item.img.url is not None:
+            img_remote_filename = item.img.storage_key or \
+                                  image_storage_key(item.img.id, item.img.format or item.img.url.split('.')[-1])
+            presign_targets.setdefault(img_remote_filename, []).append((item.img, 'url'))
+        if not item.img.local and item.img.thumbnail_url is not None and item.img.local_thumbnail:
+            presign_targets.setdefault(stored_thumbnail_key(item.img), []).append((item.img, 'thumbnail_url'))
+
+    urls = await gather_bounded((storage.presign_url(t) for t in presign_targets),
+                                PRESIGN_CONCURRENCY)
+    for targets, url in zip(presign_targets.values(), urls):
+        for img, field in targets:
+            setattr(img, field, url)
+
+
+def project_search_response(resp: SearchApiResponse, projection: PayloadProjectionParams):
+    excluded = projection.excluded_fields
+    return project_response(resp, {'result': {'__all__': {'img': excluded}}} if excluded is not None else None)
+
+
+def search_cache_control() -> str:
+    # Responses of a protected server must not be served by shared caches to clients without the token
+    return f"private, {REVALIDATE_CACHE_CONTROL}" if config.access_protected else REVALIDATE_CACHE_CONTROL
+
+
+def search_etag(services: ServiceProvider, fingerprint: str, paging: SearchPagingParams,
+                response_format: ResponseFormatParams) -> str:
+    """
+    The ETag of a search page, which changes with the query, the page, the format and every write to the collection.
+    It also changes with the epoch of the presign URLs, so a revalidated page never hands out expired URLs.
+    """
+    presign_epoch = services.storage_service.active_storage.presign_epoch() if config.storage.method.enabled else 0
+    return make_etag(services.cursor_service.generation, fingerprint, paging, response_format.accept, presign_epoch)
+
+
+async def build_search_response(results: list[SearchResult], next_cursor: str | None, services: ServiceProvider,
+                                projection: PayloadProjectionParams, response_format: ResponseFormatParams,
+                                etag: str | None = None):
+    resp = SearchApiResponse(result=results, message=f"Successfully get {len(results)} results.", query_id=uuid4(),
+                             next_cursor=next_cursor)
+    response = await _render_search_response(resp, services, projection, response_format)
+    if etag is not None:
+        response.headers['etag'] = etag
+        response.headers['cache-control'] = search_cache_control()
+    return response
+
+
+async def _render_search_response(resp: SearchApiResponse, services: ServiceProvider,
+                                  projection: PayloadProjectionParams, response_format: ResponseFormatParams):
+    results = resp.result
+    if not response_format.ndjson:
+        return project_search_response(await result_postprocessing(resp, services=services), projection)
+
+    async def _postprocessed_chunks():
+        for start in range(0, len(results), STREAM_CHUNK_SIZE):
+            chunk = results[start:start + STREAM_CHUNK_SIZE]
+            await postprocess_results(chunk, services)
+            yield chunk
+
+    excluded = projection.excluded_fields
+    return ndjson_response(_postprocessed_chunks(), lambda: resp,
+                           item_exclude={'img': excluded} if excluded is not None else None,
+                           summary_exclude={'result'})
+
+
+async def fetch_search_page(services: ServiceProvider, fingerprint: str, paging: SearchPagingParams,
+                            query: PageQueryType, limit: int | None = None) -> tuple[list[SearchResult], str | None]:
+    """
+    :param limit: The most results the query can serve, see check_page_limit. No cursor is issued past it.
+    """
+    if limit is not None:
+        check_page_limit(paging, limit)
+    try:
+        results, next_cursor = await services.cursor_service.fetch_page(fingerprint, paging, query)
+    except CursorMismatchError as ex:
+        raise HTTPException(400, str(ex)) from ex
+    if limit is not None and page_position(paging) + len(results) >= limit:
+        next_cursor = None
+    return results, next_cursor
+
+
+def page_position(paging: SearchPagingParams) -> int:
+    return paging.cursor.position if paging.cursor is not None else paging.skip
+
+
+def check_page_limit(paging: SearchPagingParams, limit: int):
+    """
+    Reject the pages past the first `limit` results of a query, which the query can't serve.
+    """
+    if page_position(paging) + paging.count > limit:
+        raise HTTPException(422, f"Only the first {limit} results of this query can be paged through.")
 
 
 @search_router.get("/text/{prompt}", description="Search images by text prompt")
@@ -67,33 +174,38 @@ async def textSearch(
         basis: Annotated[SearchBasisParams, Depends(SearchBasisParams)],
         filter_param: Annotated[FilterParams, Depends(FilterParams)],
         paging: Annotated[SearchPagingParams, Depends(SearchPagingParams)],
+        projection: Annotated[PayloadProjectionParams, Depends(PayloadProjectionParams)],
+        response_format: Annotated[ResponseFormatParams, Depends(ResponseFormatParams)],
+        conditional: Annotated[ConditionalRequestParams, Depends(ConditionalRequestParams)],
         exact: Annotated[bool, Query(
             description="If using OCR search, this option will require the ocr text contains **exactly** the "
                         "criteria you have given. This won't take any effect in vision search.")] = False,
         services: ServiceProvider = Depends(get_services)
 ) -> SearchApiResponse:
     logger.info("Text search request received, prompt: {}", prompt)
+    if basis.basis == SearchBasisEnum.vision:
+        # Vision search only returns the images tagged with the prompt, the tag filter is applied by the database
+        filter_param.query_text = prompt
+    elif exact:
+        filter_param.ocr_text = prompt
+
+    fingerprint = query_fingerprint("text", prompt, basis.basis, exact, filter_param, projection)
+    etag = search_etag(services, fingerprint, paging, response_format)
+    if etag_matches(conditional.if_none_match, etag):
+        return not_modified_response(etag, search_cache_control())
+
     text_vector = services.transformers_service.get_text_vector(prompt) if basis.basis == SearchBasisEnum.vision \
         else services.transformers_service.get_bert_vector(prompt)
-    
-    # Only set query_text for tag filtering if not OCR exact search
-    if not (basis.basis == SearchBasisEnum.ocr and exact):
-        filter_param.query_text = prompt.lower()  # Normalize to lowercase for tag matching
-    
-    results = await services.search_service.query_search(text_vector,
-                                                     query_vector_name=services.search_service.vector_name_for_basis(
-                                                        basis.basis),
-                                                     filter_param=filter_param,
-                                                     top_k=paging.count,
-                                                     skip=paging.skip)
-    
-    # Additional tag filtering for vision search
-    if basis.basis == SearchBasisEnum.vision and filter_param.query_text:
-        results = [r for r in results
-                  if r.img.tags and any(filter_param.query_text in tag.lower() for tag in r.img.tags)]
-    return await result_postprocessing(
-        SearchApiResponse(result=results, message=f"Successfully get {len(results)} results.", query_id=uuid4()),
-        services=services)
+    results, next_cursor = await fetch_search_page(
+        services, fingerprint, paging,
+        lambda top_k, skip: services.search_service.query_search(
+            text_vector,
+            query_vector_name=services.search_service.vector_name_for_basis(basis.basis),
+            filter_param=filter_param,
+            top_k=top_k,
+            skip=skip,
+            payload_fields=projection.fields))
+    return await build_search_response(results, next_cursor, services, projection, response_format, etag)
 
 
 @search_router.post("/image", description="Search images by image")
@@ -102,19 +214,49 @@ async def imageSearch(
                                      description="The image you want to search.")],
         filter_param: Annotated[FilterParams, Depends(FilterParams)],
         paging: Annotated[SearchPagingParams, Depends(SearchPagingParams)],
+        projection: Annotated[PayloadProjectionParams, Depends(PayloadProjectionParams)],
+        response_format: Annotated[ResponseFormatParams, Depends(ResponseFormatParams)],
         services: ServiceProvider = Depends(get_services)
 ) -> SearchApiResponse:
     fakefile = BytesIO(image)
     img = Image.open(fakefile)
     logger.info("Image search request received")
     image_vector = services.transformers_service.get_image_vector(img)
-    results = await services.search_service.query_search(image_vector,
-                                                     top_k=paging.count,
-                                                     skip=paging.skip,
-                                                     filter_param=filter_param)
-    return await result_postprocessing(
-        SearchApiResponse(result=results, message=f"Successfully get {len(results)} results.", query_id=uuid4()),
-        services=services)
+    results, next_cursor = await fetch_search_page(
+        services, query_fingerprint("image", image, filter_param, projection), paging,
+        lambda top_k, skip: services.search_service.query_search(image_vector,
+                                                                 top_k=top_k,
+                                                                 skip=skip,
+                                                                 filter_param=filter_param,
+                                                                 payload_fields=projection.fields))
+    return await build_search_response(results, next_cursor, services, projection, response_format)
+
+
+@search_router.post("/vector", description="Search images by precomputed embeddings, without running the models")
+async def vectorSearch(
+        model: VectorSearchModel,
+        basis: Annotated[SearchBasisParams, Depends(SearchBasisParams)],
+        filter_param: Annotated[FilterParams, Depends(FilterParams)],
+        paging: Annotated[SearchPagingParams, Depends(SearchPagingParams)],
+        projection: Annotated[PayloadProjectionParams, Depends(PayloadProjectionParams)],
+        response_format: Annotated[ResponseFormatParams, Depends(ResponseFormatParams)],
+        services: ServiceProvider = Depends(get_services)
+) -> SearchApiResponse:
+    logger.info("Vector search request received, {} vectors", len(model.vectors))
+    query_vector = weighted_vector_query(numpy.array([t.vector for t in model.vectors], dtype=numpy.float32),
+                                         [t.weight for t in model.vectors])
+    if not numpy.any(query_vector):
+        raise HTTPException(400, "The weighted vectors cancel each other out.")
+    results, next_cursor = await fetch_search_page(
+        services, query_fingerprint("vector", query_vector, basis.basis, filter_param, projection), paging,
+        lambda top_k, skip: services.search_service.query_search(
+            query_vector,
+            query_vector_name=services.search_service.vector_name_for_basis(basis.basis),
+            filter_param=filter_param,
+            top_k=top_k,
+            skip=skip,
+            payload_fields=projection.fields))
+    return await build_search_response(results, next_cursor, services, projection, response_format)
 
 
 @search_router.get("/similar/{image_id}",
@@ -125,18 +267,31 @@ async def similarWith(
         basis: Annotated[SearchBasisParams, Depends(SearchBasisParams)],
         filter_param: Annotated[FilterParams, Depends(FilterParams)],
         paging: Annotated[SearchPagingParams, Depends(SearchPagingParams)],
+        projection: Annotated[PayloadProjectionParams, Depends(PayloadProjectionParams)],
+        response_format: Annotated[ResponseFormatParams, Depends(ResponseFormatParams)],
+        conditional: Annotated[ConditionalRequestParams, Depends(ConditionalRequestParams)],
         services: ServiceProvider = Depends(get_services)
 ) -> SearchApiResponse:
     logger.info("Similar search request received, id: {}", image_id)
-    results = await services.search_service.query_similar(search_id=str(image_id),
-                                                       top_k=paging.count,
-                                                       skip=paging.skip,
-                                                       filter_param=filter_param,
-                                                       query_vector_name=services.search_service.vector_name_for_basis(
-                                                          basis.basis))
-    return await result_postprocessing(
-        SearchApiResponse(result=results, message=f"Successfully get {len(results)} results.", query_id=uuid4()),
-        services=services)
+    fingerprint = query_fingerprint("similar", image_id, basis.basis, filter_param, projection)
+    etag = search_etag(services, fingerprint, paging, response_format)
+    if etag_matches(conditional.if_none_match, etag):
+        return not_modified_response(etag, search_cache_control())
+    query_vector_name = services.search_service.vector_name_for_basis(basis.basis)
+
+    async def _query(top_k: int, skip: int) -> list[SearchResult]:
+        if filter_param.is_empty and (results := await services.neighbor_graph_service.query_similar(
+                str(image_id), query_vector_name, top_k, skip, projection.fields)) is not None:
+            return results
+        return await services.search_service.query_similar(search_id=str(image_id),
+                                                           top_k=top_k,
+                                                           skip=skip,
+                                                           filter_param=filter_param,
+                                                           query_vector_name=query_vector_name,
+                                                           payload_fields=projection.fields)
+
+    results, next_cursor = await fetch_search_page(services, fingerprint, paging, _query)
+    return await build_search_response(results, next_cursor, services, projection, response_format, etag)
 
 
 @search_router.post("/advanced", description="Search with multiple criteria")
@@ -145,55 +300,120 @@ async def advancedSearch(
         basis: Annotated[SearchBasisParams, Depends(SearchBasisParams)],
         filter_param: Annotated[FilterParams, Depends(FilterParams)],
         paging: Annotated[SearchPagingParams, Depends(SearchPagingParams)],
+        projection: Annotated[PayloadProjectionParams, Depends(PayloadProjectionParams)],
+        response_format: Annotated[ResponseFormatParams, Depends(ResponseFormatParams)],
         services: ServiceProvider = Depends(get_services)) -> SearchApiResponse:
     logger.info("Advanced search request received: {}", model)
-    result = await process_advanced_and_combined_search_query(model, basis, filter_param, paging)
-    return await result_postprocessing(
-        SearchApiResponse(result=result, message=f"Successfully get {len(result)} results.", query_id=uuid4()),
-        services=services)
+    result, next_cursor = await fetch_search_page(
+        services, query_fingerprint("advanced", model.model_dump(), basis.basis, filter_param, projection), paging,
+        lambda top_k, skip: process_advanced_and_combined_search_query(model, basis, filter_param, top_k, skip,
+                                                                       services, projection.fields))
+    return await build_search_response(result, next_cursor, services, projection, response_format)
 
 
-@search_router.post("/combined", description="Search with combined criteria")
+@search_router.post("/combined", description="Search with combined criteria. The results are ranked among the "
+                                              f"best {VectorDbContext.COMBINED_SEARCH_MAX_CANDIDATES} candidates, "
+                                              "so only that many results can be paged through.")
 async def combinedSearch(
         model: CombinedSearchModel,
         basis: Annotated[SearchBasisParams, Depends(SearchBasisParams)],
         filter_param: Annotated[FilterParams, Depends(FilterParams)],
         paging: Annotated[SearchPagingParams, Depends(SearchPagingParams)],
+        projection: Annotated[PayloadProjectionParams, Depends(PayloadProjectionParams)],
+        response_format: Annotated[ResponseFormatParams, Depends(ResponseFormatParams)],
         services: ServiceProvider = Depends(get_services)) -> SearchApiResponse:
     if not config.ocr_search.enable:
         raise HTTPException(400, "You used combined search, but it needs OCR search which is not "
                                  "enabled.")
     logger.info("Combined search request received: {}", model)
-    result = await process_advanced_and_combined_search_query(model, basis, filter_param, paging, True)
-    calculate_and_sort_by_combined_scores(model, basis, result)
-    result = result[:paging.count] if len(result) > paging.count else result
-    return await result_postprocessing(
-        SearchApiResponse(result=result, message=f"Successfully get {len(result)} results.", query_id=uuid4()),
-        services=services)
+    result, next_cursor = await fetch_search_page(
+        services, query_fingerprint("combined", model.model_dump(), basis.basis, filter_param, projection), paging,
+        lambda top_k, skip: process_advanced_and_combined_search_query(model, basis, filter_param, top_k, skip,
+                                                                       services, projection.fields),
+        limit=VectorDbContext.COMBINED_SEARCH_MAX_CANDIDATES)
+    return await build_search_response(result, next_cursor, services, projection, response_format)
+
+
+@search_router.post("/batch", description="Run multiple searches by text or vector in one request")
+async def batchSearch(
+        model: BatchSearchModel,
+        projection: Annotated[PayloadProjectionParams, Depends(PayloadProjectionParams)],
+        services: ServiceProvider = Depends(get_services)) -> BatchSearchApiResponse:
+    logger.info("Batch search request received, {} queries", len(model.queries))
+    queries = []
+    for item in model.queries:
+        if item.basis == SearchBasisEnum.ocr and not config.ocr_search.enable:
+            raise HTTPException(400, "OCR search is not enabled.")
+        if item.vector is not None:
+            query_vector = numpy.array(item.vector, dtype=numpy.float32)
+        elif item.basis == SearchBasisEnum.vision:
+            query_vector = services.transformers_service.get_text_vector(item.text)
+        else:
+            query_vector = services.transformers_service.get_bert_vector(item.text)
+        queries.append(VectorQuery(query_vector=query_vector,
+                                   query_vector_name=services.search_service.vector_name_for_basis(item.basis),
+                                   filter_param=item.filter.to_filter_params(),
+                                   top_k=item.count,
+                                   skip=item.skip))
+    results = await services.search_service.query_batch(queries, payload_fields=projection.fields)
+    for result in results:
+        await postprocess_results(result, services)
+    resp = BatchSearchApiResponse(result=results, message=f"Successfully get {len(results)} result lists.",
+                                  query_id=uuid4())
+    excluded = projection.excluded_fields
+    return project_response(resp, {'result': {'__all__': {'__all__': {'img': excluded}}}}
+                            if excluded is not None else None)
 
 
 @search_router.get("/random", description="Get random images")
 async def randomPick(
         filter_param: Annotated[FilterParams, Depends(FilterParams)],
         paging: Annotated[SearchPagingParams, Depends(SearchPagingParams)],
+        projection: Annotated[PayloadProjectionParams, Depends(PayloadProjectionParams)],
+        response_format: Annotated[ResponseFormatParams, Depends(ResponseFormatParams)],
+        conditional: Annotated[ConditionalRequestParams, Depends(ConditionalRequestParams)],
         seed: Annotated[int | None, Query(
             description="The seed for random pick. This is helpful for generating a reproducible random pick.")] = None,
         services: ServiceProvider = Depends(get_services),
 ) -> SearchApiResponse:
     logger.info("Random pick request received")
-    random_vector = services.transformers_service.get_random_vector(seed)
-    result = await services.search_service.query_search(random_vector, top_k=paging.count, skip=paging.skip,
-                                                     filter_param=filter_param)
-    return await result_postprocessing(
-        SearchApiResponse(result=result, message=f"Successfully get {len(result)} results.", query_id=uuid4()),
-        services=services)
+    # The sample is fetched from its start for every page, so its depth is bounded like the cursor windows
+    limit = services.cursor_service.max_window
+    # The images are a run of the random key order from a random pivot, which costs a cheap index lookup instead
+    # of a vector search over the whole collection. Collections not migrated yet use a random vector search.
+    sampling_ready = await services.search_service.random_sampling_ready()
+
+    async def _query(top_k: int, skip: int, query_seed: int) -> list[SearchResult]:
+        if sampling_ready:
+            return await services.search_service.query_random(query_seed, top_k=top_k, skip=skip,
+                                                              filter_param=filter_param,
+                                                              payload_fields=projection.fields)
+        return await services.search_service.query_search(services.transformers_service.get_random_vector(query_seed),
+                                                          top_k=top_k, skip=skip, filter_param=filter_param,
+                                                          payload_fields=projection.fields)
+
+    if seed is None:
+        # An unseeded pick is different on every request, so there is no next page to continue from (nor ETag)
+        check_page_limit(paging, limit)
+        result, next_cursor = await _query(paging.count, paging.skip, random.getrandbits(64)), None
+        etag = None
+    else:
+        fingerprint = query_fingerprint("random", seed, sampling_ready, filter_param, projection)
+        etag = search_etag(services, fingerprint, paging, response_format)
+        if etag_matches(conditional.if_none_match, etag):
+            return not_modified_response(etag, search_cache_control())
+        result, next_cursor = await fetch_search_page(services, fingerprint, paging,
+                                                      lambda top_k, skip: _query(top_k, skip, seed), limit)
+    return await build_search_response(result, next_cursor, services, projection, response_format, etag)
 
 
 async def process_advanced_and_combined_search_query(model: AdvancedSearchModel,
                                                      basis: SearchBasisParams,
                                                      filter_param: FilterParams,
-                                                     paging: SearchPagingParams,
-                                                     is_combined_search=False) -> List[SearchResult]:
+                                                     top_k: int,
+                                                     skip: int,
+                                                     services: ServiceProvider,
+                                                     payload_fields: list[str] | None = None) -> List[SearchResult]:
     match basis.basis:
         case SearchBasisEnum.ocr:
             positive_vectors = [services.transformers_service.get_bert_vector(t) for t in model.criteria]
@@ -203,23 +423,17 @@ async def process_advanced_and_combined_search_query(model: AdvancedSearchModel,
             negative_vectors = [services.transformers_service.get_text_vector(t) for t in model.negative_criteria]
         case _:  # pragma: no cover
             raise NotImplementedError()
-    # In order to ensure the query effect of the combined query, modify the actual top_k
-    _query_top_k = min(max(30, paging.count * 3), 100) if is_combined_search else paging.count
-    result = await services.search_service.query_similar(
-        query_vector_name=services.search_service.vector_name_for_basis(basis.basis),
-        positive_vectors=positive_vectors,
-        negative_vectors=negative_vectors,
-        mode=model.mode,
-        filter_param=filter_param,
-        with_vectors=is_combined_search,
-        top_k=_query_top_k,
-        skip=paging.skip)
-    return result
+    if not isinstance(model, CombinedSearchModel):
+        return await services.search_service.query_similar(
+            query_vector_name=services.search_service.vector_name_for_basis(basis.basis),
+            positive_vectors=positive_vectors,
+            negative_vectors=negative_vectors,
+            mode=model.mode,
+            filter_param=filter_param,
+            top_k=top_k,
+            skip=skip,
+            payload_fields=payload_fields)
 
-
-def calculate_and_sort_by_combined_scores(model: CombinedSearchModel,
-                                          basis: SearchBasisParams,
-                                          result: List[SearchResult]) -> None:
     # Use a different method to calculate the extra prompt vector based on the basis
     match basis.basis:
         case SearchBasisEnum.ocr:
@@ -228,17 +442,13 @@ def calculate_and_sort_by_combined_scores(model: CombinedSearchModel,
             extra_prompt_vector = services.transformers_service.get_bert_vector(model.extra_prompt)
         case _:  # pragma: no cover
             raise NotImplementedError()
-    # Calculate combined_similar_score (original score * similar_score) and write to SearchResult.score
-    for itm in result:
-        match basis.basis:
-            case SearchBasisEnum.ocr:
-                extra_vector = itm.img.image_vector
-            case SearchBasisEnum.vision:
-                extra_vector = itm.img.text_contain_vector
-            case _:  # pragma: no cover
-                raise NotImplementedError()
-        if extra_vector is not None:
-            similar_score = calculate_vectors_cosine(extra_vector, extra_prompt_vector)
-            itm.score = float((1 + similar_score) * itm.score)
-    # Finally, sort the result by combined_similar_score
-    result.sort(key=lambda i: i.score, reverse=True)
+    return await services.search_service.query_combined(
+        query_vector_name=services.search_service.vector_name_for_basis(basis.basis),
+        positive_vectors=positive_vectors,
+        negative_vectors=negative_vectors,
+        extra_vector=extra_prompt_vector,
+        mode=model.mode,
+        filter_param=filter_param,
+        top_k=top_k,
+        skip=skip,
+        payload_fields=payload_fields)
@@ -0,0 +1,11 @@
+from uuid import UUID
+
+from pydantic import BaseModel, Field
+
+
+class SpriteSheetModel(BaseModel):
+    ids: list[UUID] = Field(description="The IDs of the images to pack, e.g. a page of results. "
+                                        "The same set of IDs in any order gets the same sheet.",
+                            min_length=1,
+                            max_length=100)
+    tile_height: int = Field(128, ge=16, le=256, description="The height of the tiles in pixels.")
@@ -0,0 +1,13 @@
+from enum import Enum
+
+
+class ScrollOrderEnum(str, Enum):
+    id = "id"
+    newest = "newest"
+    oldest = "oldest"
+
+
+class VariantFormatEnum(str, Enum):
+    webp = "webp"
+    jpeg = "jpeg"
+    png = "png"
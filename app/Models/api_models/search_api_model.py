@@ -1,6 +1,9 @@
 from enum import Enum
+from typing import Optional, Annotated
 
-from pydantic import BaseModel, Field
+from pydantic import BaseModel, Field, model_validator
+
+from app.Models.query_params import FilterParams
 
 
 class SearchBasisEnum(str, Enum):
@@ -28,3 +31,66 @@ class AdvancedSearchModel(BaseModel):
 class CombinedSearchModel(AdvancedSearchModel):
     extra_prompt: str = Field(max_length=100,
                               description="The secondary prompt used for filtering the image.")
+
+
+class SearchFilterModel(BaseModel):
+    preferred_ratio: Optional[float] = Field(None, gt=0, description="The preferred aspect ratio of the image.")
+    ratio_tolerance: float = Field(0.1, gt=0, lt=1, description="The tolerance of the aspect ratio.")
+    min_width: Optional[int] = Field(None, ge=0, description="The minimum width of the image.")
+    min_height: Optional[int] = Field(None, ge=0, description="The minimum height of the image.")
+    starred: Optional[bool] = Field(None, description="Whether the image is starred.")
+    categories: Optional[list[str]] = Field(None,
+                                            description="The categories whitelist of the image. Image with **any of** "
+                                                        "the given categories will be included.")
+    categories_negative: Optional[list[str]] = Field(None,
+                                                     description="The categories blacklist of the image. Image with "
+                                                                 "**any of** the given categories will be ignored.")
+
+    def to_filter_params(self) -> FilterParams:
+        return FilterParams(preferred_ratio=self.preferred_ratio,
+                            ratio_tolerance=self.ratio_tolerance,
+                            min_width=self.min_width,
+                            min_height=self.min_height,
+                            starred=self.starred,
+                            categories=','.join(self.categories) if self.categories else None,
+                            categories_negative=','.join(self.categories_negative) if self.categories_negative
+                            else None)
+
+
+class BatchSearchQueryModel(BaseModel):
+    text: Optional[str] = Field(None, max_length=100,
+                                description="The prompt text to search with. Either `text` or `vector` is required.")
+    vector: Optional[list[float]] = Field(None, min_length=768, max_length=768,
+                                          description="The embedding to search with. Either `text` or `vector` is "
+                                                      "required.")
+    basis: SearchBasisEnum = Field(SearchBasisEnum.vision, description="The basis used to search the image.")
+    filter: SearchFilterModel = Field(SearchFilterModel(), description="The filters of this query.")
+    count: int = Field(10, ge=1, le=100, description="The number of results you want to get.")
+    skip: int = Field(0, ge=0, description="The number of results you want to skip.")
+
+    @model_validator(mode='after')
+    def check_text_or_vector(self):
+        if (self.text is None) == (self.vector is None):
+            raise ValueError("Exactly one of `text` and `vector` should be given.")
+        return self
+
+
+class BatchSearchModel(BaseModel):
+    queries: list[BatchSearchQueryModel] = Field(description="The queries you want to run.",
+                                                 min_length=1,
+                                                 max_length=32)
+
+
+class WeightedVectorModel(BaseModel):
+    vector: list[Annotated[float, Field(allow_inf_nan=False)]] = Field(min_length=768, max_length=768,
+                                                                       description="The embedding to search with.")
+    weight: float = Field(1.0, allow_inf_nan=False,
+                          description="The weight of this embedding. A negative weight pushes the results away from "
+                                      "it.")
+
+
+class VectorSearchModel(BaseModel):
+    vectors: list[WeightedVectorModel] = Field(description="The embeddings to search with, combined as the weighted "
+                                                           "sum of the normalized embeddings.",
+                                               min_length=1,
+                                               max_length=16)
@@ -3,11 +3,14 @@ from uuid import UUID
 from pydantic import Field
 
 from .base import NekoProtocol
+from app.util.local_file_utility import ScanProgress
 
 
 class ServerInfoResponse(NekoProtocol):
     image_count: int
     index_queue_length: int
+    local_scan: ScanProgress | None = Field(
+        None, description="The progress of the local directory scan. Null if local search is disabled.")
 
 
 class DuplicateValidationResponse(NekoProtocol):
@@ -1,6 +1,7 @@
 from enum import Enum
+from uuid import UUID
 
-from pydantic import Field
+from pydantic import BaseModel, Field
 
 from app.Models.api_response.base import NekoProtocol
 from app.Models.mapped_image import MappedImage
@@ -23,3 +24,22 @@ class QueryImagesApiResponse(NekoProtocol):
     images: list[MappedImage] = Field(description="The list of images.")
     next_page_offset: str | None = Field(description="The offset ID for the next page query. "
                                                      "If there are no more images, this field will be null.")
+
+
+class SpriteTile(BaseModel):
+    x: int
+    y: int
+    width: int
+    height: int
+
+
+class SpriteSheetApiResponse(NekoProtocol):
+    sprite_url: str = Field(description="The URL of the sprite sheet image (WebP).")
+    tile_height: int = Field(description="The height of every tile in pixels.")
+    width: int = Field(description="The width of the sheet in pixels.")
+    height: int = Field(description="The height of the sheet in pixels.")
+    tiles: dict[UUID, SpriteTile] = Field(description="The position and size of the thumbnail of each image in the "
+                                                      "sheet, in pixels.")
+    missing: list[UUID] = Field(description="The images not found (yet), which have no tile in the sheet.")
+    unavailable: list[UUID] = Field(description="The images without a thumbnail stored on this server, which have no "
+                                                "tile in the sheet.")
@@ -1,8 +1,25 @@
+from uuid import UUID
+
+from pydantic import Field
+
 from .base import NekoProtocol
 from ..search_result import SearchResult
-from uuid import UUID
 
 
 class SearchApiResponse(NekoProtocol):
     query_id: UUID
     result: list[SearchResult]
+    next_cursor: str | None = Field(None,
+                                    description="The continuation token for the next page. Pass it back as `cursor` "
+                                                "to fetch the next page. If there are no more results, this field "
+                                                "will be null. The pages within the first 1000 results are served "
+                                                "from a window of results kept by the server for a few minutes. "
+                                                "Past it, or if the window is gone (e.g. after a restart, on "
+                                                "another worker, or evicted), a page costs a query with an "
+                                                "offset, which grows with the position of the page.")
+
+
+class BatchSearchApiResponse(NekoProtocol):
+    query_id: UUID
+    result: list[list[SearchResult]] = Field(description="The results of each query, in the same order as the "
+                                                         "queries.")
@@ -8,3 +8,7 @@ class PointDuplicateError(ValueError):
         super().__init__(message)
 
     pass
+
+
+class CursorMismatchError(ValueError):
+    pass
@@ -5,6 +5,9 @@ from uuid import UUID
 from numpy import ndarray
 from pydantic import BaseModel, Field, ConfigDict
 
+from app.util.normalize_tags import tags_to_text
+from app.util.random_key import random_key
+
 
 class MappedImage(BaseModel):
     model_config = ConfigDict(arbitrary_types_allowed=True, extra='ignore')
@@ -34,6 +37,14 @@ class MappedImage(BaseModel):
     format: Optional[str] = None  # required for s3 local storage
     comments: Annotated[Optional[str], Field(description="Any custom comments or text payload for the image.")] = None
     tags: Annotated[Optional[list[str]], Field(description="WD14 generated tags for the image.")] = []
+    placeholder: Annotated[Optional[str], Field(
+        description="A tiny preview of the image as a WebP data URI, to paint while the thumbnail is loading.")] = None
+    dominant_color: Annotated[Optional[str], Field(
+        description="The dominant color of the image as `#rrggbb`.")] = None
+    # The keys of the files in the storage, relative to its static_dir. They are internal, so they are kept in the
+    # payload but excluded from the API
+    storage_key: Annotated[Optional[str], Field(exclude=True)] = None
+    thumbnail_storage_key: Annotated[Optional[str], Field(exclude=True)] = None
 
     @property
     def ocr_text_lower(self) -> str | None:
@@ -48,6 +59,12 @@ class MappedImage(BaseModel):
         result['index_date'] = self.index_date.isoformat()
         # Qdrant doesn't support case-insensitive search, so we need to store a lowercase version of the text
         result['ocr_text_lower'] = self.ocr_text_lower
+        # The words of the tags, which is full-text indexed for tag queries
+        result['tags_text'] = tags_to_text(self.tags or [])
+        # The range-indexed sort key used to sample random images
+        result['random_key'] = random_key(self.id)
+        result['storage_key'] = self.storage_key
+        result['thumbnail_storage_key'] = self.thumbnail_storage_key
         # Include additional metadata
         if hasattr(self, '_additional_payload'):
             result.update(self._additional_payload)
@@ -66,7 +83,7 @@ class MappedImage(BaseModel):
         
         # Extract additional payload data
         additional_payload = {}
-        for key in ['filename', 'width', 'height', 'aspect_ratio']:
+        for key in ['filename']:
             if key in payload:
                 additional_payload[key] = payload[key]
         
@@ -74,7 +91,7 @@ class MappedImage(BaseModel):
         instance = cls(id=UUID(img_id),
                       index_date=index_date,
                       **{k:v for k,v in payload.items()
-                         if k not in ['index_date', 'filename', 'width', 'height', 'aspect_ratio']},
+                         if k not in ['index_date', 'filename']},
                       image_vector=image_vector if image_vector is not None else None,
                       text_contain_vector=text_contain_vector if text_contain_vector is not None else None)
         
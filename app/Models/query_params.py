@@ -1,16 +1,28 @@
 from typing import Annotated
 
-from fastapi.params import Query
+from fastapi import HTTPException
+from fastapi.params import Query, Header
+
+from app.Models.mapped_image import MappedImage
+from app.Models.search_cursor import SearchCursor
+from app.util.ndjson_response import NDJSON_MEDIA_TYPE
 
 
 class SearchPagingParams:
     def __init__(
             self,
             count: Annotated[int, Query(ge=1, le=100, description="The number of results you want to get.")] = 10,
-            skip: Annotated[int, Query(ge=0, description="The number of results you want to skip.")] = 0
+            skip: Annotated[int, Query(ge=0, description="The number of results you want to skip.")] = 0,
+            cursor: Annotated[str | None, Query(
+                description="The `next_cursor` returned by the previous page of the same query. "
+                            "When given, `skip` is ignored and the next page is fetched from the cursor.")] = None
     ):
         self.count = count
         self.skip = skip
+        try:
+            self.cursor = SearchCursor.decode(cursor) if cursor else None
+        except ValueError as ex:
+            raise HTTPException(400, "Invalid cursor.") from ex
 
 
 class FilterParams:
@@ -34,6 +46,7 @@ class FilterParams:
                                 "will be ignored. The entries should be seperated by comma.",
                     examples=["stickers, cg"])] = None,
     ):
+        self.query_text = query_text
         self.preferred_ratio = preferred_ratio
         self.ratio_tolerance = ratio_tolerance
         self.min_width = min_width
@@ -44,6 +57,14 @@ class FilterParams:
                                     t.strip()] if categories_negative else None
         self.ocr_text = None  # For exact search
 
+    @property
+    def is_empty(self) -> bool:
+        """
+        Whether the filter doesn't exclude any image.
+        """
+        return all(t is None for t in (self.query_text, self.preferred_ratio, self.min_width, self.min_height,
+                                       self.starred, self.categories, self.categories_negative, self.ocr_text))
+
     @property
     def min_ratio(self) -> float | None:
         if self.preferred_ratio is None:
@@ -55,3 +76,45 @@ class FilterParams:
         if self.preferred_ratio is None:
             return None
         return self.preferred_ratio * (1 + self.ratio_tolerance)
+
+
+class PayloadProjectionParams:
+    PROJECTABLE_FIELDS = frozenset(k for k, v in MappedImage.model_fields.items() if not v.exclude and k != 'id')
+
+    def __init__(
+            self,
+            fields: Annotated[str | None, Query(
+                description="The fields of the image you want to get. The entries should be seperated by comma. "
+                            "`id` is always included. Leave empty to get all the fields.",
+                examples=["url,thumbnail_url,width,height"])] = None,
+    ):
+        self.fields = [t.strip() for t in fields.split(',') if t.strip()] if fields else None
+        if self.fields is not None and (unknown := set(self.fields) - self.PROJECTABLE_FIELDS):
+            raise HTTPException(422, f"Unknown fields: {', '.join(sorted(unknown))}.")
+
+    @property
+    def excluded_fields(self) -> set[str] | None:
+        if self.fields is None:
+            return None
+        return set(self.PROJECTABLE_FIELDS - set(self.fields))
+
+
+class ResponseFormatParams:
+    def __init__(
+            self,
+            accept: Annotated[str | None, Header(
+                description=f"Send `{NDJSON_MEDIA_TYPE}` to get the response streamed as newline delimited JSON: "
+                            "one item per line, then a last line with the other fields of the response.")] = None,
+    ):
+        self.accept = accept
+        self.ndjson = accept is not None and NDJSON_MEDIA_TYPE in accept
+
+
+class ConditionalRequestParams:
+    def __init__(
+            self,
+            if_none_match: Annotated[str | None, Header(
+                description="The ETag of a previous response of the same request. If the response hasn't changed "
+                            "since, a `304 Not Modified` is returned without running the query.")] = None,
+    ):
+        self.if_none_match = if_none_match
@@ -0,0 +1,44 @@
+import base64
+import binascii
+from datetime import datetime
+from uuid import UUID
+
+from pydantic import BaseModel, ValidationError
+
+from app.Models.mapped_image import MappedImage
+
+
+class ScrollCursor(BaseModel):
+    """
+    The continuation token of a scroll ordered by index date.
+    The next page starts from the index date of the last image returned, skipping the images of that date which have
+    already been returned, so that the images sharing a date are neither repeated nor missed.
+    """
+    index_date: datetime
+    seen_ids: list[UUID]
+
+    @classmethod
+    def after(cls, page: list[MappedImage], previous: "ScrollCursor | None") -> "ScrollCursor":
+        """
+        :param page: The images returned, in the order of the scroll. It should not be empty.
+        :param previous: The cursor the page has been scrolled from.
+        """
+        last_date = page[-1].index_date
+        seen_ids = [t.id for t in page if t.index_date == last_date]
+        if previous is not None and previous.index_date == last_date:
+            # The whole page has the date of the previous cursor
+            seen_ids = previous.seen_ids + seen_ids
+        return cls(index_date=last_date, seen_ids=seen_ids)
+
+    def encode(self) -> str:
+        return base64.urlsafe_b64encode(self.model_dump_json().encode()).decode().rstrip('=')
+
+    @classmethod
+    def decode(cls, token: str) -> "ScrollCursor":
+        """
+        Decode a cursor token. Will raise ValueError if the token is malformed.
+        """
+        try:
+            return cls.model_validate_json(base64.urlsafe_b64decode(token + '=' * (-len(token) % 4)))
+        except (binascii.Error, ValidationError) as ex:
+            raise ValueError("Invalid cursor.") from ex
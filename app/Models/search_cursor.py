@@ -0,0 +1,49 @@
+import base64
+import binascii
+from uuid import UUID
+
+from pydantic import BaseModel, ValidationError
+
+from app.Models.search_result import SearchResult
+
+
+class SearchCursor(BaseModel):
+    """
+    The continuation token of a paginated search.
+    It carries the fingerprint of the query it belongs to, the position of the next page and the score/ID of the last
+    item returned, which is used as a keyset bound to keep pages consistent.
+    """
+    fingerprint: str
+    position: int
+    score: float
+    id: UUID
+
+    @staticmethod
+    def rank_key(item: SearchResult) -> tuple[float, str]:
+        """
+        The sort key of the ranking the cursor walks: by descending score, the ties broken by ID.
+        """
+        return -item.score, str(item.img.id)
+
+    @classmethod
+    def after(cls, fingerprint: str, position: int, last: SearchResult) -> "SearchCursor":
+        return cls(fingerprint=fingerprint, position=position, score=last.score, id=last.img.id)
+
+    def precedes(self, item: SearchResult) -> bool:
+        """
+        Check whether the given item ranks before (or is) the last item of the previous page.
+        """
+        return self.rank_key(item) <= (-self.score, str(self.id))
+
+    def encode(self) -> str:
+        return base64.urlsafe_b64encode(self.model_dump_json().encode()).decode().rstrip('=')
+
+    @classmethod
+    def decode(cls, token: str) -> "SearchCursor":
+        """
+        Decode a cursor token. Will raise ValueError if the token is malformed.
+        """
+        try:
+            return cls.model_validate_json(base64.urlsafe_b64decode(token + '=' * (-len(token) % 4)))
+        except (binascii.Error, ValidationError) as ex:
+            raise ValueError("Invalid cursor.") from ex
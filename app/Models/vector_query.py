@@ -0,0 +1,19 @@
+from typing import Optional
+
+from numpy import ndarray
+from pydantic import BaseModel, ConfigDict
+
+from app.Models.query_params import FilterParams
+
+
+class VectorQuery(BaseModel):
+    """
+    A single nearest-neighbour query, used to send multiple queries to the vector database at once.
+    """
+    model_config = ConfigDict(arbitrary_types_allowed=True)
+
+    query_vector: ndarray
+    query_vector_name: str
+    filter_param: Optional[FilterParams] = None
+    top_k: int = 10
+    skip: int = 0
@@ -0,0 +1,155 @@
+from datetime import datetime
+from typing import Callable, Iterable
+
+import numpy as np
+
+from app.Models.query_params import FilterParams
+from app.util.normalize_tags import tag_tokens
+
+
+class TermBitsets:
+    """
+    One bitset of rows per distinct term (e.g. a category or a tag), packed 8 rows per byte.
+    Matching any of several terms is a bitwise OR of their bitsets, so the cost doesn't depend on how many terms each
+    row has. The memory usage is capacity / 8 bytes per distinct term.
+    """
+
+    def __init__(self, capacity: int = 0):
+        self._bytes = (capacity + 7) // 8
+        self._bitsets: dict[str, np.ndarray] = {}
+        self._row_terms: list[frozenset[str]] = [frozenset()] * capacity
+
+    @property
+    def terms(self) -> Iterable[str]:
+        return self._bitsets.keys()
+
+    def grow(self, capacity: int):
+        self._row_terms.extend([frozenset()] * (capacity - len(self._row_terms)))
+        new_bytes = (capacity + 7) // 8
+        if new_bytes > self._bytes:
+            for term, bitset in self._bitsets.items():
+                self._bitsets[term] = np.concatenate([bitset, np.zeros(new_bytes - self._bytes, dtype=np.uint8)])
+            self._bytes = new_bytes
+
+    def set_row(self, row: int, terms: Iterable[str]):
+        terms = frozenset(terms)
+        old_terms = self._row_terms[row]
+        byte, bit = row >> 3, np.uint8(1 << (row & 7))
+        for term in old_terms - terms:
+            self._bitsets[term][byte] &= ~bit
+        for term in terms - old_terms:
+            if term not in self._bitsets:
+                self._bitsets[term] = np.zeros(self._bytes, dtype=np.uint8)
+            self._bitsets[term][byte] |= bit
+        self._row_terms[row] = terms
+
+    def row_terms(self, row: int) -> frozenset[str]:
+        return self._row_terms[row]
+
+    def any_of(self, terms: Iterable[str], size: int) -> np.ndarray:
+        """
+        :return: The mask of the first `size` rows having any of the given terms.
+        """
+        bitsets = [self._bitsets[t] for t in terms if t in self._bitsets]
+        if not bitsets:
+            return np.zeros(size, dtype=bool)
+        merged = np.bitwise_or.reduce(bitsets) if len(bitsets) > 1 else bitsets[0]
+        return np.unpackbits(merged, count=size, bitorder='little').view(bool)
+
+    def any_matching(self, predicate: Callable[[str], bool], size: int) -> np.ndarray:
+        """
+        :return: The mask of the first `size` rows having any term for which the predicate is true.
+        """
+        return self.any_of([t for t in self._bitsets if predicate(t)], size)
+
+
+class ColumnarMetadataStore:
+    """
+    The filterable payload fields of every row, kept as columns so that a FilterParams is turned into a boolean mask of
+    all the rows in one vectorized pass: numpy arrays for the numeric fields and TermBitsets for categories and tags.
+    The index date is kept as a POSIX timestamp column too, to sort the rows by date.
+    The rows are addressed by index, the owner of the store maps them to the points.
+    Missing numeric values are stored as NaN, which never pass a range condition (same as Qdrant).
+    """
+
+    def __init__(self, capacity: int = 0):
+        self.width = np.full(capacity, np.nan, dtype=np.float32)
+        self.height = np.full(capacity, np.nan, dtype=np.float32)
+        self.aspect_ratio = np.full(capacity, np.nan, dtype=np.float32)
+        self.starred = np.zeros(capacity, dtype=bool)
+        self.categories = TermBitsets(capacity)
+        # The words of the tags in lowercase, see app.util.normalize_tags
+        self.tags = TermBitsets(capacity)
+        self.ocr_text_lower: list[str | None] = [None] * capacity
+        self.index_date = np.full(capacity, np.nan, dtype=np.float64)
+
+    @property
+    def capacity(self) -> int:
+        return len(self.width)
+
+    def _grow(self, capacity: int):
+        extra = capacity - self.capacity
+        self.width = np.concatenate([self.width, np.full(extra, np.nan, dtype=np.float32)])
+        self.height = np.concatenate([self.height, np.full(extra, np.nan, dtype=np.float32)])
+        self.aspect_ratio = np.concatenate([self.aspect_ratio, np.full(extra, np.nan, dtype=np.float32)])
+        self.starred = np.concatenate([self.starred, np.zeros(extra, dtype=bool)])
+        self.categories.grow(capacity)
+        self.tags.grow(capacity)
+        self.ocr_text_lower.extend([None] * extra)
+        self.index_date = np.concatenate([self.index_date, np.full(extra, np.nan, dtype=np.float64)])
+
+    def set_row(self, row: int, payload: dict | None):
+        """
+        Set the fields of a row from a payload, None to clear the row.
+        """
+        if row >= self.capacity:
+            self._grow(max(row + 1, self.capacity * 2, 1024))
+        payload = payload or {}
+
+        def _number(key):
+            value = payload.get(key)
+            return np.nan if value is None else value
+
+        self.width[row] = _number('width')
+        self.height[row] = _number('height')
+        self.aspect_ratio[row] = _number('aspect_ratio')
+        self.starred[row] = bool(payload.get('starred'))
+        self.categories.set_row(row, payload.get('categories') or ())
+        self.tags.set_row(row, (token for tag in payload.get('tags') or () for token in tag_tokens(tag)))
+        self.ocr_text_lower[row] = payload.get('ocr_text_lower')
+        index_date = payload.get('index_date')
+        self.index_date[row] = datetime.fromisoformat(index_date).timestamp() if index_date is not None else np.nan
+
+    def mask(self, filter_param: FilterParams | None, size: int) -> np.ndarray:
+        """
+        Evaluate the filter for the first `size` rows.
+        :return: A boolean array of shape (size,), True for the rows passing the filter.
+        """
+        mask = np.ones(size, dtype=bool)
+        if filter_param is None:
+            return mask
+        if filter_param.min_width is not None and filter_param.min_width > 0:
+            mask &= self.width[:size] >= filter_param.min_width
+        if filter_param.min_height is not None and filter_param.min_height > 0:
+            mask &= self.height[:size] >= filter_param.min_height
+        if filter_param.min_ratio is not None:
+            ratio = self.aspect_ratio[:size]
+            mask &= (ratio >= filter_param.min_ratio) & (ratio <= filter_param.max_ratio)
+        if filter_param.starred is not None:
+            mask &= self.starred[:size] == filter_param.starred
+        if filter_param.categories is not None:
+            mask &= self.categories.any_of(filter_param.categories, size)
+        if filter_param.categories_negative is not None:
+            mask &= ~self.categories.any_of(filter_param.categories_negative, size)
+        if filter_param.query_text:
+            # Same as the prefix text index of Qdrant: every word of the query should be a prefix of a word of the tags,
+            # only the distinct words are scanned
+            for query_token in tag_tokens(filter_param.query_text):
+                mask &= self.tags.any_matching(lambda t: t.startswith(query_token), size)
+        if filter_param.ocr_text is not None:
+            # Free text can't be indexed by terms, it's the only condition checked row by row (for the rows left)
+            text = filter_param.ocr_text.lower()
+            rows = np.flatnonzero(mask)
+            mask[rows] = np.fromiter(((t := self.ocr_text_lower[row]) is not None and text in t for row in rows),
+                                     dtype=bool, count=len(rows))
+        return mask
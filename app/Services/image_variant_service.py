@@ -0,0 +1,123 @@
+import asyncio
+import math
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+from pathlib import Path
+
+import aiofiles
+from PIL import Image, ImageOps, ExifTags
+from loguru import logger
+
+from app.Models.api_models.images_query_params import VariantFormatEnum
+from app.Models.mapped_image import MappedImage
+from app.Services.lifespan_service import LifespanService
+from app.Services.storage import StorageService
+from app.config import config
+from app.util.disk_lru_cache import DiskLRUCache
+from app.util.storage_keys import stored_image_key
+
+LOCAL_FILE_URL_PREFIX = 'file://'
+
+
+class ImageNotStoredError(ValueError):
+    pass
+
+
+def render_variant(source: bytes, width: int, variant_format: VariantFormatEnum) -> bytes:
+    """
+    Resize an image to the given width (never upscaled), keeping its aspect ratio, and encode it.
+    """
+    with Image.open(BytesIO(source)) as img:
+        # The width is the one displayed, which is the stored height if the EXIF orientation rotates the image
+        rotated = img.getexif().get(ExifTags.Base.Orientation, 1) in (5, 6, 7, 8)
+        scale = min(1.0, width / (img.height if rotated else img.width))
+        # Let the JPEG decoder downscale by a power of 2 while decoding, which skips most of the work for big photos
+        img.draft('RGB', (math.ceil(img.width * scale), math.ceil(img.height * scale)))
+        img = ImageOps.exif_transpose(img)
+        if img.width > width:
+            img = img.resize((width, max(1, round(img.height * width / img.width))), Image.Resampling.LANCZOS)
+        if img.mode not in ('RGB', 'RGBA', 'L'):
+            img = img.convert('RGBA' if img.has_transparency_data else 'RGB')
+        if variant_format == VariantFormatEnum.jpeg and img.mode == 'RGBA':
+            img = img.convert('RGB')
+        out = BytesIO()
+        img.save(out, variant_format.value.upper(), quality=85)
+        return out.getvalue()
+
+
+class ImageVariantService(LifespanService):
+    """
+    Serve resized variants of the stored images.
+    A variant is generated on its first request by a pool of worker threads (Pillow releases the GIL while resizing
+    and encoding), then kept in a size-bounded LRU disk cache. Concurrent requests of the same variant share one
+    generation. The requested widths are rounded up to WIDTHS, which bounds the number of variants per image.
+    """
+    WIDTHS = [64, 128, 256, 384, 512, 768, 1024, 1536, 2048]
+
+    def __init__(self, storage_service: StorageService):
+        self._storage_service = storage_service
+        self.enabled = config.image_variant.enable
+        self._cache = DiskLRUCache(config.image_variant.path, config.image_variant.max_cache_size_mb * 1024 * 1024)
+        self._executor = ThreadPoolExecutor(config.image_variant.workers, thread_name_prefix='image-variant') \
+            if self.enabled else None
+        self._generating: dict[str, asyncio.Task] = {}
+
+    async def on_load(self):
+        if self.enabled:
+            await asyncio.to_thread(self._cache.load)
+
+    async def on_exit(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+
+    @classmethod
+    def snap_width(cls, width: int) -> int:
+        """
+        :return: The smallest available width not below the requested one, or the largest width.
+        """
+        return next((t for t in cls.WIDTHS if t >= width), cls.WIDTHS[-1])
+
+    @staticmethod
+    def variant_key(image_id: str, width: int, variant_format: VariantFormatEnum) -> str:
+        return f"{image_id[:2]}/{image_id}_{width}.{variant_format.value}"
+
+    async def get_variant(self, image: MappedImage, width: int, variant_format: VariantFormatEnum) -> bytes:
+        """
+        Get a variant of an image, generating it if it's not cached.
+        :param width: The width of the variant, which should be one of WIDTHS.
+        :return: The encoded variant.
+        """
+        key = self.variant_key(str(image.id), width, variant_format)
+        if (path := await asyncio.to_thread(self._cache.get, key)) is not None:
+            try:
+                async with aiofiles.open(path, 'rb') as f:
+                    return await f.read()
+            except FileNotFoundError:
+                # Evicted since the lookup
+                pass
+        task = self._generating.get(key)
+        if task is None:
+            task = self._generating[key] = asyncio.create_task(self._generate(key, image, width, variant_format))
+            task.add_done_callback(lambda _: self._generating.pop(key, None))
+        # A cancelled request must not cancel the generation shared with the other requests
+        return await asyncio.shield(task)
+
+    async def _generate(self, key: str, image: MappedImage, width: int, variant_format: VariantFormatEnum) -> bytes:
+        logger.info("Generating variant {} of image {}...", key, image.id)
+        source = await self.fetch_source(image)
+        data = await asyncio.get_running_loop().run_in_executor(self._executor, render_variant, source, width,
+                                                                variant_format)
+        await asyncio.to_thread(self._cache.put, key, data)
+        return data
+
+    async def fetch_source(self, image: MappedImage) -> bytes:
+        """
+        Read the original file of an image. Will raise ImageNotStoredError if the image is not stored by this server.
+        """
+        if image.url is not None and image.url.startswith(LOCAL_FILE_URL_PREFIX):
+            # An image of the local search directory
+            async with aiofiles.open(Path(image.url.removeprefix(LOCAL_FILE_URL_PREFIX)), 'rb') as f:
+                return await f.read()
+        if not image.local or not config.storage.method.enabled:
+            raise ImageNotStoredError(f"The image {image.id} is not stored on this server.")
+        return await self._storage_service.active_storage.fetch(stored_image_key(image))
@@ -15,6 +15,8 @@ from app.Services.transformers_service import TransformersService
 from app.Services.vector_db_context import VectorDbContext
 from app.Services.wd14_tagger_service import WD14TaggerService
 from app.config import config
+from app.util.image_placeholder import image_placeholder, dominant_color
+from app.util.normalize_tags import normalize_tags
 from loguru import logger
 
 
@@ -36,6 +38,8 @@ class IndexService(LifespanService):
         image_data.width = image.width
         image_data.height = image.height
         image_data.aspect_ratio = float(image.width) / image.height
+        image_data.placeholder = image_placeholder(image)
+        image_data.dominant_color = dominant_color(image)
 
         if image.mode != 'RGB':
             image = image.convert('RGB')
@@ -45,7 +49,7 @@ class IndexService(LifespanService):
         
         # Always generate tags if enabled
         if config.model.tagger_enabled:
-            image_data.tags = self._tagger_service.generate_tags(image)
+            image_data.tags = normalize_tags(self._tagger_service.generate_tags(image))
             
         # Skip OCR if disabled in config or explicitly requested
         if not skip_ocr and config.ocr_search.enable:
@@ -1,59 +1,84 @@
+import asyncio
 import os
-from datetime import datetime
+from pathlib import Path
 from typing import Optional, List
-from uuid import uuid4
 
 import numpy
-from PIL import Image
 from loguru import logger
 
-from app.Models.mapped_image import MappedImage
 from app.Models.query_params import FilterParams
 from app.Models.search_result import SearchResult
+from app.Models.vector_query import VectorQuery
 from app.Services.lifespan_service import LifespanService
 from app.Services.transformers_service import TransformersService
 from app.Services.wd14_tagger_service import WD14TaggerService
 from app.Services.vector_db_context import VectorDbContext
 from app.config import config
-from app.util.calculate_vectors_cosine import calculate_vectors_cosine
+from app.util.local_file_utility import ScanProgress, scan_directory, load_file_snapshot, save_file_snapshot
 from app.Models.api_models.search_api_model import SearchBasisEnum
 
 
 class LocalSearchService(LifespanService):
     IMG_VECTOR = "image_vector"
     TEXT_VECTOR = "text_contain_vector"
+    FILE_SNAPSHOT_NAME = "local_search_files.json"
 
     def __init__(self, transformers_service: TransformersService, tagger_service: WD14TaggerService, 
                  db_context: VectorDbContext):
         self.transformers_service = transformers_service
         self.tagger_service = tagger_service
         self.db_context = db_context
-        self.image_files = []
-        self._scan_directory()
+        self.scan_progress = ScanProgress()
+        self._scan_task: asyncio.Task | None = None
+        # Serve from the last snapshot right away, the directory is reconciled in the background
+        self.image_files = self._load_snapshot()
 
     async def on_load(self):
         """Called when service is loaded"""
-        pass
+        if config.local_search.enabled:
+            self._scan_task = asyncio.create_task(self._scan_directory())
 
-    def _scan_directory(self):
-        """Scan the configured directory for image files"""
-        if not config.local_search.enabled:
-            return
+    async def on_exit(self):
+        if self._scan_task is not None:
+            self._scan_task.cancel()
 
-        if not os.path.exists(config.local_search.directory):
-            logger.error(f"Local search directory does not exist: {config.local_search.directory}")
-            return
+    @property
+    def _snapshot_path(self) -> Path:
+        return Path(config.qdrant.local_path) / self.FILE_SNAPSHOT_NAME
 
-        self.image_files = []
-        for root, _, files in os.walk(config.local_search.directory):
-            for file in files:
-                if any(file.lower().endswith(ext) for ext in config.local_search.extensions):
-                    self.image_files.append(os.path.join(root, file))
+    def _load_snapshot(self) -> List[str]:
+        """Load the file list of the last scan"""
+        if not config.local_search.enabled:
+            return []
+        files = load_file_snapshot(self._snapshot_path, config.local_search.directory,
+                                   config.local_search.extensions)
+        if files is None:
+            logger.info("No snapshot of the local directory, waiting for the first scan")
+            return []
+        logger.info(f"Loaded {len(files)} image files from the snapshot of the local directory")
+        return files
+
+    async def _scan_directory(self):
+        """Scan the configured directory for image files and update the snapshot"""
+        directory, extensions = config.local_search.directory, config.local_search.extensions
+        if not os.path.exists(directory):
+            logger.error(f"Local search directory does not exist: {directory}")
+            return
 
-        logger.info(f"Found {len(self.image_files)} image files in local directory")
+        try:
+            files = await asyncio.to_thread(scan_directory, directory, extensions, self.scan_progress)
+            previous = set(self.image_files)
+            added = sum(1 for t in files if t not in previous)
+            self.image_files = files
+            await asyncio.to_thread(save_file_snapshot, self._snapshot_path, directory, extensions, files)
+            logger.info(f"Found {len(files)} image files in local directory "
+                        f"({added} added, {len(previous) - (len(files) - added)} removed since the last scan)")
+        except Exception as e:
+            logger.error(f"Failed to scan local directory: {e}")
 
     async def query_search(self, query_vector, query_vector_name: str = "image_vector",
-                          top_k=10, skip=0, filter_param: FilterParams | None = None) -> List[SearchResult]:
+                          top_k=10, skip=0, filter_param: FilterParams | None = None,
+                          payload_fields: list[str] | None = None) -> List[SearchResult]:
         """Search for images similar to the query vector using pre-built index"""
         if not config.local_search.enabled:
             return []
@@ -64,11 +89,32 @@ class LocalSearchService(LifespanService):
             query_vector_name=query_vector_name,
             top_k=top_k,
             skip=skip,
-            filter_param=filter_param
+            filter_param=filter_param,
+            payload_fields=payload_fields
         )
 
         return search_results
 
+    async def random_sampling_ready(self) -> bool:
+        """Check whether the pre-built index supports random sampling"""
+        return await self.db_context.random_sampling_ready()
+
+    async def query_random(self, seed: int, top_k=10, skip=0, filter_param: FilterParams | None = None,
+                           payload_fields: list[str] | None = None) -> List[SearchResult]:
+        """Sample random images using pre-built index"""
+        if not config.local_search.enabled:
+            return []
+
+        return await self.db_context.query_random(seed, top_k, skip, filter_param, payload_fields)
+
+    async def query_batch(self, queries: List[VectorQuery],
+                          payload_fields: list[str] | None = None) -> List[List[SearchResult]]:
+        """Run multiple searches at once using pre-built index"""
+        if not config.local_search.enabled:
+            return [[] for _ in queries]
+
+        return await self.db_context.query_batch(queries, payload_fields)
+
     async def query_similar(self,
                           query_vector_name: str = "image_vector",
                           search_id: Optional[str] = None,
@@ -78,37 +124,33 @@ class LocalSearchService(LifespanService):
                           with_vectors: bool = False,
                           filter_param: FilterParams | None = None,
                           top_k: int = 10,
-                          skip: int = 0) -> List[SearchResult]:
-        """Search for similar images using pre-built index"""
-        if positive_vectors:
-            return await self.query_search(positive_vectors[0], query_vector_name, top_k, skip, filter_param)
-        return []
-
-    def _passes_filters(self, mapped_img: MappedImage, filter_param: FilterParams) -> bool:
-        """Check if image passes all filters"""
-        payload = mapped_img.payload
-        
-        # Check tag filter
-        if filter_param.query_text and mapped_img.tags:
-            query_text = filter_param.query_text.lower()
-            if not any(query_text in tag.lower() for tag in mapped_img.tags):
-                return False
-                
-        # Check width filter
-        if filter_param.min_width and payload.get('width', 0) < filter_param.min_width:
-            return False
-            
-        # Check height filter
-        if filter_param.min_height and payload.get('height', 0) < filter_param.min_height:
-            return False
-            
-        # Check aspect ratio filter
-        if filter_param.min_ratio:
-            aspect_ratio = payload.get('aspect_ratio', 1.0)
-            if aspect_ratio < filter_param.min_ratio or aspect_ratio > filter_param.max_ratio:
-                return False
-                
-        return True
+                          skip: int = 0,
+                          payload_fields: list[str] | None = None) -> List[SearchResult]:
+        """Recommend by the given ID or positive/negative vectors using pre-built index"""
+        if not config.local_search.enabled:
+            return []
+
+        # All the examples go into one recommend query, scored with the average_vector or best_score strategy
+        return await self.db_context.query_similar(query_vector_name, search_id, positive_vectors,
+                                                   negative_vectors, mode, with_vectors, filter_param, top_k,
+                                                   skip, payload_fields)
+
+    async def query_combined(self,
+                             query_vector_name: str = "image_vector",
+                             positive_vectors: Optional[List[numpy.ndarray]] = None,
+                             negative_vectors: Optional[List[numpy.ndarray]] = None,
+                             extra_vector: Optional[numpy.ndarray] = None,
+                             mode: Optional[str] = None,
+                             filter_param: FilterParams | None = None,
+                             top_k: int = 10,
+                             skip: int = 0,
+                             payload_fields: list[str] | None = None) -> List[SearchResult]:
+        """Search with criteria and rescore the results with the extra vector using pre-built index"""
+        if not config.local_search.enabled:
+            return []
+
+        return await self.db_context.query_combined(query_vector_name, positive_vectors, negative_vectors,
+                                                    extra_vector, mode, filter_param, top_k, skip, payload_fields)
 
     @classmethod
     def vector_name_for_basis(cls, basis: SearchBasisEnum) -> str:
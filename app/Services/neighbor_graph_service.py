@@ -0,0 +1,180 @@
+import asyncio
+from pathlib import Path
+
+from loguru import logger
+
+from app.Models.mapped_image import MappedImage
+from app.Models.search_result import SearchResult
+from app.Models.vector_query import VectorQuery
+from app.Services.lifespan_service import LifespanService
+from app.Services.neighbor_store import NeighborStore
+from app.Services.vector_db_context import VectorDbContext, CollectionWriteListener, PointNotFoundError
+from app.config import config
+
+
+class NeighborGraphService(LifespanService, CollectionWriteListener):
+    """
+    Serve similar image queries from the precomputed top-K neighbours of every image, one NeighborStore per vector.
+    The graph is built offline by rebuild() (see the build-neighbor-graph command) and kept up to date while the
+    server runs: inserted images get their neighbours queried in the background, deleted images are removed from
+    the lists right away.
+    An inserted image is offered to the lists of its REVERSE_FANOUT * K nearest images. An image whose top-K it
+    enters while ranking further away than that is missed, this is rare and repaired by the next rebuild.
+    """
+    VECTOR_NAMES = [VectorDbContext.IMG_VECTOR, VectorDbContext.TEXT_VECTOR]
+    BATCH_SIZE = 64
+    REVERSE_FANOUT = 4
+
+    def __init__(self, db_context: VectorDbContext):
+        self.db_context = db_context
+        self.enabled = config.neighbor_graph.enable
+        self.k = config.neighbor_graph.top_k
+        self.stores = {name: NeighborStore(self.k) for name in self.VECTOR_NAMES}
+        # The modification time of each file when it was loaded or saved, to detect a rebuild by another process
+        self._file_mtimes: dict[str, float | None] = {}
+        self._dirty = False
+        self._pending: dict[str, MappedImage] = {}
+        self._pending_event = asyncio.Event()
+        self._update_task: asyncio.Task | None = None
+        if self.enabled:
+            db_context.add_write_listener(self)
+
+    def _path(self, vector_name: str) -> Path:
+        return Path(config.neighbor_graph.path) / f"{vector_name}.npz"
+
+    @staticmethod
+    def _mtime(path: Path) -> float | None:
+        return path.stat().st_mtime if path.exists() else None
+
+    async def on_load(self):
+        if not self.enabled:
+            return
+        for name in self.VECTOR_NAMES:
+            path = self._path(name)
+            self._file_mtimes[name] = self._mtime(path)
+            if not path.exists():
+                continue
+            store = NeighborStore.load(path)
+            if store.k != self.k:
+                logger.warning("The neighbor graph {} was built with top_k = {}, rebuild it to use top_k = {}.",
+                               path, store.k, self.k)
+            self.stores[name] = store
+        if not any(len(t) for t in self.stores.values()):
+            logger.warning("The neighbor graph is empty, run the build-neighbor-graph command to build it. "
+                           "Similar searches will be queried live until then.")
+        else:
+            logger.success("Neighbor graph loaded, {} images.", len(self.stores[VectorDbContext.IMG_VECTOR]))
+        self._update_task = asyncio.create_task(self._process_updates())
+
+    async def on_exit(self):
+        if self._update_task is not None:
+            self._update_task.cancel()
+        if self._dirty:
+            self.save()
+
+    def save(self, force: bool = False):
+        """
+        Save the graph. Unless forced, a file that has been rebuilt by another process since it was loaded is kept,
+        and the incremental updates made to it by this process are discarded.
+        """
+        for name, store in self.stores.items():
+            path = self._path(name)
+            if not force and self._mtime(path) != self._file_mtimes.get(name):
+                logger.warning("The neighbor graph {} has been rebuilt by another process, not overwriting it.", path)
+                continue
+            store.save(path)
+            self._file_mtimes[name] = self._mtime(path)
+        self._dirty = False
+
+    def on_upsert(self, items: list[MappedImage]):
+        for item in items:
+            # Payload updates don't carry vectors, the neighbours are unchanged
+            if item.image_vector is not None or item.text_contain_vector is not None:
+                self._pending[str(item.id)] = item
+        if self._pending:
+            self._pending_event.set()
+
+    def on_delete(self, ids: list[str]):
+        for image_id in ids:
+            self._pending.pop(str(image_id), None)
+            for store in self.stores.values():
+                store.remove(str(image_id))
+        self._dirty = True
+
+    async def _process_updates(self):
+        while True:
+            await self._pending_event.wait()
+            self._pending_event.clear()
+            while self._pending:
+                batch = [self._pending.pop(t) for t in list(self._pending)[:self.BATCH_SIZE]]
+                try:
+                    await self._update_neighbors(batch)
+                except Exception as ex:
+                    logger.error("Failed to update the neighbors of {} images: {}", len(batch), ex)
+
+    async def _update_neighbors(self, items: list[MappedImage]):
+        for name, store in self.stores.items():
+            for item in items:
+                store.remove(str(item.id))
+            targets = [t for t in items if getattr(t, name) is not None]
+            for item, neighbors in zip(targets, await self._query_neighbors(name, targets,
+                                                                            self.k * self.REVERSE_FANOUT)):
+                store.set_neighbors(str(item.id), neighbors[:self.k])
+                # The new image may rank among the neighbours of the images near it
+                for neighbor_id, score in neighbors:
+                    store.offer(neighbor_id, str(item.id), score)
+        self._dirty = True
+        logger.info("Updated the neighbors of {} images.", len(items))
+
+    async def _query_neighbors(self, vector_name: str, items: list[MappedImage], top_k: int) \
+            -> list[list[tuple[str, float]]]:
+        """
+        :return: The (ID, score) of the top_k nearest images of each item, excluding the item itself.
+        """
+        if not items:
+            return []
+        results = await self.db_context.query_batch(
+            [VectorQuery(query_vector=getattr(t, vector_name), query_vector_name=vector_name, top_k=top_k + 1)
+             for t in items], payload_fields=[])
+        return [[(str(r.img.id), r.score) for r in result if r.img.id != item.id][:top_k]
+                for item, result in zip(items, results)]
+
+    async def rebuild(self):
+        """
+        Build the graph from scratch, querying the neighbours of all the images in batches.
+        """
+        stores = {name: NeighborStore(self.k) for name in self.VECTOR_NAMES}
+        next_id = None
+        count = 0
+        while True:
+            points, next_id = await self.db_context.scroll_points(next_id, count=self.BATCH_SIZE, with_vectors=True,
+                                                                  payload_fields=[])
+            for name, store in stores.items():
+                targets = [t for t in points if getattr(t, name) is not None]
+                for item, neighbors in zip(targets, await self._query_neighbors(name, targets, self.k)):
+                    store.set_neighbors(str(item.id), neighbors)
+            count += len(points)
+            logger.info("[{}] Neighbors computed.", count)
+            if next_id is None:
+                break
+        self.stores = stores
+        self._dirty = True
+
+    async def query_similar(self, image_id: str, vector_name: str, top_k: int, skip: int = 0,
+                            payload_fields: list[str] | None = None) -> list[SearchResult] | None:
+        """
+        Get the images similar to the given image from the graph, same as an unfiltered query_similar.
+        :param payload_fields: The payload fields of the results to retrieve, all of them if None.
+        :return: The results, None if the graph can't answer the query (it should be queried live then).
+        """
+        if not self.enabled:
+            return None
+        neighbors = self.stores[vector_name].lookup(image_id, top_k, skip)
+        if neighbors is None:
+            return None
+        try:
+            images = await self.db_context.retrieve_by_ids([t[0] for t in neighbors], payload_fields=payload_fields)
+        except PointNotFoundError:
+            return None
+        images = {str(t.id): t for t in images}
+        return [SearchResult(img=images[t[0]], score=t[1]) for t in neighbors]
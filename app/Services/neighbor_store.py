@@ -0,0 +1,164 @@
+import os
+from pathlib import Path
+from uuid import UUID
+
+import numpy as np
+
+
+class NeighborStore:
+    """
+    The precomputed top-K nearest neighbours of every point, for one vector.
+    Each point has a row holding the rows of its neighbours and their scores in descending order, plus the number of
+    leading entries known to be exact. A deleted neighbour is removed from the lists, which shortens them: the entries
+    left are still the exact top of the list, but the next best neighbour is unknown until the list is rebuilt.
+    A list shorter than K when it was set holds all the other points (the collection was small), it's complete: any
+    new point belongs to it and it stays complete after deletions.
+    The memory usage is about K * 8 + 20 bytes per point.
+    """
+    INITIAL_CAPACITY = 1024
+
+    def __init__(self, k: int):
+        self.k = k
+        self.size = 0
+        self._ids = np.zeros((self.INITIAL_CAPACITY, 16), dtype=np.uint8)
+        self._neighbors = np.full((self.INITIAL_CAPACITY, k), -1, dtype=np.int32)
+        self._scores = np.zeros((self.INITIAL_CAPACITY, k), dtype=np.float32)
+        self._known = np.zeros(self.INITIAL_CAPACITY, dtype=np.int16)
+        self._complete = np.zeros(self.INITIAL_CAPACITY, dtype=bool)
+        self._rows: dict[str, int] = {}
+        self._free_rows: list[int] = []
+
+    def __len__(self):
+        return len(self._rows)
+
+    def __contains__(self, point_id: str):
+        return str(point_id) in self._rows
+
+    def _grow(self, capacity: int):
+        extra = capacity - len(self._known)
+        self._ids = np.concatenate([self._ids, np.zeros((extra, 16), dtype=np.uint8)])
+        self._neighbors = np.concatenate([self._neighbors, np.full((extra, self.k), -1, dtype=np.int32)])
+        self._scores = np.concatenate([self._scores, np.zeros((extra, self.k), dtype=np.float32)])
+        self._known = np.concatenate([self._known, np.zeros(extra, dtype=np.int16)])
+        self._complete = np.concatenate([self._complete, np.zeros(extra, dtype=bool)])
+
+    def _row_for(self, point_id: str) -> int:
+        point_id = str(point_id)
+        if (row := self._rows.get(point_id)) is not None:
+            return row
+        if self._free_rows:
+            row = self._free_rows.pop()
+        else:
+            if self.size == len(self._known):
+                self._grow(self.size * 2)
+            row, self.size = self.size, self.size + 1
+        self._ids[row] = np.frombuffer(UUID(point_id).bytes, dtype=np.uint8)
+        self._rows[point_id] = row
+        return row
+
+    def _id_of(self, row: int) -> str:
+        return str(UUID(bytes=self._ids[row].tobytes()))
+
+    def set_neighbors(self, point_id: str, neighbors: list[tuple[str, float]]):
+        """
+        Set the exact top neighbours of a point.
+        :param neighbors: The (ID, score) of the neighbours in descending order of score, at most K are kept.
+        """
+        row = self._row_for(point_id)
+        neighbors = neighbors[:self.k]
+        self._neighbors[row] = -1
+        self._neighbors[row, :len(neighbors)] = [self._row_for(t[0]) for t in neighbors]
+        self._scores[row, :len(neighbors)] = [t[1] for t in neighbors]
+        self._known[row] = len(neighbors)
+        self._complete[row] = len(neighbors) < self.k
+
+    def offer(self, point_id: str, candidate_id: str, score: float) -> bool:
+        """
+        Offer a new point as a neighbour of an existing point, it's inserted if it ranks within the known entries.
+        :return: Whether the candidate has been inserted.
+        """
+        row = self._rows.get(str(point_id))
+        if row is None:
+            return False
+        known = int(self._known[row])
+        if not self._complete[row] and (known == 0 or score <= self._scores[row, known - 1]):
+            return False
+        candidate_row = self._rows.get(str(candidate_id))
+        if candidate_row is not None and candidate_row in self._neighbors[row, :known]:
+            return False
+        # Every unknown neighbour scores at most the last known one (there is none in a complete list), so the known
+        # entries plus the candidate are the exact top of the list
+        position = int(np.searchsorted(-self._scores[row, :known], -score, side='right'))
+        end = min(known + 1, self.k)
+        self._neighbors[row, position + 1:end] = self._neighbors[row, position:end - 1].copy()
+        self._scores[row, position + 1:end] = self._scores[row, position:end - 1].copy()
+        self._neighbors[row, position] = self._row_for(candidate_id)
+        self._scores[row, position] = score
+        self._known[row] = end
+        self._complete[row] &= end < self.k
+        return True
+
+    def remove(self, point_id: str):
+        """
+        Remove a point, and remove it from the neighbour lists it appears in.
+        """
+        row = self._rows.pop(str(point_id), None)
+        if row is None:
+            return
+        referrers, positions = np.nonzero(self._neighbors[:self.size] == row)
+        for referrer, position in zip(referrers.tolist(), positions.tolist()):
+            known = int(self._known[referrer])
+            if position >= known:
+                continue
+            self._neighbors[referrer, position:known - 1] = self._neighbors[referrer, position + 1:known].copy()
+            self._scores[referrer, position:known - 1] = self._scores[referrer, position + 1:known].copy()
+            self._neighbors[referrer, known - 1] = -1
+            self._known[referrer] = known - 1
+        self._ids[row] = 0
+        self._neighbors[row] = -1
+        self._known[row] = 0
+        self._complete[row] = False
+        self._free_rows.append(row)
+
+    def lookup(self, point_id: str, top_k: int, skip: int = 0) -> list[tuple[str, float]] | None:
+        """
+        :return: The (ID, score) of the neighbours ranked from skip to skip + top_k (fewer if the list is complete and
+        shorter), None if they are not known.
+        """
+        row = self._rows.get(str(point_id))
+        if row is None or (skip + top_k > self._known[row] and not self._complete[row]):
+            return None
+        end = min(skip + top_k, int(self._known[row]))
+        return [(self._id_of(int(n)), float(s)) for n, s in
+                zip(self._neighbors[row, skip:end], self._scores[row, skip:end])]
+
+    def save(self, path: Path):
+        """
+        Save the store to a .npz file, atomically.
+        """
+        path = Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = path.with_suffix('.tmp.npz')
+        np.savez(tmp, k=self.k, ids=self._ids[:self.size], neighbors=self._neighbors[:self.size],
+                 scores=self._scores[:self.size], known=self._known[:self.size], complete=self._complete[:self.size])
+        os.replace(tmp, path)
+
+    @classmethod
+    def load(cls, path: Path) -> "NeighborStore":
+        with np.load(path) as data:
+            store = cls(int(data['k']))
+            size = len(data['known'])
+            if size > len(store._known):
+                store._grow(size)
+            store.size = size
+            store._ids[:size] = data['ids']
+            store._neighbors[:size] = data['neighbors']
+            store._scores[:size] = data['scores']
+            store._known[:size] = data['known']
+            store._complete[:size] = data['complete']
+        for row in range(size):
+            if store._ids[row].any():
+                store._rows[store._id_of(row)] = row
+            else:
+                store._free_rows.append(row)
+        return store
@@ -0,0 +1,349 @@
+import asyncio
+import random
+from pathlib import Path
+from typing import Optional
+
+import numpy
+from loguru import logger
+
+from app.Models.api_models.search_api_model import SearchModelEnum
+from app.Models.mapped_image import MappedImage
+from app.Models.query_params import FilterParams
+from app.Models.scroll_cursor import ScrollCursor
+from app.Models.search_result import SearchResult
+from app.Models.vector_query import VectorQuery
+from app.Services.numpy_vector_store import NumpyVectorStore
+from app.Services.vector_db_context import VectorDbContext, PointNotFoundError
+from app.config import config
+from app.util.vector_rescoring import normalize_rows, combine_scores, average_vector_query, best_score
+
+
+class NumpyVectorDbContext(VectorDbContext):
+    """
+    An embedded engine for the local mode, with the same interface as VectorDbContext.
+    The vectors are kept in memory-mapped matrices (see NumpyVectorStore), so the startup doesn't load the collection
+    into memory, and every search is a brute-force matrix product over the whole collection, masked by the filter.
+    The scores follow the semantics of Qdrant with cosine distance, so the two engines are interchangeable.
+    The searches run in a worker thread while the writes run on the event loop, a lock keeps them from interleaving
+    (a write may grow and remap the matrices, or reuse the rows a search is reading).
+    """
+
+    def __init__(self):
+        self.collection_name = config.qdrant.coll
+        self._write_listeners = []
+        self._lock = asyncio.Lock()
+        self._store = NumpyVectorStore(Path(config.qdrant.local_path) / 'numpy' / self.collection_name,
+                                       [self.IMG_VECTOR, self.TEXT_VECTOR], dim=768,
+                                       dtype=config.qdrant.local_vector_dtype)
+        if self._store.exists():
+            self._store.open()
+
+    async def on_exit(self):
+        async with self._lock:
+            self._store.close()
+
+    def _get_mapped_image_from_row(self, row: int, with_vectors: bool | list[str] = False,
+                                   payload_fields: list[str] | None = None) -> MappedImage:
+        payload = self._store.payload(row)
+        if payload_fields is not None:
+            payload = {k: payload[k] for k in self._get_payload_selector(payload_fields) if k in payload}
+        vector_names = self._store.vector_names if with_vectors is True else (with_vectors or [])
+        vectors = {name: self._store.vector(row, name) for name in vector_names}
+        return MappedImage.from_payload(self._store.id_of(row), payload,
+                                        image_vector=vectors.get(self.IMG_VECTOR),
+                                        text_contain_vector=vectors.get(self.TEXT_VECTOR))
+
+    def _get_rows(self, image_id: list[str]) -> list[int]:
+        rows = [self._store.row_of(t) for t in image_id]
+        missing = {t for t, row in zip(image_id, rows) if row is None}
+        if missing:
+            logger.error("{} points not exist.", len(missing))
+            raise PointNotFoundError(str(missing))
+        return rows
+
+    def _get_mask(self, vector_name: str | None, filter_param: FilterParams | None) -> numpy.ndarray:
+        return self._store.alive_mask(vector_name) & self._store.columns.mask(filter_param, self._store.size)
+
+    @staticmethod
+    def _top_k(scores: numpy.ndarray, mask: numpy.ndarray, top_k: int, skip: int) -> tuple[numpy.ndarray,
+                                                                                          numpy.ndarray]:
+        """
+        Select the rows of a page from the ranking of the masked scores.
+        :return: The rows and their scores, in descending order of score.
+        """
+        candidates = numpy.flatnonzero(mask & numpy.isfinite(scores))
+        candidate_scores = scores[candidates]
+        limit = min(skip + top_k, len(candidates))
+        if limit == 0:
+            return candidates[:0], candidate_scores[:0]
+        # Only the top (skip + top_k) items need to be sorted
+        selected = numpy.argpartition(-candidate_scores, limit - 1)[:limit] \
+            if limit < len(candidates) else numpy.arange(len(candidates))
+        order = selected[numpy.argsort(-candidate_scores[selected], kind='stable')][skip:]
+        return candidates[order], candidate_scores[order]
+
+    def _results(self, rows: numpy.ndarray, scores: numpy.ndarray, with_vectors: bool | list[str] = False,
+                 payload_fields: list[str] | None = None) -> list[SearchResult]:
+        return [SearchResult(img=self._get_mapped_image_from_row(row, with_vectors, payload_fields), score=score)
+                for row, score in zip(rows.tolist(), scores.tolist())]
+
+    def _recommend_scores(self, query_vector_name: str,
+                          search_id: Optional[str],
+                          positive_vectors: Optional[list[numpy.ndarray]],
+                          negative_vectors: Optional[list[numpy.ndarray]],
+                          mode: Optional[SearchModelEnum]) -> numpy.ndarray:
+        if positive_vectors is None:
+            row = self._get_rows([search_id])[0]
+            vector = self._store.vector(row, query_vector_name)
+            positive_vectors = [vector] if vector is not None else []
+        if not positive_vectors:
+            return numpy.full(self._store.size, -numpy.inf, dtype=numpy.float32)
+        positive = numpy.stack(positive_vectors)
+        negative = numpy.stack(negative_vectors) if negative_vectors else None
+
+        if mode == SearchModelEnum.best:
+            # All the examples are scored against the catalog in one scan of the matrix
+            examples = positive if negative is None else numpy.concatenate([positive, negative])
+            return best_score(self._store.scores(query_vector_name, examples), len(positive))
+        return self._store.scores(query_vector_name, average_vector_query(positive, negative))[:, 0]
+
+    async def retrieve_by_id(self, image_id: str, with_vectors=False) -> MappedImage:
+        logger.info("Retrieving item {} from database...", image_id)
+        row = self._store.row_of(image_id)
+        if row is None:
+            logger.error("Point not exist.")
+            raise PointNotFoundError(image_id)
+        return self._get_mapped_image_from_row(row, with_vectors)
+
+    async def retrieve_by_ids(self, image_id: list[str], with_vectors=False,
+                              payload_fields: list[str] | None = None) -> list[MappedImage]:
+        logger.info("Retrieving {} items from database...", len(image_id))
+        return [self._get_mapped_image_from_row(row, with_vectors, payload_fields) for row in self._get_rows(image_id)]
+
+    async def validate_ids(self, image_id: list[str]) -> list[str]:
+        logger.info("Validating {} items from database...", len(image_id))
+        return [t for t in image_id if t in self._store]
+
+    async def query_search(self, query_vector, query_vector_name: str = VectorDbContext.IMG_VECTOR,
+                           top_k=10, skip=0, filter_param: FilterParams | None = None,
+                           payload_fields: list[str] | None = None) -> list[SearchResult]:
+        logger.info("Querying numpy vector store... top_k = {}", top_k)
+
+        def _search():
+            scores = self._store.scores(query_vector_name, query_vector)[:, 0]
+            return self._top_k(scores, self._get_mask(query_vector_name, filter_param), top_k, skip)
+
+        async with self._lock:
+            rows, scores = await asyncio.to_thread(_search)
+            results = self._results(rows, scores, payload_fields=payload_fields)
+        logger.success("Query completed!")
+        return results
+
+    async def random_sampling_ready(self) -> bool:
+        # The random keys are derived from the IDs of the rows, they never need a backfill
+        return True
+
+    async def query_random(self, seed: int, top_k=10, skip=0, filter_param: FilterParams | None = None,
+                           payload_fields: list[str] | None = None) -> list[SearchResult]:
+        logger.info("Sampling random images from numpy vector store... top_k = {}", top_k)
+
+        def _search():
+            rows = numpy.flatnonzero(self._get_mask(None, filter_param))
+            keys = self._store.random_keys()[rows]
+            order = numpy.argsort(keys, kind='stable')
+            rows, keys = rows[order], keys[order]
+            # Same run as VectorDbContext.query_random: from the pivot on, wrapping around to the first key
+            start = numpy.searchsorted(keys, random.Random(seed).random())
+            drawn = numpy.concatenate([rows[start:], rows[:start]])[skip:skip + top_k]
+            return drawn, 1 / (numpy.arange(skip, skip + len(drawn)) + 1)
+
+        async with self._lock:
+            rows, scores = await asyncio.to_thread(_search)
+            results = self._results(rows, scores, payload_fields=payload_fields)
+        logger.success("Sampling completed!")
+        return results
+
+    async def query_batch(self, queries: list[VectorQuery],
+                          payload_fields: list[str] | None = None) -> list[list[SearchResult]]:
+        logger.info("Querying numpy vector store with {} queries in batch...", len(queries))
+
+        def _search():
+            pages = [None] * len(queries)
+            # The queries on the same vector share one scan of the matrix
+            for vector_name in {t.query_vector_name for t in queries}:
+                indexes = [i for i, t in enumerate(queries) if t.query_vector_name == vector_name]
+                scores = self._store.scores(vector_name, numpy.stack([queries[i].query_vector for i in indexes]))
+                alive = self._store.alive_mask(vector_name)
+                for column, i in enumerate(indexes):
+                    query = queries[i]
+                    mask = alive & self._store.columns.mask(query.filter_param, self._store.size)
+                    pages[i] = self._top_k(scores[:, column], mask, query.top_k, query.skip)
+            return pages
+
+        async with self._lock:
+            pages = await asyncio.to_thread(_search)
+            results = [self._results(rows, scores, payload_fields=payload_fields) for rows, scores in pages]
+        logger.success("Batch query completed!")
+        return results
+
+    async def query_similar(self,
+                            query_vector_name: str = VectorDbContext.IMG_VECTOR,
+                            search_id: Optional[str] = None,
+                            positive_vectors: Optional[list[numpy.ndarray]] = None,
+                            negative_vectors: Optional[list[numpy.ndarray]] = None,
+                            mode: Optional[SearchModelEnum] = None,
+                            with_vectors: bool = False,
+                            filter_param: FilterParams | None = None,
+                            top_k: int = 10,
+                            skip: int = 0,
+                            payload_fields: list[str] | None = None) -> list[SearchResult]:
+        _combined_search_need_vectors = [
+            self.IMG_VECTOR if query_vector_name == self.TEXT_VECTOR else self.TEXT_VECTOR] if with_vectors else False
+        logger.info("Querying numpy vector store... top_k = {}", top_k)
+
+        def _search():
+            scores = self._recommend_scores(query_vector_name, search_id, positive_vectors, negative_vectors, mode)
+            mask = self._get_mask(query_vector_name, filter_param)
+            if positive_vectors is None:
+                # Same as Qdrant, the example point itself is excluded from the results
+                mask[self._store.row_of(search_id)] = False
+            return self._top_k(scores, mask, top_k, skip)
+
+        async with self._lock:
+            rows, scores = await asyncio.to_thread(_search)
+            results = self._results(rows, scores, _combined_search_need_vectors, payload_fields)
+        logger.success("Query completed!")
+        return results
+
+    async def query_combined(self,
+                             query_vector_name: str = VectorDbContext.IMG_VECTOR,
+                             positive_vectors: Optional[list[numpy.ndarray]] = None,
+                             negative_vectors: Optional[list[numpy.ndarray]] = None,
+                             extra_vector: Optional[numpy.ndarray] = None,
+                             mode: Optional[SearchModelEnum] = None,
+                             filter_param: FilterParams | None = None,
+                             top_k: int = 10,
+                             skip: int = 0,
+                             payload_fields: list[str] | None = None) -> list[SearchResult]:
+        if extra_vector is None:
+            # Nothing to rescore with, so it is a plain recommendation
+            return await self.query_similar(query_vector_name, None, positive_vectors, negative_vectors, mode,
+                                            filter_param=filter_param, top_k=top_k, skip=skip,
+                                            payload_fields=payload_fields)
+        extra_vector_name = self.IMG_VECTOR if query_vector_name == self.TEXT_VECTOR else self.TEXT_VECTOR
+        candidate_limit = min(max(30, (skip + top_k) * 3), self.COMBINED_SEARCH_MAX_CANDIDATES)
+        logger.info("Querying numpy vector store... top_k = {}, candidates = {}", top_k, candidate_limit)
+
+        def _search():
+            scores = self._recommend_scores(query_vector_name, None, positive_vectors, negative_vectors, mode)
+            rows, base_scores = self._top_k(scores, self._get_mask(query_vector_name, filter_param),
+                                            candidate_limit, 0)
+            vectors, present = self._store.vectors(rows, extra_vector_name)
+            extra_scores = numpy.where(present, vectors @ normalize_rows(extra_vector.astype(numpy.float32)), 0)
+            combined = combine_scores(base_scores, [extra_scores], [1.0])
+            order = numpy.argsort(-combined, kind='stable')[skip:skip + top_k]
+            return rows[order], combined[order]
+
+        async with self._lock:
+            rows, scores = await asyncio.to_thread(_search)
+            results = self._results(rows, scores, payload_fields=payload_fields)
+        logger.success("Query completed!")
+        return results
+
+    async def insert_items(self, items: list[MappedImage]):
+        logger.info("Inserting {} items into numpy vector store...", len(items))
+        async with self._lock:
+            self._store.upsert([str(t.id) for t in items],
+                               {self.IMG_VECTOR: [t.image_vector for t in items],
+                                self.TEXT_VECTOR: [t.text_contain_vector for t in items]},
+                               [t.payload for t in items])
+        logger.success("Insert completed!")
+        self._notify_upsert(items)
+
+    async def delete_items(self, ids: list[str]):
+        logger.info("Deleting {} items from numpy vector store...", len(ids))
+        async with self._lock:
+            self._store.delete(ids)
+        logger.success("Delete completed!")
+        self._notify_delete(ids)
+
+    async def update_payload(self, new_data: MappedImage):
+        self._get_rows([str(new_data.id)])
+        async with self._lock:
+            self._store.set_payload(str(new_data.id), new_data.payload)
+        logger.success("Update completed!")
+        self._notify_upsert([new_data])
+
+    async def update_payloads(self, new_data: list[MappedImage]):
+        self._get_rows([str(t.id) for t in new_data])
+        async with self._lock:
+            self._store.set_payloads([str(t.id) for t in new_data], [t.payload for t in new_data])
+        logger.success("Update of {} payloads completed!", len(new_data))
+        self._notify_upsert(new_data)
+
+    async def update_vectors(self, new_points: list[MappedImage]):
+        ids = [str(t.id) for t in new_points]
+        self._get_rows(ids)
+        async with self._lock:
+            self._store.set_vectors(ids, {self.IMG_VECTOR: [t.image_vector for t in new_points],
+                                          self.TEXT_VECTOR: [t.text_contain_vector for t in new_points]})
+        logger.success("Update vectors completed!")
+
+    async def scroll_points(self,
+                            from_id: str | None = None,
+                            count=50,
+                            with_vectors=False,
+                            filter_param: FilterParams | None = None,
+                            payload_fields: list[str] | None = None,
+                            ) -> tuple[list[MappedImage], str]:
+        # Unlike Qdrant which scrolls in the order of IDs, the points are scrolled in the order of insertion
+        start = self._get_rows([from_id])[0] if from_id is not None else 0
+        rows = numpy.flatnonzero(self._get_mask(None, filter_param)[start:]) + start
+        next_id = self._store.id_of(rows[count]) if len(rows) > count else None
+        return [self._get_mapped_image_from_row(row, with_vectors, payload_fields)
+                for row in rows[:count].tolist()], next_id
+
+    async def scroll_points_by_date(self,
+                                    cursor: ScrollCursor | None = None,
+                                    count=50,
+                                    descending=True,
+                                    filter_param: FilterParams | None = None,
+                                    payload_fields: list[str] | None = None,
+                                    ) -> tuple[list[MappedImage], ScrollCursor | None]:
+        def _scroll():
+            mask = self._get_mask(None, filter_param)
+            # The rows are ranked by descending score, so the earliest date scores highest in ascending order
+            dates = self._store.columns.index_date[:self._store.size]
+            scores = dates if descending else -dates
+            if cursor is not None:
+                bound = cursor.index_date.timestamp()
+                mask &= dates <= bound if descending else dates >= bound
+                for seen_id in cursor.seen_ids:
+                    if (row := self._store.row_of(str(seen_id))) is not None:
+                        mask[row] = False
+            return self._top_k(scores, mask, count + 1, 0)[0]
+
+        async with self._lock:
+            rows = await asyncio.to_thread(_scroll)
+            images = [self._get_mapped_image_from_row(row, payload_fields=payload_fields)
+                      for row in rows[:count].tolist()]
+        return images, ScrollCursor.after(images, cursor) if len(rows) > count else None
+
+    async def get_counts(self, exact: bool) -> int:
+        return len(self._store)
+
+    async def check_collection(self) -> bool:
+        return self._store.exists()
+
+    async def create_payload_indexes(self):
+        # Every filterable field is indexed by the columnar metadata store of the vector store
+        pass
+
+    async def initialize_collection(self):
+        if await self.check_collection():
+            logger.warning("Collection already exists. Skip initialization.")
+            return
+        logger.info("Initializing numpy vector store, collection name: {}", self.collection_name)
+        self._store.create()
+        self._store.open()
+        logger.success("Collection created!")
@@ -0,0 +1,336 @@
+import json
+import os
+import pickle
+from pathlib import Path
+from uuid import UUID
+
+import numpy as np
+from loguru import logger
+
+from app.Services.columnar_metadata import ColumnarMetadataStore
+from app.util.random_key import random_keys
+from app.util.vector_rescoring import normalize_rows
+
+
+class NumpyVectorStore:
+    """
+    A collection of points stored in a directory as memory-mapped numpy matrices.
+    Rows are appended and never moved, a deleted row is only flagged dead. The layout of the directory:
+    - meta.json: The vector dimension, the dtype and the number of rows in use.
+    - ids.npy: The UUID of each row, as uint8[capacity, 16].
+    - flags.npy: The flags of each row, see ROW_ALIVE and vector_flag().
+    - <vector_name>.npy: The L2-normalized vectors of each row, so that the cosine similarity is a dot product.
+    - payload.jsonl: The payload log, one `[row, payload]` record per write. The last record of a row wins.
+    - payload.ckpt: The checkpoint of the payloads and their columns, the log only holds the writes made after it.
+      It's written on close, so opening the store doesn't replay (and re-index) every payload ever written.
+    """
+    ROW_ALIVE = 1
+    INITIAL_CAPACITY = 1024
+    SCORE_CHUNK_ROWS = 65536
+    # Bump when the layout of the checkpoint or of ColumnarMetadataStore changes, older checkpoints are then ignored
+    CHECKPOINT_VERSION = 1
+
+    def __init__(self, path: Path, vector_names: list[str], dim: int = 768, dtype: str = 'float32'):
+        self.path = Path(path)
+        self.vector_names = list(vector_names)
+        self.dim = dim
+        self.dtype = np.dtype(dtype)
+        self.size = 0
+        self._ids: np.ndarray | None = None
+        self._flags: np.ndarray | None = None
+        self._vectors: dict[str, np.ndarray] = {}
+        self._rows: dict[str, int] = {}
+        self._payloads: list[dict | None] = []
+        self.columns = ColumnarMetadataStore()
+        self._log = None
+
+    @property
+    def _meta_path(self):
+        return self.path / 'meta.json'
+
+    @property
+    def _log_path(self):
+        return self.path / 'payload.jsonl'
+
+    @property
+    def _checkpoint_path(self):
+        return self.path / 'payload.ckpt'
+
+    def _array_paths(self) -> dict[str, Path]:
+        return {'ids': self.path / 'ids.npy', 'flags': self.path / 'flags.npy',
+                **{name: self.path / f'{name}.npy' for name in self.vector_names}}
+
+    def exists(self) -> bool:
+        return self._meta_path.exists()
+
+    @property
+    def is_open(self) -> bool:
+        return self._ids is not None
+
+    def vector_flag(self, vector_name: str) -> int:
+        return 1 << (self.vector_names.index(vector_name) + 1)
+
+    def create(self):
+        """
+        Create an empty store in the directory. Existing files will be overwritten.
+        """
+        self.path.mkdir(parents=True, exist_ok=True)
+        shapes = {'ids': ((self.INITIAL_CAPACITY, 16), np.uint8), 'flags': ((self.INITIAL_CAPACITY,), np.uint8),
+                  **{name: ((self.INITIAL_CAPACITY, self.dim), self.dtype) for name in self.vector_names}}
+        for key, file in self._array_paths().items():
+            shape, dtype = shapes[key]
+            np.lib.format.open_memmap(file, mode='w+', dtype=dtype, shape=shape).flush()
+        self._log_path.write_text('')
+        self._checkpoint_path.unlink(missing_ok=True)
+        self.size = 0
+        self._write_meta()
+
+    def open(self):
+        meta = json.loads(self._meta_path.read_text())
+        if meta['dtype'] != self.dtype.name:
+            logger.warning("The numpy vector store was created with dtype {}, ignoring the configured dtype {}.",
+                           meta['dtype'], self.dtype.name)
+        self.dim = meta['dim']
+        self.dtype = np.dtype(meta['dtype'])
+        self.size = meta['size']
+        self._map_arrays()
+
+        alive = np.flatnonzero(self._flags[:self.size] & self.ROW_ALIVE)
+        self._rows = {str(UUID(bytes=self._ids[row].tobytes())): int(row) for row in alive}
+        self._load_checkpoint()
+        replayed = {}
+        with open(self._log_path, encoding='utf-8') as f:
+            for line in f:
+                if not line.strip():
+                    continue
+                row, payload = json.loads(line)
+                if row < self.size:
+                    replayed[row] = payload
+        # Only the rows written after the checkpoint are indexed again
+        for row, payload in replayed.items():
+            self._payloads[row] = payload
+            self.columns.set_row(row, payload)
+        self._log = open(self._log_path, 'a', encoding='utf-8')
+        if replayed:
+            self.checkpoint()
+        logger.success("Numpy vector store loaded, {} points.", len(self._rows))
+
+    def close(self):
+        if not self.is_open:
+            return
+        self.flush()
+        self.checkpoint()
+        self._log.close()
+        self._log = None
+        self._ids = self._flags = None
+        self._vectors = {}
+
+    def flush(self):
+        for arr in [self._ids, self._flags, *self._vectors.values()]:
+            arr.flush()
+        self._log.flush()
+        self._write_meta()
+
+    def _write_meta(self):
+        tmp = self._meta_path.with_suffix('.tmp')
+        tmp.write_text(json.dumps({'dim': self.dim, 'dtype': self.dtype.name, 'size': self.size,
+                                   'vector_names': self.vector_names}))
+        os.replace(tmp, self._meta_path)
+
+    def _map_arrays(self):
+        paths = self._array_paths()
+        self._ids = np.load(paths['ids'], mmap_mode='r+')
+        self._flags = np.load(paths['flags'], mmap_mode='r+')
+        self._vectors = {name: np.load(paths[name], mmap_mode='r+') for name in self.vector_names}
+
+    def _load_checkpoint(self):
+        self._payloads = [None] * self.size
+        self.columns = ColumnarMetadataStore(len(self._flags))
+        if not self._checkpoint_path.exists():
+            return
+        with open(self._checkpoint_path, 'rb') as f:
+            # The payloads are plain data, they are pickled first so that they can be read whatever the version
+            header = pickle.load(f)
+            payloads = header['payloads'][:self.size]
+            self._payloads[:len(payloads)] = payloads
+            if header['version'] == self.CHECKPOINT_VERSION:
+                self.columns = pickle.load(f)
+                return
+        logger.warning("The payload checkpoint of the numpy vector store is outdated, rebuilding the columns...")
+        for row in self._rows.values():
+            self.columns.set_row(row, self._payloads[row])
+
+    def checkpoint(self):
+        """
+        Write the payloads and their columns to the checkpoint, then truncate the payload log.
+        A crash between the two steps is harmless, replaying the log over the checkpoint gives the same payloads.
+        """
+        tmp = self._checkpoint_path.with_suffix('.tmp')
+        with open(tmp, 'wb') as f:
+            pickle.dump({'version': self.CHECKPOINT_VERSION, 'payloads': self._payloads}, f,
+                        protocol=pickle.HIGHEST_PROTOCOL)
+            pickle.dump(self.columns, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp, self._checkpoint_path)
+        self._log.truncate(0)
+        self._log.flush()
+
+    def _ensure_capacity(self, rows: int):
+        capacity = len(self._flags)
+        if rows <= capacity:
+            return
+        new_capacity = max(rows, capacity * 2)
+        logger.info("Growing the numpy vector store from {} to {} rows...", capacity, new_capacity)
+        arrays = {'ids': self._ids, 'flags': self._flags, **self._vectors}
+        for key, file in self._array_paths().items():
+            old = arrays[key]
+            tmp = file.with_suffix('.tmp.npy')
+            new = np.lib.format.open_memmap(tmp, mode='w+', dtype=old.dtype, shape=(new_capacity, *old.shape[1:]))
+            new[:self.size] = old[:self.size]
+            new.flush()
+            del new
+            os.replace(tmp, file)
+        self._map_arrays()
+
+    def _append_log(self, records: list[tuple[int, dict | None]]):
+        self._log.write(''.join(json.dumps([row, payload]) + '\n' for row, payload in records))
+
+    def row_of(self, point_id: str) -> int | None:
+        return self._rows.get(str(point_id))
+
+    def id_of(self, row: int) -> str:
+        return str(UUID(bytes=self._ids[row].tobytes()))
+
+    def __len__(self):
+        return len(self._rows)
+
+    def __contains__(self, point_id: str):
+        return str(point_id) in self._rows
+
+    def upsert(self, ids: list[str], vectors: dict[str, list[np.ndarray | None]], payloads: list[dict]):
+        """
+        Insert the points, or replace them if they already exist (including the vectors which are not given).
+        :param ids: The IDs of the points.
+        :param vectors: The vectors of each point by vector name, None for a missing vector.
+        :param payloads: The payload of each point.
+        """
+        assigned = {}
+        next_row = self.size
+        for point_id in map(str, ids):
+            if point_id in assigned:
+                continue
+            row = self._rows.get(point_id)
+            if row is None:
+                row, next_row = next_row, next_row + 1
+            assigned[point_id] = row
+        self._ensure_capacity(next_row)
+        rows = np.array([assigned[str(t)] for t in ids], dtype=np.int64)
+
+        self._ids[rows] = np.frombuffer(b''.join(UUID(str(t)).bytes for t in ids), dtype=np.uint8).reshape(-1, 16)
+        flags = np.full(len(rows), self.ROW_ALIVE, dtype=np.uint8)
+        for name in self.vector_names:
+            self._write_vectors(rows, name, vectors.get(name, [None] * len(rows)), flags)
+        self._flags[rows] = flags
+
+        self._rows.update(assigned)
+        self.size = next_row
+        if len(self._payloads) < self.size:
+            self._payloads.extend([None] * (self.size - len(self._payloads)))
+        for row, payload in zip(rows.tolist(), payloads):
+            self._payloads[row] = payload
+            self.columns.set_row(row, payload)
+        self._append_log(list(zip(rows.tolist(), payloads)))
+        self.flush()
+
+    def _write_vectors(self, rows: np.ndarray, vector_name: str, vectors: list[np.ndarray | None],
+                       flags: np.ndarray):
+        present = [i for i, t in enumerate(vectors) if t is not None]
+        if not present:
+            return
+        stacked = normalize_rows(np.stack([vectors[i] for i in present]).astype(np.float32, copy=False))
+        self._vectors[vector_name][rows[present]] = stacked.astype(self.dtype, copy=False)
+        flags[present] |= self.vector_flag(vector_name)
+
+    def set_vectors(self, ids: list[str], vectors: dict[str, list[np.ndarray | None]]):
+        """
+        Update the given vectors of existing points, the vectors that are None are left untouched.
+        """
+        rows = np.array([self._rows[str(t)] for t in ids], dtype=np.int64)
+        flags = self._flags[rows].copy()
+        for name, values in vectors.items():
+            self._write_vectors(rows, name, values, flags)
+        self._flags[rows] = flags
+        self.flush()
+
+    def set_payload(self, point_id: str, payload: dict):
+        """
+        Merge the given keys into the payload of an existing point.
+        """
+        self.set_payloads([point_id], [payload])
+
+    def set_payloads(self, ids: list[str], payloads: list[dict]):
+        """
+        Merge the given keys into the payloads of existing points, with one write of the log for all of them.
+        """
+        records = []
+        for point_id, payload in zip(ids, payloads):
+            row = self._rows[str(point_id)]
+            merged = {**(self._payloads[row] or {}), **payload}
+            self._payloads[row] = merged
+            self.columns.set_row(row, merged)
+            records.append((row, merged))
+        self._append_log(records)
+        self.flush()
+
+    def delete(self, ids: list[str]):
+        rows = [row for t in ids if (row := self._rows.pop(str(t), None)) is not None]
+        if not rows:
+            return
+        self._flags[rows] = 0
+        for row in rows:
+            self._payloads[row] = None
+            self.columns.set_row(row, None)
+        self._append_log([(row, None) for row in rows])
+        self.flush()
+
+    def payload(self, row: int) -> dict:
+        return self._payloads[row]
+
+    def vector(self, row: int, vector_name: str) -> np.ndarray | None:
+        if not self._flags[row] & self.vector_flag(vector_name):
+            return None
+        return np.array(self._vectors[vector_name][row], dtype=np.float32)
+
+    def vectors(self, rows: np.ndarray, vector_name: str) -> tuple[np.ndarray, np.ndarray]:
+        """
+        Gather the vectors of the given rows.
+        :return: The vectors as a float32 matrix (zero rows for missing vectors) and the mask of present vectors.
+        """
+        present = (self._flags[rows] & self.vector_flag(vector_name)) != 0
+        return np.asarray(self._vectors[vector_name][rows], dtype=np.float32), present
+
+    def alive_mask(self, vector_name: str | None = None) -> np.ndarray:
+        """
+        :return: The mask of alive rows, which have the given vector if vector_name is specified.
+        """
+        flags = self._flags[:self.size]
+        required = self.ROW_ALIVE | (self.vector_flag(vector_name) if vector_name is not None else 0)
+        return (flags & required) == required
+
+    def random_keys(self) -> np.ndarray:
+        """
+        :return: The random sort key of every row (see random_key), shape (size,).
+        """
+        return random_keys(self._ids[:self.size])
+
+    def scores(self, vector_name: str, queries: np.ndarray) -> np.ndarray:
+        """
+        Cosine similarity of every row against every query, shape (size, m).
+        The matrix is scanned in chunks, so float16 vectors are converted without materializing the whole matrix.
+        """
+        queries = normalize_rows(np.atleast_2d(np.asarray(queries, dtype=np.float32)))
+        matrix = self._vectors[vector_name]
+        result = np.empty((self.size, queries.shape[0]), dtype=np.float32)
+        for start in range(0, self.size, self.SCORE_CHUNK_ROWS):
+            end = min(start + self.SCORE_CHUNK_ROWS, self.size)
+            result[start:end] = np.asarray(matrix[start:end], dtype=np.float32) @ queries.T
+        return result
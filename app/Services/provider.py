@@ -2,6 +2,7 @@ import asyncio
 import os
 from pathlib import Path
 from loguru import logger
+from starlette.requests import Request
 
 from .index_service import IndexService
 from .lifespan_service import LifespanService
@@ -9,8 +10,12 @@ from .storage import StorageService
 from .transformers_service import TransformersService
 from .wd14_tagger_service import WD14TaggerService
 from .upload_service import UploadService
-from .vector_db_context import VectorDbContext
+from .vector_db_context import create_vector_db_context
 from .local_search_service import LocalSearchService
+from .search_cursor_service import SearchCursorService
+from .neighbor_graph_service import NeighborGraphService
+from .image_variant_service import ImageVariantService
+from .sprite_sheet_service import SpriteSheetService
 from ..config import config, environment
 
 
@@ -21,7 +26,7 @@ class ServiceProvider:
         
         # Initialize appropriate search service based on configuration
         if config.local_search.enabled:
-            self.db_context = VectorDbContext()
+            self.db_context = create_vector_db_context()
             self.search_service = LocalSearchService(
                 self.transformers_service, 
                 self.tagger_service,
@@ -29,9 +34,12 @@ class ServiceProvider:
             )
             logger.info("Using LocalSearchService for image search")
         else:
-            self.search_service = VectorDbContext()
+            self.search_service = create_vector_db_context()
             self.db_context = self.search_service  # Backward compatibility
             logger.info("Using VectorDbContext for image search")
+        self.cursor_service = SearchCursorService()
+        self.db_context.add_write_listener(self.cursor_service)
+        self.neighbor_graph_service = NeighborGraphService(self.db_context)
 
         self.ocr_service = None
 
@@ -61,6 +69,9 @@ class ServiceProvider:
         )
         self.storage_service = StorageService()
         logger.info(f"Storage service '{type(self.storage_service.active_storage).__name__}' initialized.")
+        self.image_variant_service = ImageVariantService(self.storage_service)
+        self.sprite_sheet_service = SpriteSheetService(self.storage_service, self.db_context,
+                                                       self.image_variant_service)
 
         self.upload_service = UploadService(self.storage_service, self.search_service, self.index_service)
         logger.info(f"Upload service '{type(self.upload_service).__name__}' initialized")
@@ -97,3 +108,10 @@ class ServiceProvider:
         tasks = [service.on_exit() for service_name in dir(self)
                  if isinstance((service := getattr(self, service_name)), LifespanService)]
         await asyncio.gather(*tasks)
+
+
+def get_services(request: Request) -> ServiceProvider:
+    """
+    The dependency of the app-scoped services, which are created once at startup (see webapp.lifespan).
+    """
+    return request.app.state.services
@@ -0,0 +1,157 @@
+import asyncio
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from time import monotonic
+from typing import Awaitable, Callable
+from uuid import uuid4
+
+from loguru import logger
+
+from app.Models.errors import CursorMismatchError
+from app.Models.mapped_image import MappedImage
+from app.Models.query_params import SearchPagingParams
+from app.Models.search_cursor import SearchCursor
+from app.Models.search_result import SearchResult
+from app.Services.lifespan_service import LifespanService
+from app.Services.vector_db_context import CollectionWriteListener
+
+PageQueryType = Callable[[int, int], Awaitable[list[SearchResult]]]
+
+
+@dataclass
+class _ResultWindow:
+    results: list[SearchResult] = field(default_factory=list)
+    exhausted: bool = False
+    created_at: float = field(default_factory=monotonic)
+    # Held while the window grows, so that concurrent requests of the same query don't fetch the same slice
+    lock: asyncio.Lock = field(default_factory=asyncio.Lock)
+
+
+class SearchCursorService(LifespanService, CollectionWriteListener):
+    """
+    Serve paginated searches from a per-query window of ranked results.
+    The window is grown geometrically on demand, so walking N pages through the cursor costs O(N) engine work in total
+    instead of O(N^2) with plain offsets. Queries whose window is unavailable (evicted, expired or on another instance)
+    fall back to an offset query guarded by the score/ID bound of the cursor.
+    The windows are dropped on every write to the collection, which also bumps the write generation.
+    """
+
+    def __init__(self, max_entries: int = 256, ttl: float = 300, max_window: int = 1000):
+        self._windows: OrderedDict[str, _ResultWindow] = OrderedDict()
+        self._max_entries = max_entries
+        self._ttl = ttl
+        self._max_window = max_window
+        self._instance_id = uuid4().hex
+        self._write_count = 0
+
+    def _get_window(self, fingerprint: str) -> _ResultWindow | None:
+        window = self._windows.get(fingerprint)
+        if window is None:
+            return None
+        if monotonic() - window.created_at > self._ttl:
+            del self._windows[fingerprint]
+            return None
+        self._windows.move_to_end(fingerprint)
+        return window
+
+    def _new_window(self, fingerprint: str) -> _ResultWindow:
+        window = self._windows[fingerprint] = _ResultWindow()
+        while len(self._windows) > self._max_entries:
+            self._windows.popitem(last=False)
+        return window
+
+    @property
+    def max_window(self) -> int:
+        """
+        The most results of a query kept in its window.
+        """
+        return self._max_window
+
+    def invalidate(self):
+        self._windows.clear()
+
+    @property
+    def generation(self) -> str:
+        """
+        The write generation of the collection, changed by every write made through this instance.
+        It's unique to the process, so that the generations of a restarted or another instance never collide.
+        """
+        return f"{self._instance_id}-{self._write_count}"
+
+    def _on_write(self):
+        self._write_count += 1
+        self.invalidate()
+
+    def on_upsert(self, items: list[MappedImage]):
+        self._on_write()
+
+    def on_delete(self, ids: list[str]):
+        self._on_write()
+
+    async def fetch_page(self, fingerprint: str, paging: SearchPagingParams,
+                         query: PageQueryType) -> tuple[list[SearchResult], str | None]:
+        """
+        Fetch a page of results for the given query.
+        Will raise CursorMismatchError if the cursor in paging was issued for another query.
+        :param fingerprint: The fingerprint of the query, see app.util.query_fingerprint.
+        :param paging: The paging params of the request.
+        :param query: The actual query, called as query(top_k, skip).
+        :return: The results of the page and the cursor token of the next page (None if there are no more results).
+        """
+        bound = paging.cursor
+        if bound is not None and bound.fingerprint != fingerprint:
+            raise CursorMismatchError("The cursor doesn't belong to this query.")
+        position = bound.position if bound is not None else paging.skip
+        end = position + paging.count
+
+        window = self._get_window(fingerprint)
+        if window is None and position == 0:
+            window = self._new_window(fingerprint)
+        if window is not None and bound is not None and (
+                len(window.results) < position or window.results[position - 1].img.id != bound.id):
+            # The window has drifted from what the client has seen, rebuild it from scratch
+            del self._windows[fingerprint]
+            window = None
+
+        if window is not None and end <= self._max_window:
+            async with window.lock:
+                # One result past the page tells whether there is a next page
+                if len(window.results) < min(end + 1, self._max_window) and not window.exhausted:
+                    have = len(window.results)
+                    target = min(max(have * 2, end + 1), self._max_window)
+                    logger.info("Growing result window of query {} from {} to {}", fingerprint, have, target)
+                    fetched = await query(target - have, have)
+                    window.results.extend(sorted(fetched, key=SearchCursor.rank_key))
+                    window.exhausted = len(fetched) < target - have
+            # Copy the items since the postprocessing will rewrite their urls
+            page = [SearchResult(img=t.img.model_copy(), score=t.score) for t in window.results[position:end]]
+            next_position = position + len(page)
+            has_more = len(window.results) > next_position or not window.exhausted
+        else:
+            page, next_position, has_more = await self._fetch_after(bound, position, paging.count, query)
+
+        next_cursor = SearchCursor.after(fingerprint, next_position, page[-1]).encode() \
+            if has_more and page else None
+        return page, next_cursor
+
+    @staticmethod
+    async def _fetch_after(bound: SearchCursor | None, position: int, count: int,
+                           query: PageQueryType) -> tuple[list[SearchResult], int, bool]:
+        """
+        Fetch a page with offset queries, dropping the results the client has already seen according to the bound of
+        its cursor (the ranking may have shifted since), and fetching more until the page is full.
+        :return: The results, the position after the last one, and whether there may be more results.
+        """
+        page = []
+        skip = position
+        while len(page) < count:
+            need = count - len(page)
+            # One result past the page tells whether there is a next page
+            fetched = sorted(await query(need + 1, skip), key=SearchCursor.rank_key)
+            exhausted = len(fetched) <= need
+            fetched = fetched[:need]
+            skip += len(fetched)
+            page.extend(t for t in fetched if bound is None or not bound.precedes(t))
+            if exhausted:
+                return page, skip, False
+        return page, skip, True
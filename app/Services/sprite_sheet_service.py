@@ -0,0 +1,169 @@
+import asyncio
+from io import BytesIO
+from uuid import UUID
+
+import aiofiles
+from PIL import Image
+from loguru import logger
+
+from app.Models.api_models.images_query_params import VariantFormatEnum
+from app.Models.api_response.images_api_response import SpriteSheetApiResponse, SpriteTile
+from app.Models.mapped_image import MappedImage
+from app.Services.image_variant_service import ImageVariantService
+from app.Services.lifespan_service import LifespanService
+from app.Services.storage import StorageService
+from app.Services.vector_db_context import VectorDbContext
+from app.config import config
+from app.util.disk_lru_cache import DiskLRUCache
+from app.util.gather_bounded import gather_bounded
+from app.util.query_fingerprint import query_fingerprint
+from app.util.storage_keys import stored_thumbnail_key
+
+# The maximum width of a sprite sheet, the tiles wrap to a new row beyond it
+SPRITE_MAX_WIDTH = 2048
+# The maximum number of tile sources read at the same time
+FETCH_CONCURRENCY = 16
+
+
+def pack_sprite(tiles: list[tuple[str, bytes]], tile_height: int) -> tuple[bytes, int, int, dict[str, SpriteTile]]:
+    """
+    Pack images into one WebP sprite sheet, in rows of tiles scaled to the same height (shelf packing).
+    :param tiles: The key and the encoded image of each tile, in the order of the sheet.
+    :return: The encoded sheet, its width and height, and the position of each tile by key.
+    """
+    scaled = []
+    for key, data in tiles:
+        with Image.open(BytesIO(data)) as img:
+            width = max(1, min(SPRITE_MAX_WIDTH, round(img.width * tile_height / img.height)))
+            scaled.append((key, img.convert('RGBA').resize((width, tile_height), Image.Resampling.LANCZOS)))
+
+    positions: dict[str, SpriteTile] = {}
+    x = y = sheet_width = 0
+    for key, img in scaled:
+        if x + img.width > SPRITE_MAX_WIDTH:
+            x, y = 0, y + tile_height
+        positions[key] = SpriteTile(x=x, y=y, width=img.width, height=tile_height)
+        x += img.width
+        sheet_width = max(sheet_width, x)
+    sheet_height = y + tile_height if scaled else 0
+
+    sheet = Image.new('RGBA', (max(1, sheet_width), max(1, sheet_height)))
+    for key, img in scaled:
+        sheet.paste(img, (positions[key].x, positions[key].y))
+    out = BytesIO()
+    sheet.save(out, 'WEBP', quality=80)
+    return out.getvalue(), sheet_width, sheet_height, positions
+
+
+class SpriteSheetService(LifespanService):
+    """
+    Pack the thumbnails of a list of images (e.g. a page of results) into one sprite sheet, so that a grid is loaded
+    in one image request.
+    A sheet is identified by the hash of the IDs it contains and its tile height, so that its URL is immutable. The
+    sheets and their offset maps are kept in a size-bounded LRU disk cache, with the map of each requested ID set
+    (in any order). The tiles are read from the stored thumbnails, or from a resized variant for the images without
+    one.
+    """
+
+    def __init__(self, storage_service: StorageService, db_context: VectorDbContext,
+                 variant_service: ImageVariantService):
+        self._storage_service = storage_service
+        self._db_context = db_context
+        self._variant_service = variant_service
+        self.enabled = config.sprite_sheet.enable
+        self._cache = DiskLRUCache(config.sprite_sheet.path, config.sprite_sheet.max_cache_size_mb * 1024 * 1024)
+        self._generating: dict[str, asyncio.Task] = {}
+
+    async def on_load(self):
+        if self.enabled:
+            await asyncio.to_thread(self._cache.load)
+
+    @staticmethod
+    def _hash(image_ids: list[UUID] | list[str], tile_height: int) -> str:
+        return query_fingerprint("sprite", sorted(str(t) for t in image_ids), tile_height)
+
+    async def get_sheet(self, image_ids: list[UUID], tile_height: int) -> SpriteSheetApiResponse:
+        """
+        Get the offset map of the sprite sheet of the given images, generating the sheet if it's not cached.
+        """
+        image_ids = sorted(set(image_ids), key=str)
+        request_hash = self._hash(image_ids, tile_height)
+        sheet = await self._read_map(f"requests/{request_hash}.json")
+        if sheet is not None and (not sheet.missing or
+                                  not await self._db_context.validate_ids([str(t) for t in sheet.missing])):
+            return sheet
+        # Not cached, or some of the missing images have been indexed since
+        return (await self._generate_once(request_hash, image_ids, tile_height))[0]
+
+    async def get_sheet_image(self, sprite_id: str) -> bytes | None:
+        """
+        :return: The encoded sprite sheet, regenerated if it has been evicted but its map is cached. None if the
+        sheet is unknown.
+        """
+        if (path := await asyncio.to_thread(self._cache.get, f"sheets/{sprite_id}.webp")) is not None:
+            try:
+                async with aiofiles.open(path, 'rb') as f:
+                    return await f.read()
+            except FileNotFoundError:
+                pass
+        sheet = await self._read_map(f"sheets/{sprite_id}.json")
+        if sheet is None:
+            return None
+        return (await self._generate_once(sprite_id, list(sheet.tiles), sheet.tile_height))[1]
+
+    async def _read_map(self, key: str) -> SpriteSheetApiResponse | None:
+        path = await asyncio.to_thread(self._cache.get, key)
+        if path is None:
+            return None
+        try:
+            async with aiofiles.open(path, 'rb') as f:
+                return SpriteSheetApiResponse.model_validate_json(await f.read())
+        except FileNotFoundError:
+            return None
+
+    async def _generate_once(self, task_key: str, image_ids: list[UUID], tile_height: int) \
+            -> tuple[SpriteSheetApiResponse, bytes]:
+        task = self._generating.get(task_key)
+        if task is None:
+            task = self._generating[task_key] = asyncio.create_task(
+                self._generate(image_ids, tile_height))
+            task.add_done_callback(lambda _: self._generating.pop(task_key, None))
+        return await asyncio.shield(task)
+
+    async def _generate(self, image_ids: list[UUID], tile_height: int) -> tuple[SpriteSheetApiResponse, bytes]:
+        logger.info("Generating the sprite sheet of {} images...", len(image_ids))
+        valid_ids = set(await self._db_context.validate_ids([str(t) for t in image_ids]))
+        images = await self._db_context.retrieve_by_ids([str(t) for t in image_ids if str(t) in valid_ids])
+        sources = await gather_bounded((self._fetch_tile(t) for t in images), FETCH_CONCURRENCY)
+        tiles = [(str(img.id), data) for img, data in zip(images, sources) if data is not None]
+        data, width, height, positions = await asyncio.to_thread(pack_sprite, tiles, tile_height)
+        # The sheet is identified by the images it actually contains, so that its content never changes
+        sprite_id = self._hash(list(positions), tile_height)
+        sheet = SpriteSheetApiResponse(message=f"Successfully packed {len(positions)} images.",
+                                       sprite_url=f"/sprites/{sprite_id}.webp",
+                                       tile_height=tile_height,
+                                       width=width,
+                                       height=height,
+                                       tiles=positions,
+                                       missing=[t for t in image_ids if str(t) not in valid_ids],
+                                       unavailable=[t for t in image_ids
+                                                    if str(t) in valid_ids and str(t) not in positions])
+        sheet_json = sheet.model_dump_json().encode()
+        await asyncio.to_thread(self._cache.put, f"sheets/{sprite_id}.webp", data)
+        await asyncio.to_thread(self._cache.put, f"sheets/{sprite_id}.json", sheet_json)
+        await asyncio.to_thread(self._cache.put, f"requests/{self._hash(image_ids, tile_height)}.json", sheet_json)
+        return sheet, data
+
+    async def _fetch_tile(self, image: MappedImage) -> bytes | None:
+        """
+        :return: The encoded thumbnail of an image, None if it's not available.
+        """
+        try:
+            if image.local_thumbnail and config.storage.method.enabled:
+                return await self._storage_service.active_storage.fetch(stored_thumbnail_key(image))
+            if self._variant_service.enabled:
+                return await self._variant_service.get_variant(image, ImageVariantService.snap_width(256),
+                                                               VariantFormatEnum.webp)
+        except Exception as ex:
+            logger.warning("Cannot read the thumbnail of image {}: {}", image.id, ex)
+        return None
@@ -1,5 +1,6 @@
 from app.Services.lifespan_service import LifespanService
 from app.Services.storage.base import BaseStorage
+from app.Services.storage.cached_storage import CachedStorage
 from app.Services.storage.disabled_storage import DisabledStorage
 from app.Services.storage.local_storage import LocalStorage
 from app.Services.storage.s3_compatible_storage import S3Storage
@@ -19,6 +20,9 @@ class StorageService(LifespanService):
             case _:
                 raise NotImplementedError(f"Storage method {config.storage.method} not implemented. "
                                           f"Available methods: local, s3")
+        if config.storage.cache.enable and config.storage.method.enabled:
+            self.active_storage = CachedStorage(self.active_storage, config.storage.cache.path,
+                                                config.storage.cache.max_cache_size_mb * 1024 * 1024)
 
     async def on_load(self):
         await self.active_storage.on_load()
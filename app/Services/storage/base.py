@@ -1,6 +1,6 @@
 import abc
 import os
-from typing import TypeVar, Generic, TypeAlias, Optional, AsyncGenerator
+from typing import TypeVar, Generic, TypeAlias, Optional, AsyncGenerator, AsyncIterable
 
 from app.Services.lifespan_service import LifespanService
 
@@ -12,6 +12,9 @@ RemoteFilePathType: TypeAlias = PathLikeType
 LocalFileMetaDataType: TypeAlias = FileMetaDataT
 RemoteFileMetaDataType: TypeAlias = FileMetaDataT
 
+# The default size of the chunks of a streamed file
+STREAM_CHUNK_SIZE = 1024 * 1024
+
 
 class BaseStorage(LifespanService, abc.ABC, Generic[FileMetaDataT]):
     def __init__(self):
@@ -63,6 +66,15 @@ class BaseStorage(LifespanService, abc.ABC, Generic[FileMetaDataT]):
         """
         raise NotImplementedError
 
+    def presign_epoch(self, expire_second: int = 3600) -> int:
+        """
+        Get the current epoch of the presign URLs: the URLs handed out by presign_url stay valid until the end of the
+        next epoch at least, so a response containing them can be reused within the same epoch.
+        Storages whose presign URLs never expire are always in the same epoch.
+        :param expire_second: Valid time for presign url
+        """
+        return 0
+
     @abc.abstractmethod
     async def fetch(self,
                     remote_file: RemoteFilePathType) -> bytes:
@@ -73,6 +85,25 @@ class BaseStorage(LifespanService, abc.ABC, Generic[FileMetaDataT]):
         """
         raise NotImplementedError
 
+    async def stream(self,
+                     remote_file: RemoteFilePathType,
+                     chunk_size: int = STREAM_CHUNK_SIZE,
+                     offset: int = 0,
+                     length: Optional[int] = None) -> AsyncGenerator[bytes, None]:
+        """
+        Read a file (or a range of it) in chunks, so that a large file is read with bounded memory.
+        The default implementation fetches the whole file, a storage able to read ranges should override it.
+        :param remote_file: The file path relative to static_dir
+        :param chunk_size: The maximum size of each chunk
+        :param offset: The offset of the range to read
+        :param length: The length of the range to read, None to read to the end of the file
+        :return: An asynchronous generator yielding the chunks of the file
+        """
+        data = await self.fetch(remote_file)
+        end = len(data) if length is None else min(len(data), offset + length)
+        for start in range(offset, end, chunk_size):
+            yield data[start:min(start + chunk_size, end)]
+
     @abc.abstractmethod
     async def upload(self,
                      local_file: "LocalFilePathType",
@@ -84,6 +115,18 @@ class BaseStorage(LifespanService, abc.ABC, Generic[FileMetaDataT]):
         """
         raise NotImplementedError
 
+    async def upload_stream(self,
+                            chunks: AsyncIterable[bytes],
+                            remote_file: RemoteFilePathType) -> None:
+        """
+        Write a file from chunks, so that a large file is written with bounded memory.
+        The default implementation joins the chunks and uploads them at once, a storage able to write in parts should
+        override it.
+        :param chunks: The content of the file, in chunks
+        :param remote_file: The file path relative to static_dir
+        """
+        await self.upload(b''.join([t async for t in chunks]), remote_file)
+
     @abc.abstractmethod
     async def copy(self,
                    old_remote_file: RemoteFilePathType,
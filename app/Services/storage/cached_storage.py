@@ -0,0 +1,160 @@
+import asyncio
+from pathlib import PurePosixPath
+from typing import Optional, AsyncGenerator, AsyncIterable
+
+import aiofiles
+from loguru import logger
+
+from app.Services.storage.base import BaseStorage, FileMetaDataT, RemoteFilePathType, LocalFilePathType, \
+    LocalFileMetaDataType, RemoteFileMetaDataType, STREAM_CHUNK_SIZE
+from app.util.disk_lru_cache import DiskLRUCache
+from app.util.local_file_utility import read_chunks
+
+
+class CachedStorage(BaseStorage[FileMetaDataT]):
+    """
+    A read-through cache of the files of another storage, kept in a size-bounded LRU disk cache.
+    fetch, size and is_exist are served from the disk when the file is cached. The writes go to the wrapped storage
+    and invalidate the cached files they change. The files changed behind the server's back are not detected, which
+    is fine for the images stored by their ID, since they are never rewritten.
+    """
+
+    def __init__(self, storage: BaseStorage, directory: str, max_bytes: int):
+        super().__init__()
+        self.storage = storage
+        self.static_dir = storage.static_dir
+        self.thumbnails_dir = storage.thumbnails_dir
+        self.deleted_dir = storage.deleted_dir
+        self.file_metadata = storage.file_metadata
+        self._cache = DiskLRUCache(directory, max_bytes)
+
+    async def on_load(self):
+        await self.storage.on_load()
+        await asyncio.to_thread(self._cache.load)
+
+    async def on_exit(self):
+        await self.storage.on_exit()
+
+    def _cache_key(self, remote_file: RemoteFilePathType) -> str | None:
+        key = PurePosixPath(remote_file).as_posix()
+        try:
+            self._cache.path_of(key)
+        except ValueError:
+            # e.g. an absolute path returned by list_files, which is not cached
+            return None
+        return key
+
+    async def _invalidate(self, *remote_files: RemoteFilePathType):
+        for key in filter(None, map(self._cache_key, remote_files)):
+            await asyncio.to_thread(self._cache.remove, key)
+
+    async def is_exist(self,
+                       remote_file: RemoteFilePathType) -> bool:
+        key = self._cache_key(remote_file)
+        if key is not None and key in self._cache:
+            return True
+        return await self.storage.is_exist(remote_file)
+
+    async def size(self,
+                   remote_file: RemoteFilePathType) -> int:
+        key = self._cache_key(remote_file)
+        if key is not None and (path := await asyncio.to_thread(self._cache.get, key)) is not None:
+            try:
+                return path.stat().st_size
+            except FileNotFoundError:
+                pass
+        return await self.storage.size(remote_file)
+
+    async def url(self,
+                  remote_file: RemoteFilePathType) -> str:
+        return await self.storage.url(remote_file)
+
+    async def presign_url(self,
+                          remote_file: RemoteFilePathType,
+                          expire_second: int = 3600) -> str:
+        return await self.storage.presign_url(remote_file, expire_second)
+
+    def presign_epoch(self, expire_second: int = 3600) -> int:
+        return self.storage.presign_epoch(expire_second)
+
+    async def fetch(self,
+                    remote_file: RemoteFilePathType) -> bytes:
+        key = self._cache_key(remote_file)
+        if key is None:
+            return await self.storage.fetch(remote_file)
+        if (path := await asyncio.to_thread(self._cache.get, key)) is not None:
+            try:
+                async with aiofiles.open(path, 'rb') as f:
+                    return await f.read()
+            except FileNotFoundError:
+                # Evicted since the lookup
+                pass
+        data = await self.storage.fetch(remote_file)
+        await asyncio.to_thread(self._cache.put, key, data)
+        logger.debug("File {} cached, {} bytes.", key, len(data))
+        return data
+
+    async def stream(self,
+                     remote_file: RemoteFilePathType,
+                     chunk_size: int = STREAM_CHUNK_SIZE,
+                     offset: int = 0,
+                     length: Optional[int] = None) -> AsyncGenerator[bytes, None]:
+        # A streamed file is not added to the cache, which would need to buffer it, but is served from it if cached
+        key = self._cache_key(remote_file)
+        path = await asyncio.to_thread(self._cache.get, key) if key is not None else None
+        try:
+            file = await aiofiles.open(path, 'rb') if path is not None else None
+        except FileNotFoundError:
+            file = None
+        if file is None:
+            async for chunk in self.storage.stream(remote_file, chunk_size, offset, length):
+                yield chunk
+            return
+        try:
+            async for chunk in read_chunks(file, chunk_size, offset, length):
+                yield chunk
+        finally:
+            await file.close()
+
+    async def upload(self,
+                     local_file: LocalFilePathType,
+                     remote_file: RemoteFilePathType) -> None:
+        await self.storage.upload(local_file, remote_file)
+        await self._invalidate(remote_file)
+
+    async def upload_stream(self,
+                            chunks: AsyncIterable[bytes],
+                            remote_file: RemoteFilePathType) -> None:
+        await self.storage.upload_stream(chunks, remote_file)
+        await self._invalidate(remote_file)
+
+    async def copy(self,
+                   old_remote_file: RemoteFilePathType,
+                   new_remote_file: RemoteFilePathType) -> None:
+        await self.storage.copy(old_remote_file, new_remote_file)
+        await self._invalidate(new_remote_file)
+
+    async def move(self,
+                   old_remote_file: RemoteFilePathType,
+                   new_remote_file: RemoteFilePathType) -> None:
+        await self.storage.move(old_remote_file, new_remote_file)
+        await self._invalidate(old_remote_file, new_remote_file)
+
+    async def delete(self,
+                     remote_file: RemoteFilePathType) -> None:
+        await self.storage.delete(remote_file)
+        await self._invalidate(remote_file)
+
+    async def list_files(self,
+                         path: RemoteFilePathType,
+                         pattern: Optional[str] = "*",
+                         batch_max_files: Optional[int] = None,
+                         valid_extensions: Optional[set[str]] = None) \
+            -> AsyncGenerator[list[RemoteFilePathType], None]:
+        async for batch in self.storage.list_files(path, pattern, batch_max_files, valid_extensions):
+            yield batch
+
+    async def update_metadata(self,
+                              local_file_metadata: LocalFileMetaDataType,
+                              remote_file_metadata: RemoteFileMetaDataType) -> None:
+        await self.storage.update_metadata(local_file_metadata, remote_file_metadata)
@@ -1,17 +1,19 @@
 import os
+import re
 from asyncio import to_thread
-from pathlib import Path as syncPath
+from pathlib import Path as syncPath, PurePosixPath
 from shutil import copy2, move
-from typing import Optional, AsyncGenerator
+from typing import Optional, AsyncGenerator, AsyncIterable
 
 import aiofiles
 from loguru import logger
 
-from app.Services.storage.base import BaseStorage, FileMetaDataT, RemoteFilePathType, LocalFilePathType
+from app.Services.storage.base import BaseStorage, FileMetaDataT, RemoteFilePathType, LocalFilePathType, \
+    STREAM_CHUNK_SIZE
 from app.Services.storage.exception import RemoteFileNotFoundError, LocalFileNotFoundError, RemoteFilePermissionError, \
     LocalFilePermissionError, LocalFileExistsError, RemoteFileExistsError
 from app.config import config
-from app.util.local_file_utility import glob_local_files
+from app.util.local_file_utility import glob_local_files, read_chunks
 
 
 def transform_exception(param: str):
@@ -35,6 +37,10 @@ def transform_exception(param: str):
     return decorator
 
 
+# The files named by a UUID, which are sharded by the first characters of the UUID
+_SHARDABLE_NAME = re.compile(r'[0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12}\.', re.IGNORECASE)
+
+
 class LocalStorage(BaseStorage[FileMetaDataT: None]):
     def __init__(self):
         super().__init__()
@@ -42,10 +48,55 @@ class LocalStorage(BaseStorage[FileMetaDataT: None]):
         self.thumbnails_dir = self.static_dir / "thumbnails"
         self.deleted_dir = self.static_dir / "_deleted"
         self.file_metadata = None
-        self.file_path_warp = lambda x: self.static_dir / syncPath(x)
+        self.shard_depth = config.storage.local.shard_depth
+
+    def shard_key(self, path: RemoteFilePathType) -> PurePosixPath:
+        """
+        Get the path of a file in the configured layout. With sharding, a file named by a UUID is placed in
+        shard_depth levels of directories named by pairs of the first characters of the UUID, e.g.
+        `thumbnails/ab/cd/abcd0123-....webp`. A path already in the layout is returned as is.
+        :param path: The file path relative to static_dir
+        """
+        path = PurePosixPath(path)
+        if self.shard_depth == 0 or not _SHARDABLE_NAME.match(path.name):
+            return path
+        shards = tuple(path.name[i * 2:i * 2 + 2].lower() for i in range(self.shard_depth))
+        if path.parent.parts[-self.shard_depth:] == shards:
+            return path
+        return path.parent.joinpath(*shards, path.name)
 
     def file_path_wrap(self, path: RemoteFilePathType) -> syncPath:
-        return self.static_dir / syncPath(path)
+        """
+        :return: The absolute path a file is written to.
+        """
+        return self.static_dir / self.shard_key(path)
+
+    def file_path_resolve(self, path: RemoteFilePathType) -> syncPath:
+        """
+        :return: The absolute path a file is read from. A file not moved to the sharded layout yet (see the
+        shard-local-storage command) is still found at its flat path.
+        """
+        wrapped = self.file_path_wrap(path)
+        if self.shard_depth == 0 or wrapped.exists():
+            return wrapped
+        flat = self.static_dir / syncPath(path)
+        return flat if flat.exists() else wrapped
+
+    def relocate(self, path: RemoteFilePathType) -> bool:
+        """
+        Move a file from its flat path to its path in the configured layout, if needed. The method is blocking.
+        :param path: The file path relative to static_dir
+        :return: Whether the file exists.
+        """
+        wrapped = self.file_path_wrap(path)
+        flat = self.static_dir / syncPath(path)
+        if wrapped.exists():
+            return True
+        if wrapped == flat or not flat.exists():
+            return False
+        wrapped.parent.mkdir(parents=True, exist_ok=True)
+        os.replace(flat, wrapped)
+        return True
 
     async def on_load(self):
         if not self.static_dir.is_dir():
@@ -60,36 +111,50 @@ class LocalStorage(BaseStorage[FileMetaDataT: None]):
 
     async def is_exist(self,
                        remote_file: "RemoteFilePathType") -> bool:
-        return self.file_path_warp(remote_file).exists()
+        return self.file_path_resolve(remote_file).exists()
 
     @transform_exception("remote")
     async def size(self,
                    remote_file: "RemoteFilePathType") -> int:
-        _file = self.file_path_warp(remote_file)
-        return self.file_path_warp(remote_file).stat().st_size
+        return self.file_path_resolve(remote_file).stat().st_size
 
-    # noinspection PyMethodMayBeStatic
     async def url(self,
                   remote_file: "RemoteFilePathType") -> str:
-        return f"/static/{str(remote_file)}"
+        return f"/static/{self.shard_key(remote_file)}"
 
     async def presign_url(self,
                           remote_file: "RemoteFilePathType",
                           expire_second: int = 3600) -> str:
-        return f"/static/{str(remote_file)}"
+        return f"/static/{self.file_path_resolve(remote_file).relative_to(self.static_dir).as_posix()}"
 
     @transform_exception("remote")
     async def fetch(self,
                     remote_file: "RemoteFilePathType") -> bytes:
-        remote_file = self.file_path_warp(remote_file)
+        remote_file = self.file_path_resolve(remote_file)
         async with aiofiles.open(str(remote_file), 'rb') as file:
             return await file.read()
 
+    async def stream(self,
+                     remote_file: "RemoteFilePathType",
+                     chunk_size: int = STREAM_CHUNK_SIZE,
+                     offset: int = 0,
+                     length: Optional[int] = None) -> AsyncGenerator[bytes, None]:
+        try:
+            file = await aiofiles.open(str(self.file_path_resolve(remote_file)), 'rb')
+        except FileNotFoundError as ex:
+            raise RemoteFileNotFoundError from ex
+        try:
+            async for chunk in read_chunks(file, chunk_size, offset, length):
+                yield chunk
+        finally:
+            await file.close()
+
     @transform_exception("local")
     async def upload(self,
                      local_file: "LocalFilePathType",
                      remote_file: "RemoteFilePathType") -> None:
-        remote_file = self.file_path_warp(remote_file)
+        remote_file = self.file_path_wrap(remote_file)
+        remote_file.parent.mkdir(parents=True, exist_ok=True)
         if isinstance(local_file, bytes):
             async with aiofiles.open(str(remote_file), 'wb') as file:
                 await file.write(local_file)
@@ -98,12 +163,24 @@ class LocalStorage(BaseStorage[FileMetaDataT: None]):
         local_file = f"{len(local_file)} bytes" if isinstance(local_file, bytes) else local_file
         logger.success(f"Successfully uploaded file {str(local_file)} to {str(remote_file)} via local_storage.")
 
+    @transform_exception("remote")
+    async def upload_stream(self,
+                            chunks: AsyncIterable[bytes],
+                            remote_file: "RemoteFilePathType") -> None:
+        remote_file = self.file_path_wrap(remote_file)
+        remote_file.parent.mkdir(parents=True, exist_ok=True)
+        async with aiofiles.open(str(remote_file), 'wb') as file:
+            async for chunk in chunks:
+                await file.write(chunk)
+        logger.success(f"Successfully uploaded stream to {str(remote_file)} via local_storage.")
+
     @transform_exception("remote")
     async def copy(self,
                    old_remote_file: "RemoteFilePathType",
                    new_remote_file: "RemoteFilePathType") -> None:
-        old_remote_file = self.file_path_warp(old_remote_file)
-        new_remote_file = self.file_path_warp(new_remote_file)
+        old_remote_file = self.file_path_resolve(old_remote_file)
+        new_remote_file = self.file_path_wrap(new_remote_file)
+        new_remote_file.parent.mkdir(parents=True, exist_ok=True)
         await to_thread(copy2, str(old_remote_file), str(new_remote_file))
         logger.success(f"Successfully copied file {str(old_remote_file)} to {str(new_remote_file)} via local_storage.")
 
@@ -111,15 +188,16 @@ class LocalStorage(BaseStorage[FileMetaDataT: None]):
     async def move(self,
                    old_remote_file: "RemoteFilePathType",
                    new_remote_file: "RemoteFilePathType") -> None:
-        old_remote_file = self.file_path_warp(old_remote_file)
-        new_remote_file = self.file_path_warp(new_remote_file)
+        old_remote_file = self.file_path_resolve(old_remote_file)
+        new_remote_file = self.file_path_wrap(new_remote_file)
+        new_remote_file.parent.mkdir(parents=True, exist_ok=True)
         await to_thread(move, str(old_remote_file), str(new_remote_file), copy_function=copy2)
         logger.success(f"Successfully moved file {str(old_remote_file)} to {str(new_remote_file)} via local_storage.")
 
     @transform_exception("remote")
     async def delete(self,
                      remote_file: "RemoteFilePathType") -> None:
-        remote_file = self.file_path_warp(remote_file)
+        remote_file = self.file_path_resolve(remote_file)
         await to_thread(os.remove, str(remote_file))
         logger.success(f"Successfully deleted file {str(remote_file)} via local_storage.")
 
@@ -129,13 +207,16 @@ class LocalStorage(BaseStorage[FileMetaDataT: None]):
                          batch_max_files: Optional[int] = None,
                          valid_extensions: Optional[set[str]] = None) \
             -> AsyncGenerator[list[RemoteFilePathType], None]:
-        local_path = self.file_path_warp(path)
+        # A pattern of a UUID named file is looked up in its shard, and at its flat path if it's not moved yet
+        local_paths = dict.fromkeys([self.file_path_wrap(PurePosixPath(path) / pattern).parent,
+                                     self.static_dir / syncPath(path)])
         files = []
-        for file in glob_local_files(local_path, pattern, valid_extensions):
-            files.append(file)
-            if batch_max_files is not None and len(files) == batch_max_files:
-                yield files
-                files = []
+        for local_path in local_paths:
+            for file in glob_local_files(local_path, pattern, valid_extensions):
+                files.append(file)
+                if batch_max_files is not None and len(files) == batch_max_files:
+                    yield files
+                    files = []
         if files:
             yield files
 
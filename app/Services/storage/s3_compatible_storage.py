@@ -3,9 +3,10 @@
 # Remove below `# pylint` once the issue is resolved
 # pylint: disable=import-error,no-name-in-module
 import os
+import time
 import urllib.parse
 from pathlib import PurePosixPath
-from typing import Optional, AsyncGenerator
+from typing import Optional, AsyncGenerator, AsyncIterable
 
 import aiofiles
 from loguru import logger
@@ -14,11 +15,12 @@ from opendal.exceptions import NotFound, PermissionDenied, AlreadyExists
 from wcmatch import glob
 
 from app.Services.storage.base import BaseStorage, FileMetaDataT, RemoteFilePathType, LocalFilePathType, \
-    LocalFileMetaDataType, RemoteFileMetaDataType
+    LocalFileMetaDataType, RemoteFileMetaDataType, STREAM_CHUNK_SIZE
 from app.Services.storage.exception import LocalFileNotFoundError, RemoteFileNotFoundError, RemoteFilePermissionError, \
     RemoteFileExistsError
 from app.config import config
 from app.util.local_file_utility import VALID_IMAGE_EXTENSIONS
+from app.util.ttl_cache import TTLCache
 
 
 def transform_exception(func):
@@ -38,6 +40,12 @@ def transform_exception(func):
 
 
 class S3Storage(BaseStorage[FileMetaDataT: None]):
+    PRESIGN_CACHE_MAX_ENTRIES = 10000
+    PRESIGN_REUSE_RATIO = 0.5
+    # The size of the parts of a multipart upload, S3 requires at least 5 MiB for every part but the last one
+    MULTIPART_CHUNK_SIZE = 8 * 1024 * 1024
+    MULTIPART_CONCURRENCY = 4
+
     def __init__(self):
         super().__init__()
 
@@ -61,6 +69,7 @@ class S3Storage(BaseStorage[FileMetaDataT: None]):
                                 secret_access_key=config.storage.s3.secret_access_key)
 
         self._file_path_str_warp = lambda x: str(PurePosixPath(x))
+        self._presign_cache: TTLCache[tuple[str, int], str] = TTLCache(self.PRESIGN_CACHE_MAX_ENTRIES, 0)
 
     @staticmethod
     def _file_path_str_wrap(p: RemoteFilePathType):
@@ -90,8 +99,20 @@ class S3Storage(BaseStorage[FileMetaDataT: None]):
     async def presign_url(self,
                           remote_file: "RemoteFilePathType",
                           expire_second: int = 3600) -> str:
-        _presign = await self.op.presign_read(self._file_path_str_warp(remote_file), expire_second)
-        return self.rewrite_s3_presign_url(_presign.url)
+        key = (self._file_path_str_warp(remote_file), expire_second)
+        if (cached := self._presign_cache.get(key)) is not None:
+            return cached
+        _presign = await self.op.presign_read(key[0], expire_second)
+        url = self.rewrite_s3_presign_url(_presign.url)
+        # Only reuse the signature in the first part of its lifetime, so a cached URL is always handed out with
+        # enough valid time left
+        self._presign_cache.put(key, url, expire_second * self.PRESIGN_REUSE_RATIO)
+        return url
+
+    def presign_epoch(self, expire_second: int = 3600) -> int:
+        # A URL has at least (1 - PRESIGN_REUSE_RATIO) of its lifetime left when handed out, which covers an epoch as
+        # long as the ratio is at most 0.5
+        return int(time.time() // (expire_second * self.PRESIGN_REUSE_RATIO))
 
     @transform_exception
     async def fetch(self,
@@ -99,19 +120,61 @@ class S3Storage(BaseStorage[FileMetaDataT: None]):
         with await self.op.read(self._file_path_str_warp(remote_file)) as f:
             return bytes(f)
 
+    async def stream(self,
+                     remote_file: "RemoteFilePathType",
+                     chunk_size: int = STREAM_CHUNK_SIZE,
+                     offset: int = 0,
+                     length: Optional[int] = None) -> AsyncGenerator[bytes, None]:
+        path = self._file_path_str_warp(remote_file)
+        try:
+            # The reader doesn't raise NotFound for a missing file, stat it first
+            size = (await self.op.stat(path)).content_length
+        except NotFound as ex:
+            raise RemoteFileNotFoundError from ex
+        end = size if length is None else min(size, offset + length)
+        async with await self.op.open(path, "rb") as f:
+            if offset:
+                await f.seek(offset)
+            position = offset
+            while position < end:
+                chunk = await f.read(min(chunk_size, end - position))
+                if not chunk:
+                    break
+                position += len(chunk)
+                yield chunk
+
     @transform_exception
     async def upload(self,
                      local_file: "LocalFilePathType",
                      remote_file: "RemoteFilePathType") -> None:
         if isinstance(local_file, bytes):
-            b = local_file
+            await self.op.write(self._file_path_str_warp(remote_file), local_file,
+                                chunk=self.MULTIPART_CHUNK_SIZE, concurrent=self.MULTIPART_CONCURRENCY)
         else:
-            async with aiofiles.open(local_file, "rb") as f:
-                b = await f.read()
-        await self.op.write(self._file_path_str_warp(remote_file), b)
+            await self._write_chunks(self._read_local_file(local_file), remote_file)
         local_file = f"{len(local_file)} bytes" if isinstance(local_file, bytes) else local_file
         logger.success(f"Successfully uploaded file {str(local_file)} to {str(remote_file)} via s3_storage.")
 
+    @transform_exception
+    async def upload_stream(self,
+                            chunks: AsyncIterable[bytes],
+                            remote_file: "RemoteFilePathType") -> None:
+        await self._write_chunks(chunks, remote_file)
+        logger.success(f"Successfully uploaded stream to {str(remote_file)} via s3_storage.")
+
+    async def _write_chunks(self, chunks: AsyncIterable[bytes], remote_file: "RemoteFilePathType"):
+        # The writer buffers the chunks into parts, and uploads them as a multipart upload if there are several
+        async with await self.op.open(self._file_path_str_warp(remote_file), "wb", chunk=self.MULTIPART_CHUNK_SIZE,
+                                      concurrent=self.MULTIPART_CONCURRENCY) as f:
+            async for chunk in chunks:
+                await f.write(chunk)
+
+    @staticmethod
+    async def _read_local_file(local_file: "LocalFilePathType") -> AsyncGenerator[bytes, None]:
+        async with aiofiles.open(local_file, "rb") as f:
+            while chunk := await f.read(STREAM_CHUNK_SIZE):
+                yield chunk
+
     @transform_exception
     async def copy(self,
                    old_remote_file: "RemoteFilePathType",
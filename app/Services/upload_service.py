@@ -16,6 +16,7 @@ from app.Services.storage import StorageService
 from app.Services.vector_db_context import VectorDbContext
 from app.config import config
 from app.util.generate_uuid import generate_uuid
+from app.util.storage_keys import image_storage_key, thumbnail_storage_key
 
 
 class UploadService(LifespanService):
@@ -50,16 +51,17 @@ class UploadService(LifespanService):
                            thumbnail_mode: UploadImageThumbnailMode):
         img = Image.open(BytesIO(img_bytes))
         logger.info('Start indexing image {}. Local: {}. Size: {}', mapped_img.id, mapped_img.local, len(img_bytes))
-        file_name = f"{mapped_img.id}.{mapped_img.format}"
-        thumb_path = f"thumbnails/{mapped_img.id}.webp"
+        file_name = image_storage_key(mapped_img.id, mapped_img.format)
+        thumb_path = thumbnail_storage_key(mapped_img.id)
         gen_thumb = thumbnail_mode == UploadImageThumbnailMode.ALWAYS or (
                 thumbnail_mode == UploadImageThumbnailMode.IF_NECESSARY and len(img_bytes) > 1024 * 500)
 
         if mapped_img.local:
             mapped_img.url = await self._storage_service.active_storage.url(file_name)
+            mapped_img.storage_key = file_name
         if gen_thumb:
-            mapped_img.thumbnail_url = await self._storage_service.active_storage.url(
-                f"thumbnails/{mapped_img.id}.webp")
+            mapped_img.thumbnail_url = await self._storage_service.active_storage.url(thumb_path)
+            mapped_img.thumbnail_storage_key = thumb_path
             mapped_img.local_thumbnail = True
 
         await self._index_service.index_image(img, mapped_img, skip_ocr=skip_ocr, background=True)
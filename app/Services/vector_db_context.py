@@ -1,3 +1,5 @@
+import random
+import time
 from typing import Optional
 
 import numpy
@@ -11,9 +13,12 @@ from qdrant_client.models import RecommendStrategy, RecommendInput, RecommendQue
 from app.Models.api_models.search_api_model import SearchModelEnum, SearchBasisEnum
 from app.Models.mapped_image import MappedImage
 from app.Models.query_params import FilterParams
+from app.Models.scroll_cursor import ScrollCursor
 from app.Models.search_result import SearchResult
+from app.Models.vector_query import VectorQuery
 from app.Services.lifespan_service import LifespanService
-from app.config import config, QdrantMode
+from app.config import config, QdrantMode, LocalVectorEngine
+from app.util.normalize_tags import tag_tokens
 from app.util.retry_deco_async import wrap_object, retry_async
 
 
@@ -23,10 +28,42 @@ class PointNotFoundError(ValueError):
         super().__init__(f"Point {point_id} not found.")
 
 
+class CollectionWriteListener:
+    """
+    Receives the writes made through a VectorDbContext, to keep the state derived from the collection in sync.
+    """
+
+    def on_upsert(self, items: list[MappedImage]):
+        pass
+
+    def on_delete(self, ids: list[str]):
+        pass
+
+
 class VectorDbContext(LifespanService):
     IMG_VECTOR = "image_vector"
     TEXT_VECTOR = "text_contain_vector"
     AVAILABLE_POINT_TYPES = models.Record | models.ScoredPoint | models.PointStruct
+    # Payload fields that are always fetched, since MappedImage and the result postprocessing rely on them
+    PROJECTION_REQUIRED_FIELDS = ['index_date', 'local', 'local_thumbnail', 'format', 'filename', 'storage_key',
+                                  'thumbnail_storage_key']
+    COMBINED_SEARCH_MAX_CANDIDATES = 1000
+    # How often to check again whether the random keys have been backfilled, see random_sampling_ready
+    RANDOM_KEY_CHECK_INTERVAL = 60
+    PAYLOAD_INDEXES = {
+        # Exact tag matches
+        "tags": models.PayloadSchemaType.KEYWORD,
+        # Tag queries, every word of the query should be a prefix of a word of the tags
+        "tags_text": models.TextIndexParams(type=models.TextIndexType.TEXT,
+                                            tokenizer=models.TokenizerType.PREFIX,
+                                            min_token_len=1,
+                                            max_token_len=32,
+                                            lowercase=True),
+        # The order of the random sampling, see query_random
+        "random_key": models.PayloadSchemaType.FLOAT,
+        # The order of the scroll by date, see scroll_points_by_date
+        "index_date": models.PayloadSchemaType.DATETIME,
+    }
 
     def __init__(self):
         match config.qdrant.mode:
@@ -44,11 +81,52 @@ class VectorDbContext(LifespanService):
             case _:
                 raise ValueError("Invalid Qdrant mode.")
         self.collection_name = config.qdrant.coll
+        self._write_listeners: list[CollectionWriteListener] = []
+        self._random_key_ready = False
+        self._random_key_checked_at: float | None = None
+
+    def add_write_listener(self, listener: CollectionWriteListener):
+        self._write_listeners.append(listener)
+
+    def _notify_upsert(self, items: list[MappedImage]):
+        for listener in self._write_listeners:
+            listener.on_upsert(items)
+
+    def _notify_delete(self, ids: list[str]):
+        for listener in self._write_listeners:
+            listener.on_delete(ids)
 
     async def on_load(self):
         if not await self.check_collection():
             logger.warning("Collection not found. Initializing...")
             await self.initialize_collection()
+        if not await self.random_sampling_ready():
+            logger.warning("Some images have no random key, run the database migration from v3 to index them. "
+                           "Random picks fall back to a random vector search until then.")
+
+    async def random_sampling_ready(self) -> bool:
+        """
+        Check whether the random_key of every image is indexed (see the v3 to v4 migration), which query_random needs.
+        A collection that isn't migrated yet is checked again at most every RANDOM_KEY_CHECK_INTERVAL seconds, so the
+        random sampling is enabled once the backfill is done.
+        """
+        if self._random_key_ready:
+            return True
+        if self._random_key_checked_at is not None and \
+                time.monotonic() - self._random_key_checked_at < self.RANDOM_KEY_CHECK_INTERVAL:
+            return False
+        self._random_key_checked_at = time.monotonic()
+        # Payload indexes only exist on a Qdrant server, an embedded Qdrant orders by any payload field
+        if config.qdrant.mode == QdrantMode.SERVER:
+            collection = await self._client.get_collection(collection_name=self.collection_name)
+            if "random_key" not in collection.payload_schema:
+                return False
+        missing = await self._client.count(collection_name=self.collection_name,
+                                           count_filter=models.Filter(must=[models.IsEmptyCondition(
+                                               is_empty=models.PayloadField(key="random_key"))]),
+                                           exact=True)
+        self._random_key_ready = missing.count == 0
+        return self._random_key_ready
 
     async def retrieve_by_id(self, image_id: str, with_vectors=False) -> MappedImage:
         """
@@ -67,18 +145,20 @@ class VectorDbContext(LifespanService):
             raise PointNotFoundError(image_id)
         return self._get_mapped_image_from_point(result[0])
 
-    async def retrieve_by_ids(self, image_id: list[str], with_vectors=False) -> list[MappedImage]:
+    async def retrieve_by_ids(self, image_id: list[str], with_vectors=False,
+                              payload_fields: list[str] | None = None) -> list[MappedImage]:
         """
         Retrieve items from the database by IDs.
         An exception is thrown if there are items in the IDs that do not exist in the database.
         :param image_id: The list of IDs to retrieve.
         :param with_vectors: Whether to retrieve vectors.
+        :param payload_fields: The payload fields to retrieve (see _get_payload_selector), all of them if None.
         :return: The list of retrieved items.
         """
         logger.info("Retrieving {} items from database...", len(image_id))
         result = await self._client.retrieve(collection_name=self.collection_name,
                                              ids=image_id,
-                                             with_payload=True,
+                                             with_payload=self._get_payload_selector(payload_fields),
                                              with_vectors=with_vectors)
         result_point_ids = {t.id for t in result}
         missing_point_ids = set(image_id) - result_point_ids
@@ -101,7 +181,8 @@ class VectorDbContext(LifespanService):
         return [t.id for t in result]
 
     async def query_search(self, query_vector, query_vector_name: str = IMG_VECTOR,
-                           top_k=10, skip=0, filter_param: FilterParams | None = None) -> list[SearchResult]:
+                           top_k=10, skip=0, filter_param: FilterParams | None = None,
+                           payload_fields: list[str] | None = None) -> list[SearchResult]:
         logger.info("Querying Qdrant... top_k = {}", top_k)
         result = await self._client.query_points(collection_name=self.collection_name,
                                                  query=query_vector,
@@ -109,10 +190,64 @@ class VectorDbContext(LifespanService):
                                                  query_filter=self._get_filters_by_filter_param(filter_param),
                                                  limit=top_k,
                                                  offset=skip,
-                                                 with_payload=True)
+                                                 with_payload=self._get_payload_selector(payload_fields))
         logger.success("Query completed!")
         return [self._get_search_result_from_scored_point(t) for t in result.points]
 
+    async def query_batch(self, queries: list[VectorQuery],
+                          payload_fields: list[str] | None = None) -> list[list[SearchResult]]:
+        """
+        Run multiple vector queries in one round trip.
+        :param queries: The queries to run.
+        :param payload_fields: The payload fields to retrieve, None for all fields.
+        :return: The results of each query, in the same order as the queries.
+        """
+        logger.info("Querying Qdrant with {} queries in batch...", len(queries))
+        with_payload = self._get_payload_selector(payload_fields)
+        requests = [models.QueryRequest(query=t.query_vector.tolist(),
+                                        using=t.query_vector_name,
+                                        filter=self._get_filters_by_filter_param(t.filter_param),
+                                        limit=t.top_k,
+                                        offset=t.skip,
+                                        with_payload=with_payload)
+                    for t in queries]
+        result = await self._client.query_batch_points(collection_name=self.collection_name, requests=requests)
+        logger.success("Batch query completed!")
+        return [[self._get_search_result_from_scored_point(t) for t in resp.points] for resp in result]
+
+    async def query_random(self, seed: int, top_k=10, skip=0, filter_param: FilterParams | None = None,
+                           payload_fields: list[str] | None = None) -> list[SearchResult]:
+        """
+        Sample images at random: the run of images following a pivot drawn from the seed in the random_key order,
+        wrapping around to the first key. Since the keys are uniform and the pivot is fresh for every seed, every
+        image is equally likely to be at any position of the sample, but the images next to each other in the key
+        order tend to come up together. The same seed always gives the same run, so that the sample can be paged.
+        :param seed: The seed of the pivot.
+        :return: The images of the run from skip to skip + top_k, scored from 1 down along the run.
+        """
+        logger.info("Sampling random images from Qdrant... top_k = {}", top_k)
+        base_filter = self._get_filters_by_filter_param(filter_param)
+        with_payload = self._get_payload_selector(payload_fields)
+        pivot = random.Random(seed).random()
+        count = skip + top_k
+        # The images from the pivot on, then the ones before the pivot from the first key
+        before_pivot = models.FieldCondition(key="random_key", range=models.Range(lt=pivot))
+        requests = [
+            models.QueryRequest(query=models.OrderByQuery(order_by=models.OrderBy(
+                key="random_key", direction=models.Direction.ASC, start_from=pivot)),
+                filter=base_filter, limit=count, with_payload=with_payload),
+            models.QueryRequest(query=models.OrderByQuery(order_by=models.OrderBy(
+                key="random_key", direction=models.Direction.ASC)),
+                filter=models.Filter(must=[base_filter, before_pivot] if base_filter is not None else [before_pivot]),
+                limit=count, with_payload=with_payload),
+        ]
+        after, before = await self._client.query_batch_points(collection_name=self.collection_name,
+                                                               requests=requests)
+        points = (after.points + before.points)[:count]
+        logger.success("Sampling completed!")
+        return [SearchResult(img=self._get_mapped_image_from_point(t), score=1 / (i + 1))
+                for i, t in enumerate(points) if i >= skip]
+
     async def query_similar(self,
                             query_vector_name: str = IMG_VECTOR,
                             search_id: Optional[str] = None,
@@ -122,33 +257,75 @@ class VectorDbContext(LifespanService):
                             with_vectors: bool = False,
                             filter_param: FilterParams | None = None,
                             top_k: int = 10,
-                            skip: int = 0) -> list[SearchResult]:
-        _positive_vectors = [t.tolist() for t in positive_vectors] if positive_vectors is not None else [search_id]
-        _negative_vectors = [t.tolist() for t in negative_vectors] if negative_vectors is not None else None
-        _strategy = None if mode is None else (RecommendStrategy.AVERAGE_VECTOR if
-                                               mode == SearchModelEnum.average else RecommendStrategy.BEST_SCORE)
-        # since only combined_search need return vectors, We can define _combined_search_need_vectors like below
+                            skip: int = 0,
+                            payload_fields: list[str] | None = None) -> list[SearchResult]:
+        # Return the vectors of the other basis if requested, they are needed when reranking on the client side
         _combined_search_need_vectors = [
             self.IMG_VECTOR if query_vector_name == self.TEXT_VECTOR else self.TEXT_VECTOR] if with_vectors else None
         logger.info("Querying Qdrant... top_k = {}", top_k)
         result = await self._client.query_points(collection_name=self.collection_name,
                                                  using=query_vector_name,
-                                                 query=RecommendQuery(
-                                                     recommend=RecommendInput(
-                                                         positive=_positive_vectors,
-                                                         negative=_negative_vectors,
-                                                         strategy=_strategy,
-                                                     ),
-                                                 ),
+                                                 query=self._get_recommend_query(search_id, positive_vectors,
+                                                                                 negative_vectors, mode),
                                                  with_vectors=_combined_search_need_vectors,
                                                  query_filter=self._get_filters_by_filter_param(filter_param),
                                                  limit=top_k,
                                                  offset=skip,
-                                                 with_payload=True)
+                                                 with_payload=self._get_payload_selector(payload_fields))
         logger.success("Query completed!")
 
         return [self._get_search_result_from_scored_point(t) for t in result.points]
 
+    async def query_combined(self,
+                             query_vector_name: str = IMG_VECTOR,
+                             positive_vectors: Optional[list[numpy.ndarray]] = None,
+                             negative_vectors: Optional[list[numpy.ndarray]] = None,
+                             extra_vector: Optional[numpy.ndarray] = None,
+                             mode: Optional[SearchModelEnum] = None,
+                             filter_param: FilterParams | None = None,
+                             top_k: int = 10,
+                             skip: int = 0,
+                             payload_fields: list[str] | None = None) -> list[SearchResult]:
+        """
+        Recommend by the given vectors, then rescore the candidates with the extra vector on the other basis.
+        The combined score is `score * (1 + extra_score)`, it is calculated inside Qdrant through a formula query.
+        Candidates without the other vector (e.g. images without OCR text) keep their original score.
+        The candidates are capped at COMBINED_SEARCH_MAX_CANDIDATES, so a page past that many results comes back
+        short or empty; the API rejects such pages.
+        Formula queries need Qdrant 1.14 or later.
+        """
+        if extra_vector is None:
+            # Nothing to rescore with, so it is a plain recommendation
+            return await self.query_similar(query_vector_name, None, positive_vectors, negative_vectors, mode,
+                                            filter_param=filter_param, top_k=top_k, skip=skip,
+                                            payload_fields=payload_fields)
+        extra_vector_name = self.IMG_VECTOR if query_vector_name == self.TEXT_VECTOR else self.TEXT_VECTOR
+        # The candidate window grows with the requested page, so deeper pages are ranked among enough candidates
+        candidate_limit = min(max(30, (skip + top_k) * 3), self.COMBINED_SEARCH_MAX_CANDIDATES)
+        candidates = models.Prefetch(query=self._get_recommend_query(None, positive_vectors, negative_vectors, mode),
+                                     using=query_vector_name,
+                                     filter=self._get_filters_by_filter_param(filter_param),
+                                     limit=candidate_limit)
+        rescored_candidates = models.Prefetch(prefetch=candidates,
+                                              query=extra_vector.tolist(),
+                                              using=extra_vector_name,
+                                              limit=candidate_limit)
+        logger.info("Querying Qdrant... top_k = {}, candidates = {}", top_k, candidate_limit)
+        result = await self._client.query_points(collection_name=self.collection_name,
+                                                 prefetch=[candidates, rescored_candidates],
+                                                 query=models.FormulaQuery(
+                                                     formula=models.MultExpression(mult=[
+                                                         "$score[0]",
+                                                         models.SumExpression(sum=[1.0, "$score[1]"])
+                                                     ]),
+                                                     defaults={"$score[1]": 0.0}
+                                                 ),
+                                                 limit=top_k,
+                                                 offset=skip,
+                                                 with_payload=self._get_payload_selector(payload_fields))
+        logger.success("Query completed!")
+        return [self._get_search_result_from_scored_point(t) for t in result.points]
+
     async def insert_items(self, items: list[MappedImage]):
         logger.info("Inserting {} items into Qdrant...", len(items))
 
@@ -158,6 +335,7 @@ class VectorDbContext(LifespanService):
                                              wait=True,
                                              points=points)
         logger.success("Insert completed! Status: {}", response.status)
+        self._notify_upsert(items)
 
     async def delete_items(self, ids: list[str]):
         logger.info("Deleting {} items from Qdrant...", len(ids))
@@ -167,6 +345,7 @@ class VectorDbContext(LifespanService):
                                              ),
                                              )
         logger.success("Delete completed! Status: {}", response.status)
+        self._notify_delete(ids)
 
     async def update_payload(self, new_data: MappedImage):
         """
@@ -179,6 +358,22 @@ class VectorDbContext(LifespanService):
                                                   points=[str(new_data.id)],
                                                   wait=True)
         logger.success("Update completed! Status: {}", response.status)
+        self._notify_upsert([new_data])
+
+    async def update_payloads(self, new_data: list[MappedImage]):
+        """
+        Update the payloads of existing items in one request, see update_payload.
+        """
+        if not new_data:
+            return
+        await self._client.batch_update_points(collection_name=self.collection_name,
+                                               update_operations=[
+                                                   models.SetPayloadOperation(set_payload=models.SetPayload(
+                                                       payload=t.payload, points=[str(t.id)]))
+                                                   for t in new_data],
+                                               wait=True)
+        logger.success("Update of {} payloads completed!", len(new_data))
+        self._notify_upsert(new_data)
 
     async def update_vectors(self, new_points: list[MappedImage]):
         resp = await self._client.update_vectors(collection_name=self.collection_name,
@@ -191,16 +386,47 @@ class VectorDbContext(LifespanService):
                             count=50,
                             with_vectors=False,
                             filter_param: FilterParams | None = None,
+                            payload_fields: list[str] | None = None,
                             ) -> tuple[list[MappedImage], str]:
         resp, next_id = await self._client.scroll(collection_name=self.collection_name,
                                                   limit=count,
                                                   offset=from_id,
                                                   with_vectors=with_vectors,
+                                                  with_payload=self._get_payload_selector(payload_fields),
                                                   scroll_filter=self._get_filters_by_filter_param(filter_param)
                                                   )
 
         return [self._get_mapped_image_from_point(t) for t in resp], next_id
 
+    async def scroll_points_by_date(self,
+                                    cursor: ScrollCursor | None = None,
+                                    count=50,
+                                    descending=True,
+                                    filter_param: FilterParams | None = None,
+                                    payload_fields: list[str] | None = None,
+                                    ) -> tuple[list[MappedImage], ScrollCursor | None]:
+        """
+        Scroll the points in the order of their index date, with a keyset cursor on the index_date index.
+        :param cursor: The cursor returned by the previous page, None to scroll from the start.
+        :param descending: Scroll from the newest points if True, from the oldest otherwise.
+        :return: The points of the page and the cursor of the next page, None if there are no more points.
+        """
+        scroll_filter = self._get_filters_by_filter_param(filter_param)
+        if cursor is not None and cursor.seen_ids:
+            scroll_filter = models.Filter(must=[scroll_filter] if scroll_filter is not None else None,
+                                          must_not=[models.HasIdCondition(has_id=[str(t) for t in cursor.seen_ids])])
+        # One more point is fetched to know whether there is a next page, since ordered scrolls have no offset
+        resp, _ = await self._client.scroll(collection_name=self.collection_name,
+                                            limit=count + 1,
+                                            order_by=models.OrderBy(key="index_date",
+                                                                    direction=models.Direction.DESC if descending
+                                                                    else models.Direction.ASC,
+                                                                    start_from=cursor.index_date if cursor else None),
+                                            with_payload=self._get_payload_selector(payload_fields),
+                                            scroll_filter=scroll_filter)
+        images = [self._get_mapped_image_from_point(t) for t in resp[:count]]
+        return images, ScrollCursor.after(images, cursor) if len(resp) > count else None
+
     async def get_counts(self, exact: bool) -> int:
         resp = await self._client.count(collection_name=self.collection_name, exact=exact)
         return resp.count
@@ -221,8 +447,23 @@ class VectorDbContext(LifespanService):
         }
         await self._client.create_collection(collection_name=self.collection_name,
                                              vectors_config=vectors_config)
+        await self.create_payload_indexes()
         logger.success("Collection created!")
 
+    async def create_payload_indexes(self):
+        """
+        Create the payload indexes of the filterable fields. Existing indexes are left as is.
+        """
+        if config.qdrant.mode != QdrantMode.SERVER:
+            # The embedded Qdrant client scans the payloads and ignores the indexes
+            return
+        for field_name, field_schema in self.PAYLOAD_INDEXES.items():
+            logger.info("Creating payload index of {}...", field_name)
+            await self._client.create_payload_index(collection_name=self.collection_name,
+                                                    field_name=field_name,
+                                                    field_schema=field_schema,
+                                                    wait=True)
+
     @classmethod
     def _get_vector_from_img_data(cls, img_data: MappedImage) -> models.PointVectors:
         vector = {}
@@ -269,6 +510,29 @@ class VectorDbContext(LifespanService):
             case _:
                 raise ValueError("Invalid basis")
 
+    @staticmethod
+    def _get_recommend_query(search_id: Optional[str],
+                             positive_vectors: Optional[list[numpy.ndarray]],
+                             negative_vectors: Optional[list[numpy.ndarray]],
+                             mode: Optional[SearchModelEnum]) -> RecommendQuery:
+        _positive_vectors = [t.tolist() for t in positive_vectors] if positive_vectors is not None else [search_id]
+        _negative_vectors = [t.tolist() for t in negative_vectors] if negative_vectors is not None else None
+        _strategy = None if mode is None else (RecommendStrategy.AVERAGE_VECTOR if
+                                               mode == SearchModelEnum.average else RecommendStrategy.BEST_SCORE)
+        return RecommendQuery(
+            recommend=RecommendInput(
+                positive=_positive_vectors,
+                negative=_negative_vectors,
+                strategy=_strategy,
+            ),
+        )
+
+    @classmethod
+    def _get_payload_selector(cls, payload_fields: list[str] | None) -> bool | list[str]:
+        if payload_fields is None:
+            return True
+        return list(dict.fromkeys([*cls.PROJECTION_REQUIRED_FIELDS, *payload_fields]))
+
     @staticmethod
     def _get_filters_by_filter_param(filter_param: FilterParams | None) -> models.Filter | None:
         if filter_param is None:
@@ -317,6 +581,14 @@ class VectorDbContext(LifespanService):
                 )
             ))
 
+        if filter_param.query_text and tag_tokens(filter_param.query_text):
+            filters.append(models.FieldCondition(
+                key="tags_text",
+                match=models.MatchText(
+                    text=' '.join(tag_tokens(filter_param.query_text))
+                )
+            ))
+
         if filter_param.categories is not None:
             filters.append(models.FieldCondition(
                 key="categories",
@@ -337,3 +609,13 @@ class VectorDbContext(LifespanService):
             must=filters,
             must_not=neg_filter
         )
+
+
+def create_vector_db_context() -> VectorDbContext:
+    """
+    Create the vector database context of the configured engine.
+    """
+    if config.qdrant.mode == QdrantMode.LOCAL and config.qdrant.local_engine == LocalVectorEngine.NUMPY:
+        from .numpy_vector_db_context import NumpyVectorDbContext
+        return NumpyVectorDbContext()
+    return VectorDbContext()
@@ -2,7 +2,7 @@ import os
 from enum import Enum
 
 from loguru import logger
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
 from pydantic_settings import BaseSettings, SettingsConfigDict
 
 DOCKER_SECRETS_DIR = '/run/secrets'
@@ -14,6 +14,11 @@ class QdrantMode(str, Enum):
     MEMORY = 'memory'
 
 
+class LocalVectorEngine(str, Enum):
+    QDRANT = 'qdrant'
+    NUMPY = 'numpy'
+
+
 class QdrantSettings(BaseModel):
     mode: QdrantMode = QdrantMode.SERVER
 
@@ -25,6 +30,8 @@ class QdrantSettings(BaseModel):
     api_key: str | None = None
 
     local_path: str = './images_metadata'
+    local_engine: LocalVectorEngine = LocalVectorEngine.QDRANT
+    local_vector_dtype: str = 'float32'  # 'float32' or 'float16', only used by the numpy engine
 
 
 class ModelsSettings(BaseModel):
@@ -56,6 +63,8 @@ class S3StorageSettings(BaseModel):
 
 class LocalStorageSettings(BaseModel):
     path: str = './static'
+    # The first 8 characters of a UUID are hex digits, which allows up to 4 levels
+    shard_depth: int = Field(0, ge=0, le=4)
 
 
 class LocalSearchSettings(BaseModel):
@@ -64,6 +73,25 @@ class LocalSearchSettings(BaseModel):
     extensions: list[str] = ['.jpg', '.jpeg', '.png', '.webp']
 
 
+class NeighborGraphSettings(BaseModel):
+    enable: bool = False
+    top_k: int = 50
+    path: str = './images_metadata/neighbors'
+
+
+class ImageVariantSettings(BaseModel):
+    enable: bool = True
+    path: str = './images_metadata/variants'
+    max_cache_size_mb: int = 1024
+    workers: int = 2
+
+
+class SpriteSheetSettings(BaseModel):
+    enable: bool = True
+    path: str = './images_metadata/sprites'
+    max_cache_size_mb: int = 256
+
+
 class StorageMode(str, Enum):
     LOCAL = 'local'
     S3 = 's3'
@@ -74,10 +102,17 @@ class StorageMode(str, Enum):
         return self != StorageMode.DISABLED
 
 
+class StorageCacheSettings(BaseModel):
+    enable: bool = False
+    path: str = './images_metadata/storage_cache'
+    max_cache_size_mb: int = 4096
+
+
 class StorageSettings(BaseModel):
     method: StorageMode = StorageMode.LOCAL
     s3: S3StorageSettings = S3StorageSettings()
     local: LocalStorageSettings = LocalStorageSettings()
+    cache: StorageCacheSettings = StorageCacheSettings()
 
 
 # [Deprecated]
@@ -93,6 +128,9 @@ class Config(BaseSettings):
     static_file: StaticFileSettings = StaticFileSettings()  # [Deprecated]
     storage: StorageSettings = StorageSettings()
     local_search: LocalSearchSettings = LocalSearchSettings()
+    neighbor_graph: NeighborGraphSettings = NeighborGraphSettings()
+    image_variant: ImageVariantSettings = ImageVariantSettings()
+    sprite_sheet: SpriteSheetSettings = SpriteSheetSettings()
 
     device: str = 'auto'
     cors_origins: set[str] = {'*'}
@@ -0,0 +1,124 @@
+import os
+import threading
+from collections import OrderedDict
+from pathlib import Path, PurePosixPath
+from uuid import uuid4
+
+from loguru import logger
+
+TMP_SUFFIX = '.tmp'
+
+
+class DiskLRUCache:
+    """
+    A size-bounded cache of files in a directory, evicting the least recently used files first.
+    The keys are relative POSIX paths, each entry is stored as the file of the same path in the directory. The files
+    are written atomically, so that a reader never sees a partial file. The recency is kept in memory and persisted
+    through the modification time of the files, which is refreshed on every hit, so it survives restarts.
+    The methods are blocking and thread-safe, call them in a thread from async code.
+    """
+
+    def __init__(self, directory: os.PathLike | str, max_bytes: int):
+        self.directory = Path(directory)
+        self.max_bytes = max_bytes
+        self._entries: OrderedDict[str, int] = OrderedDict()
+        self._total_bytes = 0
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, key: str):
+        return key in self._entries
+
+    @property
+    def total_bytes(self) -> int:
+        return self._total_bytes
+
+    def path_of(self, key: str) -> Path:
+        """
+        Will raise ValueError if the key is not a relative path inside the directory.
+        """
+        path = PurePosixPath(key)
+        if path.is_absolute() or not path.parts or '..' in path.parts or key.endswith(TMP_SUFFIX):
+            raise ValueError(f"Invalid cache key: {key}")
+        return self.directory / path
+
+    def load(self):
+        """
+        Index the files already in the directory, from the least to the most recently used, then evict the files
+        exceeding the size limit. Temporary files left by an interrupted write are deleted.
+        """
+        self.directory.mkdir(parents=True, exist_ok=True)
+        files = []
+        for path in self.directory.rglob('*'):
+            if not path.is_file():
+                continue
+            if path.name.endswith(TMP_SUFFIX):
+                path.unlink(missing_ok=True)
+                continue
+            stat = path.stat()
+            files.append((stat.st_mtime, path.relative_to(self.directory).as_posix(), stat.st_size))
+        files.sort()
+        with self._lock:
+            self._entries.clear()
+            self._entries.update((key, size) for _, key, size in files)
+            self._total_bytes = sum(size for *_, size in files)
+            evicted = self._evict()
+        self._delete(evicted)
+        logger.info("Disk cache {} loaded, {} files, {} bytes", self.directory, len(self._entries),
+                    self._total_bytes)
+
+    def get(self, key: str) -> Path | None:
+        """
+        :return: The path of the cached file, None on a miss.
+        """
+        with self._lock:
+            if key not in self._entries:
+                return None
+            self._entries.move_to_end(key)
+        path = self.path_of(key)
+        try:
+            os.utime(path)
+        except FileNotFoundError:
+            # Deleted behind the cache's back
+            self.remove(key)
+            return None
+        return path
+
+    def put(self, key: str, data: bytes) -> Path:
+        """
+        Store a file, then evict the least recently used files if the cache exceeds its size limit.
+        """
+        path = self.path_of(key)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = path.with_name(f"{path.name}.{uuid4().hex}{TMP_SUFFIX}")
+        tmp.write_bytes(data)
+        os.replace(tmp, path)
+        with self._lock:
+            self._total_bytes += len(data) - self._entries.pop(key, 0)
+            self._entries[key] = len(data)
+            evicted = self._evict()
+        self._delete(evicted)
+        return path
+
+    def remove(self, key: str):
+        with self._lock:
+            size = self._entries.pop(key, None)
+            if size is None:
+                return
+            self._total_bytes -= size
+        self._delete([key])
+
+    def _evict(self) -> list[str]:
+        # The most recent entry is kept even if it exceeds the limit alone
+        evicted = []
+        while self._total_bytes > self.max_bytes and len(self._entries) > 1:
+            key, size = self._entries.popitem(last=False)
+            self._total_bytes -= size
+            evicted.append(key)
+        return evicted
+
+    def _delete(self, keys: list[str]):
+        for key in keys:
+            self.path_of(key).unlink(missing_ok=True)
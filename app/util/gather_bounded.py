@@ -0,0 +1,18 @@
+import asyncio
+from typing import Awaitable, Iterable, TypeVar
+
+T = TypeVar('T')
+
+
+async def gather_bounded(awaitables: Iterable[Awaitable[T]], limit: int) -> list[T]:
+    """
+    Like asyncio.gather, but at most `limit` of the awaitables are running at the same time.
+    :return: The results, in the same order as the awaitables.
+    """
+    semaphore = asyncio.Semaphore(limit)
+
+    async def _run(awaitable: Awaitable[T]) -> T:
+        async with semaphore:
+            return await awaitable
+
+    return await asyncio.gather(*(_run(t) for t in awaitables))
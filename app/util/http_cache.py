@@ -0,0 +1,62 @@
+import os
+import re
+from pathlib import PurePath
+
+from starlette.responses import Response
+from starlette.staticfiles import StaticFiles
+from starlette.types import Scope
+
+from app.util.query_fingerprint import query_fingerprint
+
+# For files whose content never changes under the same URL
+IMMUTABLE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+# For responses that can be cached but must be revalidated with their ETag before each reuse
+REVALIDATE_CACHE_CONTROL = "no-cache"
+
+_UUID_STEM = re.compile(r'^[0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12}$', re.IGNORECASE)
+
+
+def make_etag(*parts) -> str:
+    """
+    Generate a weak ETag from the parts identifying the content of a response (see query_fingerprint).
+    The ETags are weak since equivalent responses are not byte-identical (e.g. the query_id of searches).
+    """
+    return f'W/"{query_fingerprint(*parts)}"'
+
+
+def etag_matches(if_none_match: str | None, etag: str) -> bool:
+    """
+    Check the If-None-Match header of a request against an ETag, with the weak comparison of RFC 9110.
+    """
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == '*':
+        return True
+    opaque = etag.removeprefix('W/')
+    return any(t.strip().removeprefix('W/') == opaque for t in if_none_match.split(','))
+
+
+def not_modified_response(etag: str, cache_control: str) -> Response:
+    return Response(status_code=304, headers={'etag': etag, 'cache-control': cache_control})
+
+
+def is_content_addressed(path: os.PathLike | str) -> bool:
+    """
+    Check whether a file is named after the UUID of its content (which is derived from the SHA1 of the file),
+    so that its URL always serves the same bytes.
+    """
+    return _UUID_STEM.match(PurePath(path).stem) is not None
+
+
+class CachedStaticFiles(StaticFiles):
+    """
+    StaticFiles with a Cache-Control policy: content-addressed files (uploaded images and thumbnails) are cached as
+    immutable, others (e.g. the original files of local search) are revalidated with their ETag.
+    """
+
+    def file_response(self, full_path: os.PathLike, stat_result: os.stat_result, scope: Scope,
+                      status_code: int = 200) -> Response:
+        response = super().file_response(full_path, stat_result, scope, status_code)
+        response.headers['cache-control'] = IMMUTABLE_CACHE_CONTROL if is_content_addressed(full_path) \
+            else REVALIDATE_CACHE_CONTROL
+        return response
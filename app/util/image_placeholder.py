@@ -0,0 +1,38 @@
+import base64
+from io import BytesIO
+
+from PIL import Image
+
+# The size of the longest side of the placeholder preview
+PLACEHOLDER_SIZE = 16
+PLACEHOLDER_QUALITY = 40
+# The number of colors the image is reduced to when looking for the dominant one
+DOMINANT_PALETTE_SIZE = 5
+
+
+def _downscale(image: Image.Image, size: int) -> Image.Image:
+    if image.mode not in ('RGB', 'RGBA', 'L'):
+        image = image.convert('RGBA' if image.has_transparency_data else 'RGB')
+    scale = min(1.0, size / max(image.size))
+    return image.resize((max(1, round(image.width * scale)), max(1, round(image.height * scale))),
+                        Image.Resampling.BOX)
+
+
+def image_placeholder(image: Image.Image) -> str:
+    """
+    Generate a tiny preview of an image to paint while its thumbnail is loading, the browser blurs it when scaled up.
+    :return: The preview as a WebP data URI, usually 100 to 300 characters long.
+    """
+    out = BytesIO()
+    _downscale(image, PLACEHOLDER_SIZE).save(out, 'WEBP', quality=PLACEHOLDER_QUALITY)
+    return f"data:image/webp;base64,{base64.b64encode(out.getvalue()).decode()}"
+
+
+def dominant_color(image: Image.Image) -> str:
+    """
+    :return: The most common color of an image after reducing it to a small palette, as `#rrggbb`.
+    """
+    quantized = _downscale(image, 64).convert('RGB').quantize(DOMINANT_PALETTE_SIZE, method=Image.Quantize.MEDIANCUT)
+    _, index = max(quantized.getcolors())
+    r, g, b = quantized.getpalette()[index * 3:index * 3 + 3]
+    return f"#{r:02x}{g:02x}{b:02x}"
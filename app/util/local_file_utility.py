@@ -1,8 +1,34 @@
+import json
+import os
+from dataclasses import dataclass
+from datetime import datetime
 from pathlib import Path
+from time import monotonic
+from typing import Iterable, AsyncGenerator, Optional
+
+from aiofiles.threadpool.binary import AsyncBufferedReader
+from loguru import logger
 
 VALID_IMAGE_EXTENSIONS = {'.jpg', '.png', '.jpeg', '.jfif', '.webp', '.gif'}
 
 
+async def read_chunks(file: AsyncBufferedReader, chunk_size: int, offset: int = 0,
+                      length: Optional[int] = None) -> AsyncGenerator[bytes, None]:
+    """
+    Read a range of an opened file in chunks.
+    :param length: The length of the range, None to read to the end of the file.
+    """
+    await file.seek(offset)
+    remaining = length
+    while remaining is None or remaining > 0:
+        chunk = await file.read(chunk_size if remaining is None else min(chunk_size, remaining))
+        if not chunk:
+            break
+        if remaining is not None:
+            remaining -= len(chunk)
+        yield chunk
+
+
 def glob_local_files(path: Path, pattern: str = "*", valid_extensions: set[str] = None):
     if valid_extensions is None:
         valid_extensions = VALID_IMAGE_EXTENSIONS
@@ -10,3 +36,78 @@ def glob_local_files(path: Path, pattern: str = "*", valid_extensions: set[str]
     for file in path.glob(pattern):
         if file.suffix.lower() in valid_extensions:
             yield file
+
+
+@dataclass
+class ScanProgress:
+    running: bool = False
+    scanned_dirs: int = 0
+    matched_files: int = 0
+    started_at: datetime | None = None
+    finished_at: datetime | None = None
+
+
+def scan_directory(path: str, extensions: Iterable[str], progress: ScanProgress | None = None,
+                   log_interval: float = 5) -> list[str]:
+    """
+    Recursively list the files with the given extensions.
+    os.scandir gets the file type from the directory entry, so unlike os.walk + os.path checks there's no extra stat
+    call per file, which matters on network shares.
+    :param path: The directory to scan.
+    :param extensions: The file extensions to match, case-insensitive.
+    :param progress: Updated while scanning, so the progress can be reported from another thread.
+    :param log_interval: The interval in seconds to log the progress.
+    :return: The sorted paths of the matched files.
+    """
+    extensions = tuple(t.lower() for t in extensions)
+    progress = progress if progress is not None else ScanProgress()
+    progress.running, progress.scanned_dirs, progress.matched_files = True, 0, 0
+    progress.started_at, progress.finished_at = datetime.now(), None
+    result = []
+    stack = [path]
+    last_log = monotonic()
+    try:
+        while stack:
+            current = stack.pop()
+            try:
+                with os.scandir(current) as it:
+                    for entry in it:
+                        if entry.is_dir(follow_symlinks=False):
+                            stack.append(entry.path)
+                        elif entry.name.lower().endswith(extensions):
+                            result.append(entry.path)
+            except OSError as ex:
+                logger.warning("Failed to scan directory {}: {}", current, ex)
+            progress.scanned_dirs += 1
+            progress.matched_files = len(result)
+            if monotonic() - last_log > log_interval:
+                last_log = monotonic()
+                logger.info("Scanning {}... {} directories scanned, {} files found.",
+                            path, progress.scanned_dirs, progress.matched_files)
+    finally:
+        progress.running = False
+        progress.finished_at = datetime.now()
+    result.sort()
+    return result
+
+
+def load_file_snapshot(snapshot_path: Path, directory: str, extensions: Iterable[str]) -> list[str] | None:
+    """
+    Load the file list saved by save_file_snapshot.
+    :return: The file list, or None if there's no snapshot of the same directory and extensions.
+    """
+    try:
+        snapshot = json.loads(snapshot_path.read_text(encoding='utf-8'))
+    except (OSError, ValueError):
+        return None
+    if snapshot.get('directory') != directory or snapshot.get('extensions') != sorted(extensions):
+        return None
+    return snapshot['files']
+
+
+def save_file_snapshot(snapshot_path: Path, directory: str, extensions: Iterable[str], files: list[str]):
+    snapshot_path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = snapshot_path.with_suffix('.tmp')
+    tmp.write_text(json.dumps({'directory': directory, 'extensions': sorted(extensions), 'files': files}),
+                   encoding='utf-8')
+    os.replace(tmp, snapshot_path)
@@ -0,0 +1,20 @@
+from pydantic import BaseModel
+from starlette.responses import Response
+
+
+class ModelResponse(Response):
+    """
+    A response serializing a pydantic model directly, without the validation and the jsonable_encoder pass FastAPI
+    runs on the returned models. The body is JSON rendered by pydantic-core.
+    """
+    media_type = "application/json"
+
+    def __init__(self, model: BaseModel, exclude: dict | set | None = None, status_code: int = 200,
+                 headers: dict[str, str] | None = None):
+        """
+        :param model: The model to send.
+        :param exclude: The fields excluded from the response (see pydantic's model_dump exclude syntax).
+        """
+        # The same URL is streamed as NDJSON depending on the Accept header, see ResponseFormatParams
+        super().__init__(model.model_dump_json(exclude=exclude).encode(), status_code,
+                         {**(headers or {}), 'vary': 'accept'})
@@ -0,0 +1,28 @@
+from typing import AsyncIterator, Callable
+
+from fastapi.responses import StreamingResponse
+from pydantic import BaseModel
+
+NDJSON_MEDIA_TYPE = "application/x-ndjson"
+
+
+def ndjson_response(chunks: AsyncIterator[list[BaseModel]], summary: Callable[[], BaseModel],
+                    item_exclude: dict | set | None = None, summary_exclude: dict | set | None = None) \
+        -> StreamingResponse:
+    """
+    Stream a list response as newline delimited JSON: one line per item, then a last line with the other fields of
+    the response. A stream without the summary line was interrupted by an error and is incomplete.
+    :param chunks: The items, a chunk is serialized and sent as soon as it is produced.
+    :param summary: Build the response without its items, called after the last chunk.
+    :param item_exclude: The fields excluded from each item (see pydantic's model_dump exclude syntax).
+    :param summary_exclude: The fields excluded from the summary, usually the list of items.
+    """
+
+    async def _lines():
+        async for chunk in chunks:
+            if chunk:
+                yield ''.join(item.model_dump_json(exclude=item_exclude) + '\n' for item in chunk)
+        yield summary().model_dump_json(exclude=summary_exclude) + '\n'
+
+    # The same URL is sent as JSON depending on the Accept header, see ResponseFormatParams
+    return StreamingResponse(_lines(), media_type=NDJSON_MEDIA_TYPE, headers={'vary': 'accept'})
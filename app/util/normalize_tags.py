@@ -0,0 +1,25 @@
+import re
+from typing import Iterable
+
+_TOKEN_SEPARATOR = re.compile(r'[\W_]+')
+
+
+def normalize_tags(tags: Iterable[str]) -> list[str]:
+    """
+    Normalize the tags to lowercase without surrounding whitespaces, and drop the empty and duplicated ones.
+    """
+    return list(dict.fromkeys(t for t in (tag.strip().lower() for tag in tags) if t))
+
+
+def tag_tokens(text: str) -> list[str]:
+    """
+    Split a tag (or a tag query) into lowercase words, e.g. `long_hair` -> `['long', 'hair']`.
+    """
+    return [t for t in _TOKEN_SEPARATOR.split(text.lower()) if t]
+
+
+def tags_to_text(tags: Iterable[str]) -> str:
+    """
+    Join the words of the tags into one text, which is stored in the payload and full-text indexed for tag queries.
+    """
+    return ' '.join(token for tag in tags for token in tag_tokens(tag))
@@ -0,0 +1,23 @@
+import hashlib
+import json
+
+from numpy import ndarray
+
+
+def _default(obj):
+    if isinstance(obj, ndarray):
+        return hashlib.sha1(obj.tobytes()).hexdigest()
+    if isinstance(obj, bytes):
+        return hashlib.sha1(obj).hexdigest()
+    if hasattr(obj, '__dict__'):
+        return vars(obj)
+    return str(obj)
+
+
+def query_fingerprint(*parts) -> str:
+    """
+    Generate a stable fingerprint for a query from its parts (route name, prompt, params objects, vectors...).
+    Objects are serialized through their attributes, vectors and raw bytes are serialized through their digest.
+    """
+    serialized = json.dumps(parts, default=_default, sort_keys=True, ensure_ascii=False)
+    return hashlib.sha1(serialized.encode()).hexdigest()
@@ -0,0 +1,26 @@
+from uuid import UUID
+
+import numpy as np
+
+# The number of leading bytes of the ID the key is taken from. They are uniformly distributed for both the uuid5 of
+# the uploaded images (a SHA1 digest) and uuid4, unlike the version and variant bits that follow.
+RANDOM_KEY_BYTES = 6
+
+
+def random_key(image_id: UUID) -> float:
+    """
+    The random sort key of an image, uniform in [0, 1). It's derived from the ID, so that it never changes and
+    existing points can be backfilled without any state.
+    """
+    return int.from_bytes(image_id.bytes[:RANDOM_KEY_BYTES], 'big') / 2 ** (8 * RANDOM_KEY_BYTES)
+
+
+def random_keys(id_bytes: np.ndarray) -> np.ndarray:
+    """
+    Vectorized random_key() for IDs given as a uint8 array of shape (n, 16).
+    """
+    keys = np.zeros(len(id_bytes), dtype=np.float64)
+    for i in range(RANDOM_KEY_BYTES):
+        keys = keys * 256 + id_bytes[:, i]
+    return keys / 2 ** (8 * RANDOM_KEY_BYTES)
+
@@ -0,0 +1,11 @@
+from pydantic import BaseModel
+
+from app.util.model_response import ModelResponse
+
+
+def project_response(resp: BaseModel, exclude: dict | None) -> ModelResponse:
+    """
+    Serialize a response with the given fields excluded (see pydantic's model_dump exclude syntax).
+    Nothing is excluded if `exclude` is None.
+    """
+    return ModelResponse(resp, exclude)
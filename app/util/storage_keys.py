@@ -0,0 +1,32 @@
+from uuid import UUID
+
+from app.Models.mapped_image import MappedImage
+
+
+def image_storage_key(image_id: UUID | str, image_format: str | None) -> str:
+    """
+    :return: The key an uploaded image is stored under, relative to the static_dir of the storage.
+    """
+    return f"{image_id}.{image_format}"
+
+
+def thumbnail_storage_key(image_id: UUID | str) -> str:
+    """
+    :return: The key the generated thumbnail of an image is stored under, relative to the static_dir of the storage.
+    """
+    return f"thumbnails/{image_id}.webp"
+
+
+def stored_image_key(image: MappedImage) -> str:
+    """
+    :return: The storage key of a local image, as saved in its payload, or derived for the points indexed before the
+    keys were saved.
+    """
+    return image.storage_key or image_storage_key(image.id, image.format)
+
+
+def stored_thumbnail_key(image: MappedImage) -> str:
+    """
+    :return: The storage key of the thumbnail of an image, see stored_image_key.
+    """
+    return image.thumbnail_storage_key or thumbnail_storage_key(image.id)
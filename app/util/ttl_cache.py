@@ -0,0 +1,43 @@
+from collections import OrderedDict
+from time import monotonic
+from typing import Generic, Hashable, TypeVar
+
+KeyT = TypeVar('KeyT', bound=Hashable)
+ValueT = TypeVar('ValueT')
+
+
+class TTLCache(Generic[KeyT, ValueT]):
+    """
+    A size-bounded LRU cache whose entries expire after a time-to-live.
+    """
+
+    def __init__(self, max_entries: int, ttl: float):
+        self._entries: OrderedDict[KeyT, tuple[ValueT, float]] = OrderedDict()
+        self._max_entries = max_entries
+        self._ttl = ttl
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, key: KeyT) -> ValueT | None:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        value, expires_at = entry
+        if monotonic() >= expires_at:
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        return value
+
+    def put(self, key: KeyT, value: ValueT, ttl: float | None = None):
+        """
+        :param ttl: The time-to-live of this entry in seconds, the default TTL of the cache if None.
+        """
+        self._entries[key] = (value, monotonic() + (self._ttl if ttl is None else ttl))
+        self._entries.move_to_end(key)
+        while len(self._entries) > self._max_entries:
+            self._entries.popitem(last=False)
+
+    def clear(self):
+        self._entries.clear()
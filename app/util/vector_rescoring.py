@@ -0,0 +1,144 @@
+from enum import Enum
+from typing import NamedTuple, Sequence
+
+import numpy as np
+
+from app.Models.search_result import SearchResult
+
+
+def normalize_rows(matrix: np.ndarray) -> np.ndarray:
+    """
+    L2-normalize each row of a matrix (or a single vector). All-zero rows are kept as zero.
+    """
+    norms = np.linalg.norm(matrix, axis=-1, keepdims=True)
+    return np.divide(matrix, norms, out=np.zeros_like(matrix), where=norms != 0)
+
+
+class CandidateMatrix:
+    """
+    A set of candidate vectors stacked into one float32 matrix with their norms computed once, so that the cosine
+    similarity of all the candidates against a query is a single matrix-vector product.
+    Missing vectors (None) are stored as zero rows and always score 0.
+    """
+
+    def __init__(self, vectors: Sequence[np.ndarray | None], dim: int = 768):
+        self.present = np.fromiter((t is not None for t in vectors), dtype=bool, count=len(vectors))
+        if len(vectors) == 0:
+            self.matrix = np.zeros((0, dim), dtype=np.float32)
+        else:
+            zero = np.zeros(dim, dtype=np.float32)
+            self.matrix = np.stack([t if t is not None else zero for t in vectors]).astype(np.float32, copy=False)
+        # Scaling the scores by the inverse norms is equivalent to normalizing the rows, but costs O(n) instead of O(nd)
+        norms = np.sqrt(np.einsum('ij,ij->i', self.matrix, self.matrix))
+        self.inv_norms = np.divide(1, norms, out=np.zeros_like(norms), where=norms != 0)
+
+    def __len__(self):
+        return self.matrix.shape[0]
+
+    def cosine(self, query: np.ndarray) -> np.ndarray:
+        """
+        Cosine similarity of every candidate against one query vector, shape (n,).
+        """
+        return (self.matrix @ normalize_rows(np.asarray(query, dtype=np.float32))) * self.inv_norms
+
+    def cosine_many(self, queries: np.ndarray) -> np.ndarray:
+        """
+        Cosine similarity of every candidate against every query vector, shape (n, m).
+        """
+        return (self.matrix @ normalize_rows(np.asarray(queries, dtype=np.float32)).T) * self.inv_norms[:, None]
+
+
+def average_vector_query(positive: np.ndarray, negative: np.ndarray | None = None) -> np.ndarray:
+    """
+    The query vector of the average_vector recommend strategy: `avg(positive) + avg(positive) - avg(negative)`,
+    or `avg(positive)` without negative examples. The examples are normalized first, same as with cosine distance.
+    :param positive: The positive examples, shape (p, d).
+    :param negative: The negative examples, shape (q, d).
+    """
+    average = normalize_rows(np.asarray(positive, dtype=np.float32)).mean(axis=0)
+    if negative is not None and len(negative):
+        average = 2 * average - normalize_rows(np.asarray(negative, dtype=np.float32)).mean(axis=0)
+    return average
+
+
+def weighted_vector_query(vectors: np.ndarray, weights: Sequence[float]) -> np.ndarray:
+    """
+    Combine several query vectors into one: the weighted sum of the normalized vectors. A negative weight pushes the
+    results away from its vector.
+    :param vectors: The query vectors, shape (n, d).
+    :param weights: The weight of each vector.
+    :return: The combined vector, all-zero if the vectors cancel each other out.
+    """
+    return (normalize_rows(np.asarray(vectors, dtype=np.float32)) * np.asarray(weights, dtype=np.float32)[:, None]) \
+        .sum(axis=0)
+
+
+def best_score(scores: np.ndarray, positive_count: int) -> np.ndarray:
+    """
+    Apply the best_score recommend strategy to the similarities of the candidates against all the examples.
+    A candidate scores its best positive similarity, or the negated square of its best negative similarity if it's
+    closer to a negative example.
+    :param scores: The similarities, shape (n, p + q), the positive examples first.
+    :param positive_count: The number of positive examples p.
+    :return: The scores, shape (n,).
+    """
+    best_positive = scores[:, :positive_count].max(axis=1)
+    if scores.shape[1] == positive_count:
+        return best_positive
+    best_negative = scores[:, positive_count:].max(axis=1)
+    return np.where(best_positive > best_negative, best_positive, -(best_negative * best_negative))
+
+
+class RescoreMode(str, Enum):
+    MULTIPLICATIVE = "multiplicative"
+    ADDITIVE = "additive"
+
+
+class RescoreSignal(NamedTuple):
+    vector_name: str
+    """The vector of MappedImage to compare with, `image_vector` or `text_contain_vector`."""
+    query_vector: np.ndarray
+    weight: float = 1.0
+
+
+def combine_scores(base_scores: np.ndarray, signal_scores: Sequence[np.ndarray], weights: Sequence[float],
+                   mode: RescoreMode = RescoreMode.MULTIPLICATIVE) -> np.ndarray:
+    """
+    Combine the base scores with weighted signal scores.
+    - multiplicative: `base * prod(1 + weight_i * signal_i)`
+    - additive: `base + sum(weight_i * signal_i)`
+    """
+    if not signal_scores:
+        return base_scores
+    weighted = np.stack(signal_scores) * np.asarray(weights, dtype=np.float32)[:, None]
+    match mode:
+        case RescoreMode.MULTIPLICATIVE:
+            return base_scores * np.prod(1 + weighted, axis=0)
+        case RescoreMode.ADDITIVE:
+            return base_scores + weighted.sum(axis=0)
+        case _:  # pragma: no cover
+            raise NotImplementedError()
+
+
+def rescore(results: list[SearchResult], signals: Sequence[RescoreSignal],
+            mode: RescoreMode = RescoreMode.MULTIPLICATIVE) -> list[SearchResult]:
+    """
+    Rescore the results with the given signals and sort them by the new score, in place.
+    Results missing the vector of a signal get a signal score of 0 for it.
+    :return: The same list, sorted by the new score in descending order.
+    """
+    if not results or not signals:
+        return results
+    base_scores = np.array([t.score for t in results], dtype=np.float32)
+    matrices: dict[str, CandidateMatrix] = {}
+    signal_scores = []
+    for signal in signals:
+        if signal.vector_name not in matrices:
+            matrices[signal.vector_name] = CandidateMatrix([getattr(t.img, signal.vector_name) for t in results],
+                                                           dim=signal.query_vector.shape[-1])
+        signal_scores.append(matrices[signal.vector_name].cosine(signal.query_vector))
+    scores = combine_scores(base_scores, signal_scores, [t.weight for t in signals], mode)
+    for itm, score in zip(results, scores.tolist()):
+        itm.score = score
+    results.sort(key=lambda i: i.score, reverse=True)
+    return results
@@ -1,9 +1,9 @@
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.staticfiles import StaticFiles
-from app.config import config
+from app.config import config, StorageMode
 from app.Controllers import admin, images, search, gui
 from app.Services.provider import ServiceProvider
+from app.util.http_cache import CachedStaticFiles
 
 async def lifespan(app: FastAPI):
     # Initialize service provider with running event loop
@@ -33,7 +33,10 @@ def create_app():
         app.include_router(admin.admin_router)
 
     # Mount static files with correct path
-    app.mount("/images", StaticFiles(directory="./images"), name="images")
+    app.mount("/images", CachedStaticFiles(directory="./images"), name="images")
+    if config.storage.method == StorageMode.LOCAL:
+        # The uploaded images and thumbnails, at the URLs given by LocalStorage.url()
+        app.mount("/static", CachedStaticFiles(directory=config.storage.local.path, check_dir=False), name="static")
 
     return app
 
@@ -80,6 +80,56 @@ def init_database():
     asyncio.run(qdrant_create_collection.main())
 
 
+@parser.command('migrate-db')
+def migrate_db(from_version: Annotated[int, typer.Argument(help="The version of the database to migrate from.")]):
+    """
+    Migrate the database from an older version to the current version.
+    """
+    from scripts import db_migrations
+    asyncio.run(db_migrations.migrate(from_version))
+
+
+@parser.command('build-neighbor-graph')
+def build_neighbor_graph():
+    """
+    Precompute the top-K similar images of every image, used to serve unfiltered similar searches.
+    A running server keeps the graph up to date, but only loads a rebuilt graph on restart.
+    """
+    from scripts import build_neighbor_graph as build_script
+    asyncio.run(build_script.main())
+
+
+@parser.command('backfill-placeholders')
+def backfill_placeholders():
+    """
+    Generate the placeholder preview and the dominant color of the images indexed before they were computed at
+    ingest. The images whose file is not stored on this server are skipped.
+    """
+    from scripts import backfill_placeholders as backfill_script
+    asyncio.run(backfill_script.main())
+
+
+@parser.command('shard-local-storage')
+def shard_local_storage():
+    """
+    Move the files of the local storage to the directory layout set by the shard_depth configuration, and update the
+    URLs of the images accordingly. The command can be run again to resume an interrupted migration.
+    """
+    from scripts import shard_local_storage as shard_script
+    asyncio.run(shard_script.main())
+
+
+@parser.command('benchmark-rescoring')
+def benchmark_rescoring(
+        candidates: Annotated[int, typer.Option(min=1, help="The number of candidates to score.")] = 1000):
+    """
+    Measure the cost of scoring the candidates of a search against a query vector, one by one versus stacked into a
+    CandidateMatrix. It only runs on random vectors, no database or model is needed.
+    """
+    from scripts import benchmark_rescoring as benchmark_script
+    benchmark_script.main(candidates)
+
+
 @parser.command("local-index")
 def local_index(
         target_dir: Annotated[
@@ -0,0 +1,55 @@
+from io import BytesIO
+
+from PIL import Image
+from loguru import logger
+
+from app.Models.mapped_image import MappedImage
+from app.Services.image_variant_service import ImageVariantService, ImageNotStoredError
+from app.Services.storage import StorageService
+from app.Services.storage.exception import StorageExtension
+from app.Services.vector_db_context import create_vector_db_context
+from app.config import config
+from app.util.image_placeholder import image_placeholder, dominant_color
+from app.util.storage_keys import stored_thumbnail_key
+
+
+async def _fetch_preview(storage_service: StorageService, variant_service: ImageVariantService,
+                         image: MappedImage) -> bytes:
+    # The thumbnail is enough for a 16px preview and much cheaper to download than the original
+    if image.local_thumbnail and config.storage.method.enabled:
+        return await storage_service.active_storage.fetch(stored_thumbnail_key(image))
+    return await variant_service.fetch_source(image)
+
+
+async def main():
+    context = create_vector_db_context()
+    await context.on_load()
+    storage_service = StorageService()
+    await storage_service.on_load()
+    variant_service = ImageVariantService(storage_service)
+    next_id = None
+    count = 0
+    updated = 0
+    while True:
+        points, next_id = await context.scroll_points(next_id, count=100)
+        for point in points:
+            count += 1
+            if point.placeholder is not None and point.dominant_color is not None:
+                continue
+            try:
+                data = await _fetch_preview(storage_service, variant_service, point)
+                with Image.open(BytesIO(data)) as img:
+                    point.placeholder = image_placeholder(img)
+                    point.dominant_color = dominant_color(img)
+            except (ImageNotStoredError, StorageExtension, OSError) as ex:
+                logger.warning("[{}] Cannot read image {}. Skip... {}", count, point.id, ex)
+                continue
+            await context.update_payload(point)
+            updated += 1
+            logger.info("[{}] Placeholder of {} generated.", count, point.id)
+        if next_id is None:
+            break
+    await variant_service.on_exit()
+    await storage_service.on_exit()
+    await context.on_exit()
+    logger.success("OK. Updated {} of {} images.", updated, count)
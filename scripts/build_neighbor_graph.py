@@ -0,0 +1,18 @@
+from loguru import logger
+
+from app.Services.neighbor_graph_service import NeighborGraphService
+from app.Services.vector_db_context import create_vector_db_context
+from app.config import config
+
+
+async def main():
+    context = create_vector_db_context()
+    await context.on_load()
+    service = NeighborGraphService(context)
+    logger.info("Building the neighbor graph, top_k = {}...", service.k)
+    await service.rebuild()
+    service.save(force=True)
+    await context.on_exit()
+    logger.success("Neighbor graph saved to {}.", config.neighbor_graph.path)
+    if not config.neighbor_graph.enable:
+        logger.warning("The neighbor graph is disabled, set APP_NEIGHBOR_GRAPH__ENABLE=True to use it.")
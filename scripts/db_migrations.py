@@ -1,8 +1,11 @@
 from loguru import logger
 
 from app.Services.provider import ServiceProvider
+from app.config import config
+from app.util.normalize_tags import normalize_tags
+from app.util.storage_keys import image_storage_key, thumbnail_storage_key
 
-CURRENT_VERSION = 2
+CURRENT_VERSION = 6
 
 services: ServiceProvider | None = None
 
@@ -31,6 +34,80 @@ async def migrate_v1_v2():
             break
 
 
+async def migrate_v2_v3():
+    logger.info("Migrating from v2 to v3...")
+    await services.db_context.create_payload_indexes()
+    next_id = None
+    count = 0
+    while True:
+        points, next_id = await services.db_context.scroll_points(next_id, count=100)
+        for point in points:
+            count += 1
+            logger.info("[{}] Migrating point {}", count, point.id)
+            point.tags = normalize_tags(point.tags or [])
+            await services.db_context.update_payload(point)  # This will also store tags_text field
+        if next_id is None:
+            break
+
+
+async def migrate_v3_v4():
+    logger.info("Migrating from v3 to v4...")
+    await services.db_context.create_payload_indexes()
+    next_id = None
+    count = 0
+    while True:
+        points, next_id = await services.db_context.scroll_points(next_id, count=100)
+        for point in points:
+            count += 1
+            logger.info("[{}] Migrating point {}", count, point.id)
+            await services.db_context.update_payload(point)  # This will store random_key field
+        if next_id is None:
+            break
+
+
+async def migrate_v4_v5():
+    logger.info("Migrating from v4 to v5...")
+    # The index of index_date, which the scroll by date is ordered by
+    await services.db_context.create_payload_indexes()
+
+
+async def _find_image_key(point) -> str | None:
+    key = image_storage_key(point.id, point.format)
+    if point.format is not None and await services.storage_service.active_storage.is_exist(key):
+        return key
+    # The format is unknown or doesn't match the extension, find the file by its ID
+    files = [itm[0] async for itm in services.storage_service.active_storage.list_files("", f"{point.id}.*")]
+    return files[0].as_posix() if files else None
+
+
+async def migrate_v5_v6():
+    logger.info("Migrating from v5 to v6...")
+    if not config.storage.method.enabled:
+        logger.warning("Storage is disabled, skipping the storage keys.")
+        return
+    next_id = None
+    count = 0
+    while True:
+        points, next_id = await services.db_context.scroll_points(next_id, count=100)
+        for point in points:
+            count += 1
+            changed = False
+            if point.local and point.storage_key is None:
+                if (key := await _find_image_key(point)) is not None:
+                    point.storage_key, changed = key, True
+                else:
+                    logger.warning("[{}] The file of point {} is not found in the storage", count, point.id)
+            if point.local_thumbnail and point.thumbnail_storage_key is None:
+                key = thumbnail_storage_key(point.id)
+                if await services.storage_service.active_storage.is_exist(key):
+                    point.thumbnail_storage_key, changed = key, True
+            if changed:
+                logger.info("[{}] Migrating point {}", count, point.id)
+                await services.db_context.update_payload(point)  # This will store the storage key fields
+        if next_id is None:
+            break
+
+
 async def migrate(from_version: int):
     global services
     services = ServiceProvider()
@@ -38,7 +115,25 @@ async def migrate(from_version: int):
     match from_version:
         case 1:
             await migrate_v1_v2()
+            await migrate_v2_v3()
+            await migrate_v3_v4()
+            await migrate_v4_v5()
+            await migrate_v5_v6()
         case 2:
+            await migrate_v2_v3()
+            await migrate_v3_v4()
+            await migrate_v4_v5()
+            await migrate_v5_v6()
+        case 3:
+            await migrate_v3_v4()
+            await migrate_v4_v5()
+            await migrate_v5_v6()
+        case 4:
+            await migrate_v4_v5()
+            await migrate_v5_v6()
+        case 5:
+            await migrate_v5_v6()
+        case 6:
             logger.info("Already up to date.")
         case _:
             raise ValueError(f"Unknown version {from_version}")
@@ -1,6 +1,6 @@
-from app.Services.vector_db_context import VectorDbContext
+from app.Services.vector_db_context import create_vector_db_context
 
 
 async def main():
-    context = VectorDbContext()
+    context = create_vector_db_context()
     await context.initialize_collection()
@@ -0,0 +1,54 @@
+import asyncio
+
+from loguru import logger
+
+from app.Services.storage import LocalStorage
+from app.Services.vector_db_context import create_vector_db_context
+from app.config import config, StorageMode
+from app.util.storage_keys import stored_image_key, stored_thumbnail_key
+
+BATCH_SIZE = 100
+
+
+async def main():
+    if config.storage.method != StorageMode.LOCAL:
+        logger.error("The storage method is not local. Abort.")
+        return
+    if config.storage.local.shard_depth == 0:
+        logger.warning("The shard depth is 0, the files are kept in the flat layout.")
+    context = create_vector_db_context()
+    await context.on_load()
+    storage = LocalStorage()
+    await storage.on_load()
+    next_id = None
+    count = 0
+    moved = 0
+    while True:
+        points, next_id = await context.scroll_points(next_id, count=BATCH_SIZE)
+        changed = []
+        for point in points:
+            count += 1
+            updated = False
+            if point.local:
+                key = stored_image_key(point)
+                if await asyncio.to_thread(storage.relocate, key):
+                    url = await storage.url(key)
+                    if point.url != url or point.storage_key is None:
+                        point.url, point.storage_key, updated = url, key, True
+                else:
+                    logger.warning("[{}] The file of point {} is not found in the storage", count, point.id)
+            if point.local_thumbnail and point.thumbnail_url is not None:
+                key = stored_thumbnail_key(point)
+                if await asyncio.to_thread(storage.relocate, key):
+                    url = await storage.url(key)
+                    if point.thumbnail_url != url or point.thumbnail_storage_key is None:
+                        point.thumbnail_url, point.thumbnail_storage_key, updated = url, key, True
+            if updated:
+                changed.append(point)
+        await context.update_payloads(changed)
+        moved += len(changed)
+        logger.info("[{}] Updated {} images in this batch.", count, len(changed))
+        if next_id is None:
+            break
+    await context.on_exit()
+    logger.success("OK. Updated {} of {} images.", moved, count)
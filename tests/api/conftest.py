@@ -1,11 +1,16 @@
 import asyncio
 import importlib
+from datetime import datetime
 from pathlib import Path
 
 import pytest
 from fastapi.testclient import TestClient
 
 from app import config
+from app.Models.api_models.admin_query_params import UploadImageThumbnailMode
+from app.Models.mapped_image import MappedImage
+from app.util.generate_uuid import generate_uuid
+from ..assets import assets_path
 
 TEST_ACCESS_TOKEN = 'test_token'
 TEST_ADMIN_TOKEN = 'test_admin_token'
@@ -64,6 +69,40 @@ def wait_for_background_task(test_client):
     return func
 
 
+@pytest.fixture(scope="module")
+def indexed_images(test_client):
+    """
+    Index the test images through the upload service of the app, as local images, then delete them after the tests of
+    the module.
+    :return: The IDs of the indexed images by class, e.g. {'cat': ['...', '...']}.
+    """
+    services = test_client.app.state.services
+    test_images = {'bsn': ['bsn_0.jpg', 'bsn_1.jpg', 'bsn_2.jpg'],
+                   'cat': ['cat_0.jpg', 'cat_1.jpg'],
+                   'cg': ['cg_0.jpg', 'cg_1.png']}
+    img_ids = {}
+    for img_cls, item_images in test_images.items():
+        img_ids[img_cls] = []
+        for image in item_images:
+            img_bytes = (assets_path / 'test_images' / image).read_bytes()
+            mapped_image = MappedImage(id=generate_uuid(img_bytes), local=True, format=image.split('.')[-1],
+                                       index_date=datetime.now())
+            test_client.portal.call(services.upload_service.sync_upload_image, mapped_image, img_bytes, True,
+                                    UploadImageThumbnailMode.NEVER)
+            img_ids[img_cls].append(str(mapped_image.id))
+
+    yield img_ids
+
+    async def cleanup():
+        for image_id in (t for ids in img_ids.values() for t in ids):
+            point = await services.db_context.retrieve_by_id(image_id)
+            await services.db_context.delete_items([image_id])
+            await services.storage_service.active_storage.delete(point.storage_key)
+
+    test_client.portal.call(cleanup)
+    check_local_dir_empty()
+
+
 @pytest.fixture
 def anyio_backend():
     return 'asyncio'
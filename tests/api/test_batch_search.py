@@ -0,0 +1,49 @@
+from app.Services.local_search_service import LocalSearchService
+from app.Services.vector_db_context import VectorDbContext
+
+
+def vector_search(test_client, vector, count):
+    resp = test_client.post('/vector', json={'vectors': [{'vector': vector}]}, params={'count': count})
+    assert resp.status_code == 200
+    return [t['img']['id'] for t in resp.json()['result']]
+
+
+def test_batch_mixed_queries(test_client, indexed_images):
+    services = test_client.app.state.services
+    # With local search disabled, the batch runs directly on the vector database
+    assert isinstance(services.search_service, VectorDbContext)
+    cat_vector = services.transformers_service.get_text_vector('cat').tolist()
+    anime_vector = services.transformers_service.get_text_vector('anime girl').tolist()
+
+    resp = test_client.post('/batch', json={'queries': [
+        {'text': 'cat', 'count': 3},
+        {'vector': anime_vector, 'count': 2},
+        {'vector': cat_vector, 'count': 2, 'skip': 1},
+        {'text': 'anime girl', 'count': 5, 'filter': {'min_width': 100000}},
+    ]})
+    assert resp.status_code == 200
+    results = [[t['img']['id'] for t in result] for result in resp.json()['result']]
+    assert len(results) == 4
+
+    # Every list is the result of its own query, in the order of the queries
+    cat_results = vector_search(test_client, cat_vector, 4)
+    assert results[0] == cat_results[:3]
+    assert results[1] == vector_search(test_client, anime_vector, 2)
+    assert results[2] == cat_results[1:3]
+    assert results[3] == []
+
+
+def test_batch_local_search_disabled(test_client, indexed_images, monkeypatch):
+    services = test_client.app.state.services
+    local_search = LocalSearchService(services.transformers_service, None, services.db_context)
+    monkeypatch.setattr(services, 'search_service', local_search)
+
+    resp = test_client.post('/batch', json={'queries': [{'text': 'cat'}, {'text': 'dog', 'count': 2}]})
+    assert resp.status_code == 200
+    assert resp.json()['result'] == [[], []]
+
+
+def test_batch_invalid_query(test_client):
+    assert test_client.post('/batch', json={'queries': []}).status_code == 422
+    assert test_client.post('/batch', json={'queries': [{'text': 'cat', 'vector': [0.0] * 768}]}).status_code == 422
+    assert test_client.post('/batch', json={'queries': [{'count': 2}]}).status_code == 422
@@ -0,0 +1,15 @@
+from app.Services.vector_db_context import VectorDbContext
+from app.config import config
+
+
+def test_combined_search_page_limit(test_client, monkeypatch):
+    monkeypatch.setattr(config.ocr_search, 'enable', True)
+    body = {'criteria': ['cat'], 'extra_prompt': 'cat'}
+    limit = VectorDbContext.COMBINED_SEARCH_MAX_CANDIDATES
+    resp = test_client.post('/combined', json=body, params={'skip': limit - 10, 'count': 10})
+    assert resp.status_code == 200
+    # The results are ranked among a capped number of candidates, the pages past them are rejected
+    resp = test_client.post('/combined', json=body, params={'skip': limit - 9, 'count': 10})
+    assert resp.status_code == 422
+    resp = test_client.post('/combined', json=body, params={'skip': 100000})
+    assert resp.status_code == 422
@@ -0,0 +1,102 @@
+from app.Models.query_params import PayloadProjectionParams
+from app.Services.vector_db_context import VectorDbContext
+from app.config import config
+from ..assets import assets_path
+
+
+def spy_payload_selectors(test_client, monkeypatch) -> list:
+    """
+    Record the payload selector and the payload keys of every query sent to Qdrant.
+    """
+    client = test_client.app.state.services.db_context._client
+    calls = []
+
+    async def query_points(*args, **kwargs):
+        result = await original(*args, **kwargs)
+        calls.append((kwargs.get('with_payload'), [set(t.payload) for t in result.points]))
+        return result
+
+    original = client.query_points
+    monkeypatch.setattr(client, 'query_points', query_points)
+    return calls
+
+
+def search_by_image(test_client, params=None):
+    with open(assets_path / 'test_images' / 'cat_0.jpg', 'rb') as f:
+        return test_client.post('/image', files={'image': f}, params=params)
+
+
+def test_projection_trims_payload_and_response(test_client, indexed_images, monkeypatch):
+    calls = spy_payload_selectors(test_client, monkeypatch)
+    resp = search_by_image(test_client, {'fields': 'width,height'})
+    assert resp.status_code == 200
+    assert resp.json()['result']
+    for item in resp.json()['result']:
+        assert set(item['img']) == {'id', 'width', 'height'}
+
+    # Only the requested fields and the ones needed to build the response are read from Qdrant
+    selector, payload_keys = calls[-1]
+    assert selector == [*VectorDbContext.PROJECTION_REQUIRED_FIELDS, 'width', 'height']
+    assert all(keys <= set(selector) for keys in payload_keys)
+    assert all('image_vector' not in keys and 'ocr_text' not in keys and 'tags' not in keys for keys in payload_keys)
+
+
+def test_projection_keeps_required_fields(test_client, indexed_images, monkeypatch):
+    calls = spy_payload_selectors(test_client, monkeypatch)
+    full = search_by_image(test_client).json()['result']
+    assert calls[-1][0] is True
+    projected = search_by_image(test_client, {'fields': 'url'}).json()['result']
+    assert set(VectorDbContext.PROJECTION_REQUIRED_FIELDS) <= set(calls[-1][0])
+    # The URLs of the local images are rebuilt from the required fields, so they're the same as without projection
+    assert [(t['img']['id'], t['img']['url']) for t in projected] == [(t['img']['id'], t['img']['url']) for t in full]
+    assert all(t['img']['url'] for t in projected)
+
+
+def test_projection_all_fields(test_client, indexed_images):
+    resp = search_by_image(test_client)
+    assert resp.status_code == 200
+    assert set(resp.json()['result'][0]['img']) == {'id', *PayloadProjectionParams.PROJECTABLE_FIELDS}
+
+
+def test_projection_scroll(test_client, indexed_images):
+    resp = test_client.get('/scroll', params={'fields': 'width', 'count': 50})
+    assert resp.status_code == 200
+    images = resp.json()['images']
+    assert {t['id'] for t in images} == {t for ids in indexed_images.values() for t in ids}
+    assert all(set(t) == {'id', 'width'} and t['width'] > 0 for t in images)
+
+
+def test_projection_unknown_field(test_client, indexed_images):
+    assert test_client.get('/scroll', params={'fields': 'width,image_vector'}).status_code == 422
+    assert search_by_image(test_client, {'fields': 'storage_key'}).status_code == 422
+
+
+def test_projection_similar_from_neighbor_graph(test_client, indexed_images, monkeypatch, tmp_path):
+    services = test_client.app.state.services
+    graph = services.neighbor_graph_service
+    monkeypatch.setattr(config.neighbor_graph, 'path', str(tmp_path))
+    monkeypatch.setattr(graph, 'enabled', True)
+    monkeypatch.setattr(graph, 'stores', graph.stores)
+    monkeypatch.setattr(graph, '_dirty', False)
+    test_client.portal.call(graph.rebuild)
+
+    async def query_similar(*args, **kwargs):
+        raise AssertionError("The query should be answered by the neighbor graph")
+
+    monkeypatch.setattr(services.search_service, 'query_similar', query_similar)
+    client = services.db_context._client
+    selectors = []
+
+    async def retrieve(*args, **kwargs):
+        selectors.append(kwargs.get('with_payload'))
+        return await original(*args, **kwargs)
+
+    original = client.retrieve
+    monkeypatch.setattr(client, 'retrieve', retrieve)
+    image_id = indexed_images['cat'][0]
+    resp = test_client.get(f'/similar/{image_id}', params={'fields': 'width,url', 'count': 3})
+    assert resp.status_code == 200
+    result = resp.json()['result']
+    assert len(result) == 3 and image_id not in {t['img']['id'] for t in result}
+    assert all(set(t['img']) == {'id', 'width', 'url'} and t['img']['url'] for t in result)
+    assert selectors == [[*VectorDbContext.PROJECTION_REQUIRED_FIELDS, 'width', 'url']]
@@ -0,0 +1,35 @@
+def test_random_pick_seeded(test_client, indexed_images):
+    resp = test_client.get('/random', params={'seed': 42, 'count': 3})
+    assert resp.status_code == 200
+    result = resp.json()['result']
+    assert len(result) == 3
+    assert len({t['img']['id'] for t in result}) == 3
+    # The same seed draws the same images
+    assert test_client.get('/random', params={'seed': 42, 'count': 3}).json()['result'] == result
+
+
+def test_random_pick_before_backfill(test_client, indexed_images, monkeypatch):
+    search_service = test_client.app.state.services.search_service
+    calls = []
+
+    async def not_ready():
+        return False
+
+    async def spy_query_random(*args, **kwargs):
+        calls.append(kwargs)
+        return []
+
+    monkeypatch.setattr(search_service, 'random_sampling_ready', not_ready)
+    monkeypatch.setattr(search_service, 'query_random', spy_query_random)
+    # Collections without the random keys fall back to a search with a random vector
+    resp = test_client.get('/random', params={'seed': 42, 'count': 3})
+    assert resp.status_code == 200
+    assert len(resp.json()['result']) == 3
+    assert not calls
+
+
+def test_random_pick_page_limit(test_client):
+    max_window = test_client.app.state.services.cursor_service.max_window
+    assert test_client.get('/random', params={'seed': 42, 'skip': max_window - 10}).status_code == 200
+    assert test_client.get('/random', params={'seed': 42, 'skip': max_window - 9}).status_code == 422
+    assert test_client.get('/random', params={'skip': 100000}).status_code == 422
@@ -0,0 +1,23 @@
+def test_etag_changes_with_presign_epoch(test_client, monkeypatch):
+    storage = test_client.app.state.services.storage_service.active_storage
+    monkeypatch.setattr(storage, 'presign_epoch', lambda expire_second=3600: 1)
+    resp = test_client.get('/text/cat')
+    assert resp.status_code == 200
+    etag = resp.headers['etag']
+    assert test_client.get('/text/cat', headers={'if-none-match': etag}).status_code == 304
+
+    # The presign URLs of the cached page may have expired in the next epoch, so the page is sent again
+    monkeypatch.setattr(storage, 'presign_epoch', lambda expire_second=3600: 2)
+    resp = test_client.get('/text/cat', headers={'if-none-match': etag})
+    assert resp.status_code == 200
+    assert resp.headers['etag'] != etag
+
+
+def test_vary_accept(test_client):
+    # JSON and NDJSON are served on the same URL, so caches must key them by the Accept header
+    resp = test_client.get('/text/cat')
+    assert resp.headers['vary'] == 'accept'
+    resp = test_client.get('/text/cat', headers={'accept': 'application/x-ndjson'})
+    assert resp.headers['content-type'].startswith('application/x-ndjson')
+    assert resp.headers['vary'] == 'accept'
+    assert 'etag' in resp.headers
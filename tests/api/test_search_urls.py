@@ -0,0 +1,54 @@
+import shutil
+from datetime import datetime
+from pathlib import Path
+
+import pytest
+from PIL import Image
+
+from app.Models.mapped_image import MappedImage
+from app.util.generate_uuid import generate_uuid
+from ..assets import assets_path
+
+
+def search_by_image(test_client, count):
+    with open(assets_path / 'test_images' / 'cat_0.jpg', 'rb') as f:
+        resp = test_client.post('/image', files={'image': f}, params={'count': count})
+    assert resp.status_code == 200
+    return resp.json()['result']
+
+
+@pytest.fixture
+def local_file_image(test_client):
+    """
+    A point indexed from a file of the local search directory, which carries its filename in the payload.
+    """
+    services = test_client.app.state.services
+    source = assets_path / 'test_images' / 'cat_1.jpg'
+    image_path = Path('./images') / f"test_search_urls_{source.name}"
+    shutil.copy(source, image_path)
+    with Image.open(image_path) as img:
+        image_vector = services.transformers_service.get_image_vector(img)
+    image = MappedImage(id=generate_uuid(image_path.read_bytes() + b'local'), index_date=datetime.now(), local=True,
+                        format='jpeg', image_vector=image_vector)
+    image.add_payload_data("filename", image_path.name)
+    test_client.portal.call(services.db_context.insert_items, [image])
+    yield image
+    test_client.portal.call(services.db_context.delete_items, [str(image.id)])
+    image_path.unlink()
+
+
+def test_uploaded_image_urls(test_client, indexed_images):
+    for item in search_by_image(test_client, 7):
+        # Uploaded images are served from the storage, under the keys they were stored with
+        resp = test_client.get(item['img']['url'])
+        assert resp.status_code == 200
+        assert resp.headers['content-type'].startswith('image/')
+
+
+def test_local_file_image_urls(test_client, indexed_images, local_file_image):
+    result = {t['img']['id']: t['img'] for t in search_by_image(test_client, 8)}
+    img = result[str(local_file_image.id)]
+    assert img['url'] == '/images/test_search_urls_cat_1.jpg'
+    resp = test_client.get(img['url'])
+    assert resp.status_code == 200
+    assert resp.content == (assets_path / 'test_images' / 'cat_1.jpg').read_bytes()
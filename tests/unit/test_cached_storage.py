@@ -0,0 +1,52 @@
+import pytest
+import pytest_asyncio
+
+from app.Services.storage import CachedStorage, LocalStorage
+from app.config import config
+
+
+class TestCachedStorage:
+    @pytest_asyncio.fixture
+    async def storage(self, tmp_path, monkeypatch):
+        monkeypatch.setattr(config.storage.local, 'path', str(tmp_path / 'static'))
+        storage = CachedStorage(LocalStorage(), str(tmp_path / 'cache'), 10)
+        await storage.on_load()
+        return storage
+
+    @pytest.mark.asyncio
+    async def test_read_through(self, storage):
+        await storage.upload(b'abc', 'a.png')
+        assert await storage.fetch('a.png') == b'abc'
+        # Served from the cache once the file is read
+        (storage.static_dir / 'a.png').unlink()
+        assert await storage.fetch('a.png') == b'abc'
+        assert await storage.size('a.png') == 3 and await storage.is_exist('a.png')
+
+    @pytest.mark.asyncio
+    async def test_invalidation(self, storage):
+        await storage.upload(b'abc', 'a.png')
+        await storage.fetch('a.png')
+        await storage.upload(b'defg', 'a.png')
+        assert await storage.fetch('a.png') == b'defg'
+        await storage.move('a.png', 'b.png')
+        assert not await storage.is_exist('a.png')
+        assert await storage.fetch('b.png') == b'defg'
+        await storage.delete('b.png')
+        assert not await storage.is_exist('b.png')
+
+    @pytest.mark.asyncio
+    async def test_eviction(self, storage):
+        for name in ['a.png', 'b.png', 'c.png']:
+            await storage.upload(b'12345', name)
+            await storage.fetch(name)
+        (storage.static_dir / 'a.png').unlink()
+        assert not await storage.is_exist('a.png')
+        assert await storage.is_exist('c.png')
+
+    @pytest.mark.asyncio
+    async def test_stream(self, storage):
+        await storage.upload(b'0123456789', 'a.png')
+        assert b''.join([t async for t in storage.stream('a.png', chunk_size=3, offset=2, length=5)]) == b'23456'
+        await storage.fetch('a.png')
+        (storage.static_dir / 'a.png').unlink()
+        assert [t async for t in storage.stream('a.png', chunk_size=4, offset=3)] == [b'3456', b'789']
@@ -0,0 +1,84 @@
+import timeit
+
+import numpy as np
+
+from app.Models.query_params import FilterParams
+from app.Services.columnar_metadata import ColumnarMetadataStore
+from app.util.normalize_tags import tag_tokens
+
+
+class TestColumnarMetadataStore:
+    def setup_method(self):
+        rng = np.random.default_rng(42)
+        tags = ['long_hair', 'short_hair', 'smile', 'cat_ears', 'outdoors', 'Blue_Sky']
+        self.payloads = [{'width': int(rng.integers(100, 2000)) if i % 50 else None,
+                          'height': int(rng.integers(100, 2000)),
+                          'aspect_ratio': float(rng.uniform(0.3, 3)),
+                          'starred': bool(i % 7 == 0),
+                          'categories': [c for c in ['cg', 'stickers', 'photo'] if rng.random() < 0.3],
+                          'tags': [t for t in tags if rng.random() < 0.25],
+                          'ocr_text_lower': 'hello world' if i % 11 == 0 else None}
+                         for i in range(20000)]
+        self.store = ColumnarMetadataStore()
+        for row, payload in enumerate(self.payloads):
+            self.store.set_row(row, payload)
+
+    @staticmethod
+    def passes(payload, filter_param: FilterParams) -> bool:
+        if filter_param.min_width and (payload['width'] is None or payload['width'] < filter_param.min_width):
+            return False
+        if filter_param.min_ratio and not filter_param.min_ratio <= payload['aspect_ratio'] <= filter_param.max_ratio:
+            return False
+        if filter_param.starred is not None and payload['starred'] != filter_param.starred:
+            return False
+        if filter_param.categories and not set(filter_param.categories) & set(payload['categories']):
+            return False
+        if filter_param.categories_negative and set(filter_param.categories_negative) & set(payload['categories']):
+            return False
+        words = [token for tag in payload['tags'] for token in tag_tokens(tag)]
+        if filter_param.query_text and not all(any(w.startswith(t) for w in words)
+                                               for t in tag_tokens(filter_param.query_text)):
+            return False
+        if filter_param.ocr_text and (payload['ocr_text_lower'] is None
+                                      or filter_param.ocr_text.lower() not in payload['ocr_text_lower']):
+            return False
+        return True
+
+    def expected_mask(self, filter_param):
+        return np.array([self.passes(t, filter_param) for t in self.payloads])
+
+    def test_mask_matches_loop(self):
+        filters = [FilterParams(min_width=800, categories='cg, photo'),
+                   FilterParams(preferred_ratio=1, starred=False, categories_negative='stickers'),
+                   FilterParams(query_text='hair', min_width=500),
+                   FilterParams(query_text='blue'),
+                   FilterParams(query_text='Long Ha')]
+        ocr_filter = FilterParams(categories='cg')
+        ocr_filter.ocr_text = 'World'
+        filters.append(ocr_filter)
+        for filter_param in filters:
+            mask = self.store.mask(filter_param, len(self.payloads))
+            assert mask.any()
+            assert np.array_equal(mask, self.expected_mask(filter_param))
+
+    def test_update_rows(self):
+        self.payloads[3] = {**self.payloads[3], 'categories': ['new'], 'tags': ['Unique_Tag']}
+        self.store.set_row(3, self.payloads[3])
+        self.store.set_row(5, None)
+        assert np.flatnonzero(self.store.mask(FilterParams(categories='new'), len(self.payloads))).tolist() == [3]
+        assert np.flatnonzero(self.store.mask(FilterParams(query_text='unique'), len(self.payloads))).tolist() == [3]
+        assert not self.store.mask(FilterParams(min_height=1), len(self.payloads))[5]
+        # Rows beyond the initial capacity grow the columns
+        self.store.set_row(50000, {'width': 10, 'categories': ['new']})
+        assert np.flatnonzero(self.store.mask(FilterParams(categories='new'), 50001)).tolist() == [3, 50000]
+
+    def test_benchmark(self):
+        filter_param = FilterParams(min_width=800, preferred_ratio=1, categories='cg', query_text='hair')
+
+        def bench(func):
+            return min(timeit.repeat(func, number=3, repeat=3)) / 3 * 1000
+
+        loop_time = bench(lambda: self.expected_mask(filter_param))
+        mask_time = bench(lambda: self.store.mask(filter_param, len(self.payloads)))
+        print(f"Filtering 20k rows: loop {loop_time:.3f}ms, columnar mask {mask_time:.3f}ms")
+        assert mask_time * 10 < loop_time
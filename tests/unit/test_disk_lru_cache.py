@@ -0,0 +1,71 @@
+import os
+from io import BytesIO
+
+import pytest
+from PIL import Image
+
+from app.Models.api_models.images_query_params import VariantFormatEnum
+from app.Services.image_variant_service import render_variant
+from app.util.disk_lru_cache import DiskLRUCache
+
+
+class TestDiskLRUCache:
+    def test_lru_eviction(self, tmp_path):
+        cache = DiskLRUCache(tmp_path, max_bytes=250)
+        cache.put('a/1.bin', b'a' * 100)
+        cache.put('b/2.bin', b'b' * 100)
+        assert cache.get('a/1.bin').read_bytes() == b'a' * 100
+        cache.put('c.bin', b'c' * 100)
+        assert cache.get('b/2.bin') is None
+        assert not (tmp_path / 'b' / '2.bin').exists()
+        assert cache.total_bytes == 200 and len(cache) == 2
+        # Overwriting an entry replaces its size
+        cache.put('c.bin', b'c' * 10)
+        assert cache.total_bytes == 110
+
+    def test_reload_keeps_recency(self, tmp_path):
+        cache = DiskLRUCache(tmp_path, max_bytes=1000)
+        for i, key in enumerate(['old', 'new', 'hit']):
+            path = cache.put(key, b'x' * 100)
+            os.utime(path, (1000 + i, 1000 + i))
+        cache.get('old')
+        (tmp_path / 'left.1234.tmp').write_bytes(b'partial')
+
+        reloaded = DiskLRUCache(tmp_path, max_bytes=250)
+        reloaded.load()
+        assert 'old' in reloaded and 'hit' in reloaded and 'new' not in reloaded
+        assert not (tmp_path / 'left.1234.tmp').exists()
+
+    def test_invalid_keys(self, tmp_path):
+        cache = DiskLRUCache(tmp_path, max_bytes=1000)
+        for key in ['../escape', '/absolute', '', 'a.tmp']:
+            with pytest.raises(ValueError):
+                cache.put(key, b'x')
+
+
+class TestRenderVariant:
+    @staticmethod
+    def encode(img: Image.Image, image_format: str, **kwargs) -> bytes:
+        out = BytesIO()
+        img.save(out, image_format, **kwargs)
+        return out.getvalue()
+
+    def test_resize(self):
+        source = self.encode(Image.new('RGB', (2000, 1000), (10, 20, 30)), 'JPEG')
+        with Image.open(BytesIO(render_variant(source, 512, VariantFormatEnum.webp))) as img:
+            assert img.format == 'WEBP' and img.size == (512, 256)
+        # Never upscaled
+        with Image.open(BytesIO(render_variant(source, 4096, VariantFormatEnum.png))) as img:
+            assert img.size == (2000, 1000)
+
+    def test_exif_orientation(self):
+        exif = Image.Exif()
+        exif[0x0112] = 6  # Rotated 90 degrees, displayed as a portrait
+        source = self.encode(Image.new('RGB', (2000, 1000)), 'JPEG', exif=exif)
+        with Image.open(BytesIO(render_variant(source, 256, VariantFormatEnum.jpeg))) as img:
+            assert img.size == (256, 512)
+
+    def test_transparency_to_jpeg(self):
+        source = self.encode(Image.new('RGBA', (300, 300), (0, 0, 0, 0)), 'PNG')
+        with Image.open(BytesIO(render_variant(source, 128, VariantFormatEnum.jpeg))) as img:
+            assert img.mode == 'RGB' and img.size == (128, 128)
@@ -0,0 +1,18 @@
+from app.util.http_cache import make_etag, etag_matches, is_content_addressed
+
+
+class TestHttpCache:
+    def test_etag_matches(self):
+        etag = make_etag('generation', 'fingerprint')
+        assert etag.startswith('W/"') and etag == make_etag('generation', 'fingerprint')
+        assert etag != make_etag('generation2', 'fingerprint')
+        assert etag_matches(etag, etag)
+        assert etag_matches(f'"other", {etag.removeprefix("W/")}', etag)
+        assert etag_matches('*', etag)
+        assert not etag_matches(None, etag)
+        assert not etag_matches('"other"', etag)
+
+    def test_is_content_addressed(self):
+        assert is_content_addressed('images/thumbnails/0b5a7ba4-3ac9-5c2e-9ab8-7a86c4e32a35.webp')
+        assert is_content_addressed('0B5A7BA4-3AC9-5C2E-9AB8-7A86C4E32A35.png')
+        assert not is_content_addressed('images/holiday/IMG_0001.jpg')
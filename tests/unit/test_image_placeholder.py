@@ -0,0 +1,22 @@
+import base64
+from io import BytesIO
+
+from PIL import Image
+
+from app.util.image_placeholder import image_placeholder, dominant_color, PLACEHOLDER_SIZE
+
+
+class TestImagePlaceholder:
+    def test_placeholder(self):
+        for size, mode in [((1600, 1200), 'RGB'), ((3000, 10), 'RGB'), ((8, 8), 'RGB'), ((300, 200), 'RGBA'),
+                           ((64, 64), 'P')]:
+            uri = image_placeholder(Image.new(mode, size))
+            assert uri.startswith('data:image/webp;base64,') and len(uri) < 400
+            with Image.open(BytesIO(base64.b64decode(uri.split(',', 1)[1]))) as preview:
+                assert max(preview.size) == min(PLACEHOLDER_SIZE, max(size))
+
+    def test_dominant_color(self):
+        img = Image.new('RGB', (400, 300), (200, 30, 40))
+        img.paste((10, 10, 10), (0, 0, 100, 100))
+        assert dominant_color(img) == '#c81e28'
+        assert dominant_color(Image.new('L', (10, 10), 255)) == '#ffffff'
@@ -0,0 +1,39 @@
+import os
+
+from app.util.local_file_utility import ScanProgress, scan_directory, load_file_snapshot, save_file_snapshot
+
+
+class TestScanDirectory:
+    def setup_method(self):
+        self.extensions = ['.jpg', '.png']
+
+    def make_tree(self, root):
+        expected = []
+        for i in range(5):
+            directory = root / f"dir{i}" / "nested"
+            directory.mkdir(parents=True)
+            for name in [f"{i}.jpg", f"{i}.PNG", f"{i}.txt", f"{i}.jpg.bak"]:
+                (directory / name).write_bytes(b'')
+                if name.lower().endswith(tuple(self.extensions)):
+                    expected.append(str(directory / name))
+        return sorted(expected)
+
+    def test_scan(self, tmp_path):
+        expected = self.make_tree(tmp_path)
+        progress = ScanProgress()
+        assert scan_directory(str(tmp_path), self.extensions, progress) == expected
+        assert not progress.running and progress.finished_at is not None
+        assert progress.scanned_dirs == 11 and progress.matched_files == len(expected)
+        walked = sorted(os.path.join(root, t) for root, _, files in os.walk(tmp_path) for t in files
+                        if t.lower().endswith(tuple(self.extensions)))
+        assert walked == expected
+
+    def test_snapshot(self, tmp_path):
+        files = self.make_tree(tmp_path / "images")
+        snapshot = tmp_path / "meta" / "snapshot.json"
+        assert load_file_snapshot(snapshot, str(tmp_path / "images"), self.extensions) is None
+        save_file_snapshot(snapshot, str(tmp_path / "images"), self.extensions, files)
+        assert load_file_snapshot(snapshot, str(tmp_path / "images"), reversed(self.extensions)) == files
+        # A snapshot of another directory or other extensions is not used
+        assert load_file_snapshot(snapshot, str(tmp_path), self.extensions) is None
+        assert load_file_snapshot(snapshot, str(tmp_path / "images"), ['.jpg']) is None
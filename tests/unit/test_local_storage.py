@@ -0,0 +1,61 @@
+from uuid import uuid4
+
+import pytest
+import pytest_asyncio
+
+from app.Services.storage import LocalStorage
+from app.config import config
+
+
+class TestLocalStorage:
+    @pytest_asyncio.fixture
+    async def storage(self, tmp_path, monkeypatch):
+        monkeypatch.setattr(config.storage.local, 'path', str(tmp_path))
+        monkeypatch.setattr(config.storage.local, 'shard_depth', 2)
+        storage = LocalStorage()
+        await storage.on_load()
+        return storage
+
+    def test_shard_key(self, storage):
+        image_id = 'ABCD0123-4567-89ab-cdef-0123456789ab'
+        assert storage.shard_key(f"{image_id}.png").as_posix() == f"ab/cd/{image_id}.png"
+        assert storage.shard_key(f"thumbnails/{image_id}.webp").as_posix() == f"thumbnails/ab/cd/{image_id}.webp"
+        assert storage.shard_key(f"ab/cd/{image_id}.png").as_posix() == f"ab/cd/{image_id}.png"
+        assert storage.shard_key('cover.png').as_posix() == 'cover.png'
+
+    @pytest.mark.asyncio
+    async def test_sharded_layout(self, storage):
+        key = f"{uuid4()}.png"
+        await storage.upload(b'data', key)
+        assert (storage.static_dir / key[:2] / key[2:4] / key).is_file()
+        assert await storage.url(key) == f"/static/{key[:2]}/{key[2:4]}/{key}"
+        assert await storage.fetch(key) == b'data'
+        assert [t.name async for batch in storage.list_files('', f"{key[:-4]}.*") for t in batch] == [key]
+        await storage.move(key, f"_deleted/{key}")
+        assert not await storage.is_exist(key) and await storage.is_exist(f"_deleted/{key}")
+
+    @pytest.mark.asyncio
+    async def test_relocate(self, storage):
+        key = f"{uuid4()}.png"
+        (storage.static_dir / key).write_bytes(b'data')
+        # A file in the flat layout is still readable before it's moved
+        assert await storage.fetch(key) == b'data'
+        assert await storage.presign_url(key) == f"/static/{key}"
+        assert storage.relocate(key) and storage.relocate(key)
+        assert not (storage.static_dir / key).exists()
+        assert await storage.presign_url(key) == await storage.url(key)
+        assert not storage.relocate(f"{uuid4()}.png")
+
+    @pytest.mark.asyncio
+    async def test_stream(self, storage):
+        key = f"{uuid4()}.png"
+
+        async def chunks():
+            for i in range(10):
+                yield bytes([i]) * 100
+
+        await storage.upload_stream(chunks(), key)
+        assert await storage.size(key) == 1000
+        assert b''.join([t async for t in storage.stream(key)]) == await storage.fetch(key)
+        assert [len(t) async for t in storage.stream(key, chunk_size=300, offset=50, length=700)] == [300, 300, 100]
+        assert b''.join([t async for t in storage.stream(key, offset=950)]) == bytes([9]) * 50
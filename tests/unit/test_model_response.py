@@ -0,0 +1,33 @@
+import json
+from datetime import datetime
+from uuid import uuid4
+
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+
+from app.Models.api_response.search_api_response import SearchApiResponse
+from app.Models.mapped_image import MappedImage
+from app.Models.search_result import SearchResult
+from app.util.model_response import ModelResponse
+
+
+class TestModelResponse:
+    def setup_method(self):
+        self.resp = SearchApiResponse(
+            result=[SearchResult(img=MappedImage(id=uuid4(), index_date=datetime.now(), url=f"/images/{i}.png",
+                                                 width=1920, height=1080, aspect_ratio=16 / 9,
+                                                 categories=['cg', 'wallpaper'], tags=['long_hair', 'smile']),
+                                 score=0.5) for i in range(100)],
+            message="Successfully get 100 results.", query_id=uuid4(), next_cursor=None)
+
+    def test_render(self):
+        response = ModelResponse(self.resp, {'result': {'__all__': {'img': {'tags'}}}})
+        assert response.media_type == 'application/json'
+        assert response.headers['vary'] == 'accept'
+        assert json.loads(response.body) == self.resp.model_dump(mode='json',
+                                                                 exclude={'result': {'__all__': {'img': {'tags'}}}})
+
+    def test_same_as_fastapi(self):
+        # What FastAPI does with a returned model: dump, validate again, encode, then render with json.dumps
+        validated = SearchApiResponse.model_validate(self.resp.model_dump())
+        assert json.loads(ModelResponse(self.resp).body) == json.loads(JSONResponse(jsonable_encoder(validated)).body)
@@ -0,0 +1,32 @@
+import json
+from datetime import datetime
+from uuid import uuid4
+
+import pytest
+
+from app.Models.api_response.images_api_response import QueryImagesApiResponse
+from app.Models.mapped_image import MappedImage
+from app.util.ndjson_response import NDJSON_MEDIA_TYPE, ndjson_response
+
+
+class TestNdjsonResponse:
+    @pytest.mark.asyncio
+    async def test_lines(self):
+        images = [MappedImage(id=uuid4(), index_date=datetime.now(), url=f"/{i}.png", width=i)
+                  for i in range(5)]
+
+        async def _chunks():
+            yield images[:2]
+            yield []
+            yield images[2:]
+
+        resp = ndjson_response(_chunks(), lambda: QueryImagesApiResponse(message="done", images=[],
+                                                                          next_page_offset=None),
+                               item_exclude={'url'}, summary_exclude={'images'})
+        assert resp.media_type == NDJSON_MEDIA_TYPE
+        assert resp.headers['vary'] == 'accept'
+        body = ''.join([t async for t in resp.body_iterator])
+        lines = [json.loads(t) for t in body.splitlines()]
+        assert [t['id'] for t in lines[:-1]] == [str(t.id) for t in images]
+        assert all('url' not in t and t['width'] is not None for t in lines[:-1])
+        assert lines[-1] == {'message': 'done', 'next_page_offset': None}
@@ -0,0 +1,73 @@
+from uuid import uuid4
+
+import numpy as np
+
+from app.Services.neighbor_graph_service import NeighborGraphService
+from app.Services.neighbor_store import NeighborStore
+
+
+class TestNeighborStore:
+    def setup_method(self):
+        rng = np.random.default_rng(42)
+        self.ids = [str(uuid4()) for _ in range(300)]
+        vectors = rng.normal(size=(300, 32)).astype(np.float32)
+        self.vectors = dict(zip(self.ids, vectors / np.linalg.norm(vectors, axis=1, keepdims=True)))
+        self.k = 10
+
+    def exact(self, point_id, alive, top_k=None):
+        scores = [(other, float(self.vectors[point_id] @ self.vectors[other])) for other in alive if other != point_id]
+        return sorted(scores, key=lambda t: t[1], reverse=True)[:top_k or self.k]
+
+    def test_incremental_updates_stay_exact(self, tmp_path):
+        store = NeighborStore(self.k)
+        alive = self.ids[:200]
+        for point_id in alive:
+            store.set_neighbors(point_id, self.exact(point_id, alive))
+
+        # Insert new points the way the service does: their own lists, then offered to the lists of nearby points
+        for point_id in self.ids[200:]:
+            alive = alive + [point_id]
+            neighbors = self.exact(point_id, alive, NeighborGraphService.REVERSE_FANOUT * self.k)
+            store.set_neighbors(point_id, neighbors)
+            for neighbor_id, score in neighbors:
+                store.offer(neighbor_id, point_id, score)
+        for point_id in self.ids[::7]:
+            store.remove(point_id)
+        alive = [t for t in alive if t not in self.ids[::7]]
+        assert len(store) == len(alive)
+
+        store.save(tmp_path / 'graph.npz')
+        loaded = NeighborStore.load(tmp_path / 'graph.npz')
+        served = 0
+        for point_id in alive:
+            expected = self.exact(point_id, alive)
+            assert loaded.lookup(point_id, self.k) in (None, expected)
+            # The lists shortened by deletions still serve their exact leading entries
+            result = loaded.lookup(point_id, 3, skip=1)
+            if result is not None:
+                served += 1
+                assert [t[0] for t in result] == [t[0] for t in expected[1:4]]
+                assert np.allclose([t[1] for t in result], [t[1] for t in expected[1:4]], atol=1e-6)
+        assert served > len(alive) * 0.9
+        assert loaded.lookup(self.ids[0], 1) is None
+
+    def test_offer_ignores_known_candidate(self):
+        store = NeighborStore(3)
+        a, b, c = self.ids[:3]
+        store.set_neighbors(a, [(b, 0.9), (c, 0.5)])
+        assert not store.offer(a, b, 0.95)
+        assert store.offer(a, self.ids[3], 0.7)
+        assert [t[0] for t in store.lookup(a, 3)] == [b, self.ids[3], c]
+        store.remove(b)
+        assert [t[0] for t in store.lookup(a, 2)] == [self.ids[3], c]
+        assert store.lookup(a, 3) is None
+
+    def test_complete_list(self):
+        # A list shorter than K holds all the other points, any new point belongs to it
+        store = NeighborStore(3)
+        a, b, c = self.ids[:3]
+        store.set_neighbors(a, [(b, 0.9)])
+        assert [t[0] for t in store.lookup(a, 10)] == [b]
+        assert store.offer(a, c, 0.1)
+        store.remove(b)
+        assert [t[0] for t in store.lookup(a, 10)] == [c]
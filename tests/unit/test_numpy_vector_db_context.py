@@ -0,0 +1,219 @@
+import asyncio
+import random
+from datetime import datetime, timedelta
+from uuid import uuid4
+
+import numpy as np
+import pytest
+import pytest_asyncio
+
+from app.Models.api_models.search_api_model import SearchModelEnum
+from app.Models.mapped_image import MappedImage
+from app.Models.query_params import FilterParams
+from app.Models.scroll_cursor import ScrollCursor
+from app.Models.vector_query import VectorQuery
+from app.Services.numpy_vector_db_context import NumpyVectorDbContext
+from app.Services.vector_db_context import PointNotFoundError
+from app.config import config
+from app.util.random_key import random_key
+
+
+def normalize(vector):
+    return vector / np.linalg.norm(vector)
+
+
+class TestNumpyVectorDbContext:
+    def setup_method(self):
+        self.rng = np.random.default_rng(42)
+        self.images = [MappedImage(id=uuid4(), index_date=datetime.now(),
+                                   width=100 * (i % 10 + 1), height=500, aspect_ratio=(i % 10 + 1) / 5,
+                                   starred=i % 3 == 0, categories=['even' if i % 2 == 0 else 'odd'],
+                                   image_vector=self.rng.normal(size=768).astype(np.float32),
+                                   text_contain_vector=self.rng.normal(size=768).astype(np.float32)
+                                   if i % 4 else None)
+                       for i in range(2000)]
+        self.query = self.rng.normal(size=768).astype(np.float32)
+
+    @pytest_asyncio.fixture
+    async def context(self, tmp_path, monkeypatch):
+        monkeypatch.setattr(config.qdrant, 'local_path', str(tmp_path))
+        context = NumpyVectorDbContext()
+        await context.on_load()
+        await context.insert_items(self.images)
+        yield context
+        await context.on_exit()
+
+    def brute_force(self, query, images, vector_name='image_vector'):
+        scores = [(float(normalize(getattr(t, vector_name)) @ normalize(query)), t) for t in images
+                  if getattr(t, vector_name) is not None]
+        return sorted(scores, key=lambda t: t[0], reverse=True)
+
+    @pytest.mark.asyncio
+    async def test_query_search(self, context):
+        expected = self.brute_force(self.query, self.images)
+        results = await context.query_search(self.query, top_k=10, skip=5)
+        assert [t.img.id for t in results] == [t[1].id for t in expected[5:15]]
+        assert np.allclose([t.score for t in results], [t[0] for t in expected[5:15]], atol=1e-5)
+
+        filter_param = FilterParams(min_width=500, starred=True, categories='even')
+        results = await context.query_search(self.query, 'text_contain_vector', top_k=20, filter_param=filter_param)
+        expected = self.brute_force(self.query, [t for t in self.images if t.width >= 500 and t.starred
+                                                 and 'even' in t.categories], 'text_contain_vector')
+        assert [t.img.id for t in results] == [t[1].id for t in expected[:20]]
+
+    @pytest.mark.asyncio
+    async def test_query_batch(self, context):
+        queries = [VectorQuery(query_vector=self.query, query_vector_name='image_vector', top_k=5),
+                   VectorQuery(query_vector=-self.query, query_vector_name='image_vector', top_k=5, skip=3),
+                   VectorQuery(query_vector=self.query, query_vector_name='text_contain_vector', top_k=5)]
+        results = await context.query_batch(queries)
+        for query, result in zip(queries, results):
+            single = await context.query_search(query.query_vector, query.query_vector_name, query.top_k, query.skip)
+            assert [t.img.id for t in result] == [t.img.id for t in single]
+
+    @pytest.mark.asyncio
+    async def test_query_random(self, context):
+        filter_param = FilterParams(categories='even')
+        results = await context.query_random(42, top_k=60, filter_param=filter_param)
+        assert len({t.img.id for t in results}) == 60
+        assert all('even' in t.img.categories for t in results)
+        assert all(a.score > b.score for a, b in zip(results, results[1:]))
+        # The same seed draws the same sample, so that it can be paged
+        page = await context.query_random(42, top_k=50, skip=10, filter_param=filter_param)
+        assert [t.img.id for t in page] == [t.img.id for t in results[10:]]
+        assert [t.img.id for t in await context.query_random(43, top_k=60, filter_param=filter_param)] != \
+               [t.img.id for t in results]
+
+        # The sample is the run of the key order from the pivot of the seed, wrapping around
+        keys = sorted((random_key(t.id), t.id) for t in self.images if 'even' in t.categories)
+        start = next((i for i, t in enumerate(keys) if t[0] >= random.Random(42).random()), 0)
+        assert [t.img.id for t in results] == [t[1] for t in (keys[start:] + keys[:start])[:60]]
+
+        keys = np.array([random_key(t.id) for t in self.images])
+        # The keys are uniform, each tenth of the range holds about a tenth of the images
+        assert np.histogram(keys, bins=10, range=(0, 1))[0].min() > 150
+
+    @pytest.mark.asyncio
+    async def test_query_random_whole_collection(self, context):
+        # The run wraps around to the first key, but never returns an image twice
+        filter_param = FilterParams(min_width=1000, starred=True)
+        expected = {t.id for t in self.images if t.width >= 1000 and t.starred}
+        results = await context.query_random(7, top_k=100, filter_param=filter_param)
+        assert len(results) == len(expected) and {t.img.id for t in results} == expected
+        assert await context.query_random(7, top_k=10, filter_param=FilterParams(categories='none')) == []
+
+    @pytest.mark.asyncio
+    async def test_scroll_points_by_date(self, context):
+        # Many images share a date, the cursor should neither repeat nor miss them across pages
+        dated = [MappedImage(id=uuid4(), index_date=datetime(2024, 1, 1) + timedelta(hours=i // 7), width=i)
+                 for i in range(100)]
+        await context.delete_items([str(t.id) for t in self.images])
+        await context.insert_items(dated)
+        for descending in [True, False]:
+            scrolled, cursor = [], None
+            while True:
+                page, cursor = await context.scroll_points_by_date(ScrollCursor.decode(cursor.encode())
+                                                                   if cursor else None, count=3,
+                                                                   descending=descending,
+                                                                   filter_param=FilterParams(min_width=10))
+                scrolled += page
+                if cursor is None:
+                    break
+            expected = sorted((t for t in dated if t.width >= 10), key=lambda t: t.index_date, reverse=descending)
+            assert sorted(t.id for t in scrolled) == sorted(t.id for t in expected)
+            assert [t.index_date for t in scrolled] == [t.index_date for t in expected]
+
+    @pytest.mark.asyncio
+    async def test_query_similar(self, context):
+        target = self.images[0]
+        results = await context.query_similar(search_id=str(target.id), top_k=5)
+        expected = self.brute_force(target.image_vector, self.images[1:])
+        assert [t.img.id for t in results] == [t[1].id for t in expected[:5]]
+
+        positive, negative = self.images[1].image_vector, self.images[2].image_vector
+        results = await context.query_similar(positive_vectors=[positive], negative_vectors=[negative],
+                                              mode=SearchModelEnum.best, top_k=50)
+        for result in results:
+            vector = next(t for t in self.images if t.id == result.img.id).image_vector
+            best_positive = float(normalize(vector) @ normalize(positive))
+            best_negative = float(normalize(vector) @ normalize(negative))
+            expected = best_positive if best_positive > best_negative else -best_negative ** 2
+            assert np.isclose(result.score, expected, atol=1e-5)
+
+    @pytest.mark.asyncio
+    async def test_query_combined(self, context):
+        results = await context.query_combined(positive_vectors=[self.query], extra_vector=-self.query, top_k=10)
+        candidates = self.brute_force(self.query, self.images)[:30]
+        expected = []
+        for score, image in candidates:
+            if image.text_contain_vector is not None:
+                score *= 1 + float(normalize(image.text_contain_vector) @ normalize(-self.query))
+            expected.append((score, image))
+        expected.sort(key=lambda t: t[0], reverse=True)
+        assert [t.img.id for t in results] == [t[1].id for t in expected[:10]]
+
+        results = await context.query_combined(positive_vectors=[self.query], top_k=10)
+        assert [t.img.id for t in results] == [t[1].id for t in candidates[:10]]
+
+    @pytest.mark.asyncio
+    async def test_write_and_reload(self, context):
+        await context.delete_items([str(self.images[0].id)])
+        updated = self.images[1].model_copy(update={'starred': True, 'categories': ['updated']})
+        await context.update_payload(updated)
+        assert await context.get_counts(exact=True) == len(self.images) - 1
+        await context.on_exit()
+
+        reloaded = NumpyVectorDbContext()
+        with pytest.raises(PointNotFoundError):
+            await reloaded.retrieve_by_id(str(self.images[0].id))
+        image = await reloaded.retrieve_by_id(str(self.images[1].id), with_vectors=True)
+        assert image.categories == ['updated']
+        assert np.allclose(image.image_vector, normalize(self.images[1].image_vector), atol=1e-6)
+        assert image.text_contain_vector is not None
+
+        points, next_id = await reloaded.scroll_points(count=100, filter_param=FilterParams(categories='updated'))
+        assert [t.id for t in points] == [self.images[1].id] and next_id is None
+        points, next_id = await reloaded.scroll_points(count=1000)
+        assert next_id == str(self.images[1001].id)
+        points, next_id = await reloaded.scroll_points(next_id, count=1000)
+        assert len(points) == 999 and next_id is None
+        await reloaded.on_exit()
+
+    @pytest.mark.asyncio
+    async def test_reload_without_checkpoint(self, context):
+        # Without a clean exit, the writes after the last checkpoint are replayed from the payload log
+        await context.update_payloads([self.images[i].model_copy(update={'categories': ['updated']})
+                                       for i in range(3)])
+        await context.delete_items([str(self.images[0].id)])
+        assert context._store._log_path.read_text().count('\n') == len(self.images) + 4
+        context._store.flush()
+
+        reloaded = NumpyVectorDbContext()
+        assert reloaded._store._log_path.read_text() == ''
+        points, _ = await reloaded.scroll_points(count=100, filter_param=FilterParams(categories='updated'))
+        assert [t.id for t in points] == [self.images[1].id, self.images[2].id]
+        await reloaded.on_exit()
+
+        reloaded = NumpyVectorDbContext()
+        points, _ = await reloaded.scroll_points(count=100, filter_param=FilterParams(categories='updated'))
+        assert [t.id for t in points] == [self.images[1].id, self.images[2].id]
+        assert await reloaded.get_counts(exact=True) == len(self.images) - 1
+        await reloaded.on_exit()
+
+    @pytest.mark.asyncio
+    async def test_search_during_writes(self, context):
+        new_images = [MappedImage(id=uuid4(), index_date=datetime.now(), width=100, height=100, aspect_ratio=1,
+                                  image_vector=self.query, text_contain_vector=None) for _ in range(3000)]
+
+        async def write():
+            # Grows the matrices past their capacity while the searches run
+            for i in range(0, len(new_images), 500):
+                await context.insert_items(new_images[i:i + 500])
+                await context.delete_items([str(t.id) for t in self.images[i // 5:i // 5 + 100]])
+
+        results = await asyncio.gather(write(), *(context.query_search(self.query, top_k=5) for _ in range(20)))
+        for result in results[1:]:
+            assert len(result) == 5
+            assert all(t.img.index_date is not None for t in result)
+        results = await context.query_search(self.query, top_k=5)
+        assert {t.img.id for t in results} <= {t.id for t in new_images}
@@ -0,0 +1,125 @@
+import asyncio
+from datetime import datetime
+from uuid import uuid4
+
+import pytest
+
+from app.Models.errors import CursorMismatchError
+from app.Models.mapped_image import MappedImage
+from app.Models.query_params import SearchPagingParams
+from app.Models.search_cursor import SearchCursor
+from app.Models.search_result import SearchResult
+from app.Services.search_cursor_service import SearchCursorService
+
+
+class TestSearchCursor:
+    def setup_method(self):
+        self.results = [SearchResult(img=MappedImage(id=uuid4(), index_date=datetime.now()), score=1 - i / 100)
+                        for i in range(100)]
+        self.calls = []
+
+    async def query(self, top_k, skip):
+        self.calls.append((top_k, skip))
+        return self.results[skip:skip + top_k]
+
+    def test_encode_decode(self):
+        cursor = SearchCursor.after('fp', 10, self.results[9])
+        assert SearchCursor.decode(cursor.encode()) == cursor
+        with pytest.raises(ValueError):
+            SearchCursor.decode('not-a-cursor')
+
+    @pytest.mark.asyncio
+    async def test_walk_pages(self):
+        service = SearchCursorService()
+        cursor = None
+        walked = []
+        while True:
+            page, cursor = await service.fetch_page('fp', SearchPagingParams(count=10, cursor=cursor), self.query)
+            walked.extend(page)
+            if cursor is None:
+                break
+        assert [t.img.id for t in walked] == [t.img.id for t in self.results]
+        # The window grows geometrically instead of running one offset query per page
+        assert self.calls == [(11, 0), (11, 11), (22, 22), (44, 44), (88, 88)]
+
+    @pytest.mark.asyncio
+    async def test_fallback_without_window(self):
+        _, cursor = await SearchCursorService().fetch_page('fp', SearchPagingParams(count=10), self.query)
+        # Inserting a better result shifts the ranking, the bound should drop the duplicated item
+        self.results.insert(0, SearchResult(img=MappedImage(id=uuid4(), index_date=datetime.now()), score=2))
+        page, cursor = await SearchCursorService().fetch_page('fp', SearchPagingParams(count=10, cursor=cursor),
+                                                              self.query)
+        # The page is refilled to its full size after dropping the duplicated item
+        assert [t.img.id for t in page] == [t.img.id for t in self.results[11:21]]
+        assert self.calls[-2:] == [(11, 10), (2, 20)]
+        assert SearchCursor.decode(cursor).position == 21
+
+    @pytest.mark.asyncio
+    async def test_last_full_page(self):
+        # A last page which exactly uses up the results has no next cursor, with or without the window
+        self.results = self.results[:20]
+        service = SearchCursorService()
+        _, cursor = await service.fetch_page('fp', SearchPagingParams(count=10), self.query)
+        page, cursor = await service.fetch_page('fp', SearchPagingParams(count=10, cursor=cursor), self.query)
+        assert [t.img.id for t in page] == [t.img.id for t in self.results[10:]]
+        assert cursor is None
+        page, cursor = await SearchCursorService().fetch_page('fp', SearchPagingParams(count=10, skip=10), self.query)
+        assert len(page) == 10 and cursor is None
+        # The window can't look past its size, the pages after it are served by offset queries
+        service = SearchCursorService(max_window=20)
+        _, cursor = await service.fetch_page('fp', SearchPagingParams(count=10), self.query)
+        _, cursor = await service.fetch_page('fp', SearchPagingParams(count=10, cursor=cursor), self.query)
+        assert cursor is not None
+        page, cursor = await service.fetch_page('fp', SearchPagingParams(count=10, cursor=cursor), self.query)
+        assert page == [] and cursor is None
+
+    @pytest.mark.asyncio
+    async def test_fallback_ties(self):
+        self.results = sorted([SearchResult(img=MappedImage(id=uuid4(), index_date=datetime.now()), score=1)
+                               for _ in range(30)], key=SearchCursor.rank_key)
+        cursor = None
+        walked = []
+        while True:
+            # A new service for every page, which has no window and falls back to offset queries
+            page, cursor = await SearchCursorService().fetch_page('fp', SearchPagingParams(count=7, cursor=cursor),
+                                                                  self.query)
+            walked.extend(page)
+            if cursor is None:
+                break
+        assert [t.img.id for t in walked] == [t.img.id for t in self.results]
+
+    @pytest.mark.asyncio
+    async def test_concurrent_growth(self):
+        service = SearchCursorService()
+        _, cursor = await service.fetch_page('fp', SearchPagingParams(count=10), self.query)
+
+        async def slow_query(top_k, skip):
+            await asyncio.sleep(0.01)
+            return await self.query(top_k, skip)
+
+        pages = await asyncio.gather(*(service.fetch_page('fp', SearchPagingParams(count=10, cursor=cursor),
+                                                          slow_query) for _ in range(3)))
+        assert all([t.img.id for t in page] == [t.img.id for t in self.results[10:20]] for page, _ in pages)
+        page, _ = await service.fetch_page('fp', SearchPagingParams(count=10, skip=20), self.query)
+        assert [t.img.id for t in page] == [t.img.id for t in self.results[20:30]]
+        assert self.calls == [(11, 0), (11, 11), (22, 22)]
+
+    @pytest.mark.asyncio
+    async def test_cursor_mismatch(self):
+        service = SearchCursorService()
+        _, cursor = await service.fetch_page('fp', SearchPagingParams(count=10), self.query)
+        with pytest.raises(CursorMismatchError):
+            await service.fetch_page('another', SearchPagingParams(count=10, cursor=cursor), self.query)
+
+    @pytest.mark.asyncio
+    async def test_writes_bump_generation(self):
+        service = SearchCursorService()
+        await service.fetch_page('fp', SearchPagingParams(count=10), self.query)
+        generation = service.generation
+        service.on_delete([str(self.results[0].img.id)])
+        assert service.generation != generation
+        assert SearchCursorService().generation != service.generation
+        # The window was dropped, the next page falls back to an offset query
+        self.calls.clear()
+        await service.fetch_page('fp', SearchPagingParams(count=10, skip=10), self.query)
+        assert self.calls == [(11, 10)]
@@ -0,0 +1,34 @@
+from io import BytesIO
+
+from PIL import Image
+
+from app.Services.sprite_sheet_service import pack_sprite, SPRITE_MAX_WIDTH
+
+
+def encode(size: tuple[int, int], color: tuple[int, int, int]) -> bytes:
+    out = BytesIO()
+    Image.new('RGB', size, color).save(out, 'PNG')
+    return out.getvalue()
+
+
+class TestPackSprite:
+    def test_pack(self):
+        colors = [(255, 0, 0), (0, 255, 0), (0, 0, 255)]
+        # 40 tiles of 128 to 256px wide at 128px high, which wrap over several rows
+        tiles = [(f"tile{i}", encode((100 + 50 * (i % 3), 100), colors[i % 3])) for i in range(40)]
+        data, width, height, positions = pack_sprite(tiles, 128)
+
+        assert list(positions) == [t[0] for t in tiles]
+        assert width <= SPRITE_MAX_WIDTH and height == 128 * len({t.y for t in positions.values()}) > 128
+        with Image.open(BytesIO(data)) as sheet:
+            assert sheet.size == (width, height)
+            sheet = sheet.convert('RGB')
+            for i, (key, tile) in enumerate(positions.items()):
+                assert tile.height == 128 and tile.width == round((100 + 50 * (i % 3)) * 1.28)
+                assert tile.x + tile.width <= width
+                center = sheet.getpixel((tile.x + tile.width // 2, tile.y + tile.height // 2))
+                assert all(abs(a - b) < 16 for a, b in zip(center, colors[i % 3]))
+
+    def test_empty(self):
+        data, width, height, positions = pack_sprite([], 64)
+        assert (width, height, positions) == (0, 0, {})
@@ -0,0 +1,22 @@
+from datetime import datetime
+from uuid import uuid4
+
+from app.Models.mapped_image import MappedImage
+from app.util.storage_keys import stored_image_key, stored_thumbnail_key
+
+
+class TestStorageKeys:
+    def test_payload_round_trip(self):
+        image = MappedImage(id=uuid4(), url='/static/a.png', index_date=datetime.now(), format='png', local=True,
+                            local_thumbnail=True, storage_key='ab/a.png', thumbnail_storage_key='thumbnails/ab/a.webp')
+        assert image.payload['storage_key'] == 'ab/a.png'
+        assert 'storage_key' not in image.model_dump() and 'thumbnail_storage_key' not in image.model_dump()
+        restored = MappedImage.from_payload(str(image.id), image.payload)
+        assert stored_image_key(restored) == 'ab/a.png'
+        assert stored_thumbnail_key(restored) == 'thumbnails/ab/a.webp'
+
+    def test_legacy_point(self):
+        image = MappedImage(id=uuid4(), url='/static/a.png', index_date=datetime.now(), format='png', local=True,
+                            local_thumbnail=True)
+        assert stored_image_key(image) == f"{image.id}.png"
+        assert stored_thumbnail_key(image) == f"thumbnails/{image.id}.webp"
@@ -0,0 +1,48 @@
+import asyncio
+from unittest.mock import patch
+
+import pytest
+
+from app.util.gather_bounded import gather_bounded
+from app.util.ttl_cache import TTLCache
+
+
+class TestTTLCache:
+    def test_expire(self):
+        cache = TTLCache(10, ttl=60)
+        with patch('app.util.ttl_cache.monotonic', return_value=1000):
+            cache.put('a', 1)
+            cache.put('b', 2, ttl=10)
+        with patch('app.util.ttl_cache.monotonic', return_value=1030):
+            assert cache.get('a') == 1
+            assert cache.get('b') is None
+        with patch('app.util.ttl_cache.monotonic', return_value=1060):
+            assert cache.get('a') is None
+        assert len(cache) == 0
+
+    def test_lru_eviction(self):
+        cache = TTLCache(2, ttl=60)
+        cache.put('a', 1)
+        cache.put('b', 2)
+        assert cache.get('a') == 1
+        cache.put('c', 3)
+        assert cache.get('b') is None
+        assert cache.get('a') == 1 and cache.get('c') == 3
+
+
+class TestGatherBounded:
+    @pytest.mark.asyncio
+    async def test_gather_bounded(self):
+        running = 0
+        max_running = 0
+
+        async def task(i):
+            nonlocal running, max_running
+            running += 1
+            max_running = max(max_running, running)
+            await asyncio.sleep(0.01)
+            running -= 1
+            return i
+
+        assert await gather_bounded((task(i) for i in range(20)), 4) == list(range(20))
+        assert max_running == 4
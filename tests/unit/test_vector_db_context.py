@@ -0,0 +1,117 @@
+from datetime import datetime
+from uuid import uuid4
+
+import numpy as np
+import pytest
+import pytest_asyncio
+
+from app.Models.mapped_image import MappedImage
+from app.Models.query_params import FilterParams
+from app.Services.numpy_vector_db_context import NumpyVectorDbContext
+from app.Services.vector_db_context import VectorDbContext
+from app.config import config, QdrantMode
+
+
+def normalize(vector):
+    return vector / np.linalg.norm(vector)
+
+
+class TestVectorDbContextCombined:
+    def setup_method(self):
+        self.rng = np.random.default_rng(7)
+        self.images = [MappedImage(id=uuid4(), index_date=datetime.now(),
+                                   image_vector=self.rng.normal(size=768).astype(np.float32),
+                                   text_contain_vector=self.rng.normal(size=768).astype(np.float32)
+                                   if i % 3 else None)
+                       for i in range(100)]
+        self.query = self.rng.normal(size=768).astype(np.float32)
+        self.extra = self.rng.normal(size=768).astype(np.float32)
+
+    @pytest_asyncio.fixture
+    async def context(self, monkeypatch):
+        monkeypatch.setattr(config.qdrant, 'mode', QdrantMode.MEMORY)
+        context = VectorDbContext()
+        await context.on_load()
+        await context.insert_items(self.images)
+        yield context
+        await context.on_exit()
+
+    def base_scores(self):
+        scores = [(float(normalize(t.image_vector) @ normalize(self.query)), t) for t in self.images]
+        return sorted(scores, key=lambda t: t[0], reverse=True)
+
+    @pytest.mark.asyncio
+    async def test_query_combined(self, context):
+        results = await context.query_combined(positive_vectors=[self.query], extra_vector=self.extra, top_k=10,
+                                               skip=2)
+        expected = []
+        for score, image in self.base_scores()[:30]:
+            # Images without the other vector keep their original score
+            if image.text_contain_vector is not None:
+                score *= 1 + float(normalize(image.text_contain_vector) @ normalize(self.extra))
+            expected.append((score, image))
+        expected.sort(key=lambda t: t[0], reverse=True)
+        assert [t.img.id for t in results] == [t[1].id for t in expected[2:12]]
+        assert np.allclose([t.score for t in results], [t[0] for t in expected[2:12]], atol=1e-5)
+
+    @pytest.mark.asyncio
+    async def test_query_combined_without_extra_vector(self, context):
+        results = await context.query_combined(positive_vectors=[self.query], top_k=10)
+        expected = self.base_scores()[:10]
+        assert [t.img.id for t in results] == [t[1].id for t in expected]
+        assert np.allclose([t.score for t in results], [t[0] for t in expected], atol=1e-5)
+
+
+class TestVectorDbContextRandom:
+    def setup_method(self):
+        self.images = [MappedImage(id=uuid4(), index_date=datetime.now(), width=100 * (i % 5 + 1), height=100,
+                                   aspect_ratio=i % 5 + 1) for i in range(300)]
+
+    @pytest_asyncio.fixture
+    async def context(self, monkeypatch):
+        monkeypatch.setattr(config.qdrant, 'mode', QdrantMode.MEMORY)
+        context = VectorDbContext()
+        await context.on_load()
+        await context.insert_items(self.images)
+        yield context
+        await context.on_exit()
+
+    @pytest_asyncio.fixture
+    async def numpy_context(self, tmp_path, monkeypatch):
+        monkeypatch.setattr(config.qdrant, 'local_path', str(tmp_path))
+        context = NumpyVectorDbContext()
+        await context.on_load()
+        await context.insert_items(self.images)
+        yield context
+        await context.on_exit()
+
+    @pytest.mark.asyncio
+    async def test_query_random(self, context, numpy_context):
+        filter_param = FilterParams(min_width=300)
+        results = await context.query_random(5, top_k=40, filter_param=filter_param)
+        assert len({t.img.id for t in results}) == 40
+        assert all(t.img.width >= 300 for t in results)
+        page = await context.query_random(5, top_k=30, skip=10, filter_param=filter_param)
+        assert [t.img.id for t in page] == [t.img.id for t in results[10:]]
+        # Both engines draw the same sample from the same seed
+        for seed, top_k in [(5, 40), (6, 150), (7, 200)]:
+            expected = await numpy_context.query_random(seed, top_k=top_k, filter_param=filter_param)
+            actual = await context.query_random(seed, top_k=top_k, filter_param=filter_param)
+            assert [t.img.id for t in actual] == [t.img.id for t in expected]
+            assert [t.score for t in actual] == [t.score for t in expected]
+        assert await context.query_random(5, filter_param=FilterParams(min_width=1000)) == []
+
+    @pytest.mark.asyncio
+    async def test_random_sampling_ready(self, context, monkeypatch):
+        assert await context.random_sampling_ready()
+
+        # A collection not migrated yet lacks the random keys
+        await context._client.delete_payload(collection_name=context.collection_name, keys=['random_key'],
+                                             points=[str(self.images[0].id)])
+        context._random_key_ready, context._random_key_checked_at = False, None
+        assert not await context.random_sampling_ready()
+        await context.update_payload(self.images[0])
+        # Checked again only after the interval
+        assert not await context.random_sampling_ready()
+        monkeypatch.setattr(VectorDbContext, 'RANDOM_KEY_CHECK_INTERVAL', 0)
+        assert await context.random_sampling_ready()
@@ -0,0 +1,105 @@
+from datetime import datetime
+from uuid import uuid4
+
+import numpy as np
+
+from app.Models.mapped_image import MappedImage
+from app.Models.search_result import SearchResult
+from app.util.calculate_vectors_cosine import calculate_vectors_cosine
+from app.util.vector_rescoring import CandidateMatrix, RescoreMode, RescoreSignal, rescore, average_vector_query, \
+    best_score, combine_scores, normalize_rows, weighted_vector_query
+
+
+class TestVectorRescoring:
+    def setup_method(self):
+        self.rng = np.random.default_rng(42)
+        self.vectors = self.rng.normal(size=(1000, 768)).astype(np.float32)
+        self.query = self.rng.normal(size=768).astype(np.float32)
+        self.results = [SearchResult(img=MappedImage(id=uuid4(), index_date=datetime.now(), image_vector=t,
+                                                     text_contain_vector=-t if i % 4 else None),
+                                     score=float(self.rng.uniform(0, 1)))
+                        for i, t in enumerate(self.vectors)]
+
+    def cosine(self, queries):
+        return normalize_rows(self.vectors) @ normalize_rows(queries).T
+
+    def copy_results(self):
+        return [SearchResult(img=t.img, score=t.score) for t in self.results]
+
+    def test_cosine(self):
+        matrix = CandidateMatrix([t.img.text_contain_vector for t in self.results])
+        scores = matrix.cosine(self.query)
+        for itm, score in zip(self.results[:20], scores[:20]):
+            expected = 0 if itm.img.text_contain_vector is None \
+                else calculate_vectors_cosine(itm.img.text_contain_vector, self.query)
+            assert np.isclose(score, expected, atol=1e-5)
+        assert np.allclose(CandidateMatrix(self.vectors).cosine_many(np.stack([self.query, -self.query])),
+                           self.cosine(np.stack([self.query, -self.query])), atol=1e-5)
+        assert len(CandidateMatrix([])) == 0
+
+    def test_rescore_matches_loop(self):
+        expected = self.copy_results()
+        for itm in expected:
+            if itm.img.text_contain_vector is not None:
+                itm.score = float((1 + calculate_vectors_cosine(itm.img.text_contain_vector, self.query)) * itm.score)
+        expected.sort(key=lambda i: i.score, reverse=True)
+        actual = rescore(self.copy_results(), [RescoreSignal('text_contain_vector', self.query)])
+        assert [t.img.id for t in actual] == [t.img.id for t in expected]
+        assert np.allclose([t.score for t in actual], [t.score for t in expected], atol=1e-5)
+
+    def test_weighted_additive(self):
+        results = rescore(self.copy_results(), [RescoreSignal('image_vector', self.query, 0.5),
+                                                RescoreSignal('text_contain_vector', self.query, 0.25)],
+                          RescoreMode.ADDITIVE)
+        first = next(t for t in self.results if t.img.id == results[0].img.id)
+        expected = first.score + 0.5 * calculate_vectors_cosine(first.img.image_vector, self.query)
+        if first.img.text_contain_vector is not None:
+            expected += 0.25 * calculate_vectors_cosine(first.img.text_contain_vector, self.query)
+        assert np.isclose(results[0].score, expected, atol=1e-5)
+        assert [t.score for t in results] == sorted((t.score for t in results), reverse=True)
+
+    def test_normalize_rows(self):
+        matrix = np.stack([self.vectors[0], np.zeros(768, dtype=np.float32)])
+        normalized = normalize_rows(matrix)
+        assert np.isclose(np.linalg.norm(normalized[0]), 1, atol=1e-6)
+        assert not np.any(normalized[1])
+        assert np.allclose(normalize_rows(self.query), self.query / np.linalg.norm(self.query))
+
+    def test_combine_scores(self):
+        base = self.rng.uniform(0, 1, size=1000).astype(np.float32)
+        signals = [self.cosine(self.query), self.cosine(-self.query)]
+        expected = [float(b * (1 + 0.5 * calculate_vectors_cosine(t, self.query)) *
+                          (1 + 0.25 * calculate_vectors_cosine(t, -self.query)))
+                    for b, t in zip(base[:20], self.vectors[:20])]
+        assert np.allclose(combine_scores(base, signals, [0.5, 0.25])[:20], expected, atol=1e-5)
+
+        expected = [float(b + 0.5 * calculate_vectors_cosine(t, self.query)) for b, t in
+                    zip(base[:20], self.vectors[:20])]
+        assert np.allclose(combine_scores(base, signals[:1], [0.5], RescoreMode.ADDITIVE)[:20], expected, atol=1e-5)
+        assert combine_scores(base, [], []) is base
+
+    def test_recommend_strategies(self):
+        positive = self.vectors[:2]
+        negative = np.stack([self.query])
+
+        scores = self.cosine(average_vector_query(positive, negative))
+        average = np.mean([t / np.linalg.norm(t) for t in positive], axis=0)
+        query = 2 * average - negative[0] / np.linalg.norm(negative[0])
+        expected = [calculate_vectors_cosine(t, query) for t in self.vectors[:20]]
+        assert np.allclose(scores[:20], expected, atol=1e-5)
+
+        scores = best_score(self.cosine(np.concatenate([positive, negative])), len(positive))
+        for vector, score in zip(self.vectors[:20], scores[:20]):
+            best_positive = max(calculate_vectors_cosine(vector, t) for t in positive)
+            best_negative = calculate_vectors_cosine(vector, negative[0])
+            expected = best_positive if best_positive > best_negative else -best_negative ** 2
+            assert np.isclose(score, expected, atol=1e-5)
+        assert np.allclose(best_score(self.cosine(positive), len(positive)), self.cosine(positive).max(axis=1))
+
+    def test_weighted_vector_query(self):
+        vectors = self.vectors[:2]
+        query = weighted_vector_query(vectors, [2, -0.5])
+        expected = 2 * vectors[0] / np.linalg.norm(vectors[0]) - 0.5 * vectors[1] / np.linalg.norm(vectors[1])
+        assert np.allclose(query, expected, atol=1e-6)
+        assert np.allclose(weighted_vector_query(vectors[:1], [3]), vectors[0] / np.linalg.norm(vectors[0]) * 3)
+        assert not np.any(weighted_vector_query(np.stack([vectors[0], vectors[0]]), [1, -1]))